@@ -0,0 +1,263 @@
+# asset_jobs.py — Background jobs for long-running Strategy Tools assets (pitch deck, video)
+#
+# The GUI submits a job row and returns immediately; a detached worker process
+# claims queued jobs, runs the prompt via prompt_registry and reports progress
+# back to the table. Jobs survive Streamlit reruns and browser refreshes, and a
+# job whose worker died is retried: put back in the queue and run again from
+# the start, up to MAX_ATTEMPTS runs (polling the job from the GUI respawns the
+# worker if needed). Cancelling stops a running job at its next progress
+# report, or terminates the script of a prompt run as a subprocess.
+#
+#   python3 asset_jobs.py worker      # drain the queue (spawned automatically)
+#   python3 asset_jobs.py list        # recent jobs
+
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+from prompt_registry import PromptCancelled, run_prompt
+
+JOBS_PATH = os.environ.get("KALPANA_ASSET_JOBS", "voter_data/asset_jobs.db")
+WORKER_PID_FILE = os.path.join(os.path.dirname(JOBS_PATH) or ".", "asset_worker.pid")
+MAX_ATTEMPTS = 3
+WORKER_IDLE_EXIT = 60
+POLL_INTERVAL = 1.0
+
+class JobCancelled(PromptCancelled):
+    pass
+
+_schema_ready = False
+
+def _connect():
+    global _schema_ready
+    os.makedirs(os.path.dirname(JOBS_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(JOBS_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    if not _schema_ready:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS asset_jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                prompt_id INTEGER NOT NULL,
+                constituency TEXT,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress_done INTEGER NOT NULL DEFAULT 0,
+                progress_total INTEGER,
+                message TEXT,
+                result TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker_pid INTEGER,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                updated_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_asset_jobs_status ON asset_jobs(status, created_at);
+            CREATE INDEX IF NOT EXISTS idx_asset_jobs_lookup ON asset_jobs(prompt_id, constituency, created_at);
+        """)
+        _schema_ready = True
+    return conn
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        # A worker this process spawned lingers as a zombie after exiting; reap it
+        if os.waitpid(pid, os.WNOHANG)[0] == pid:
+            return False
+    except ChildProcessError:
+        pass
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+def _row_to_job(cursor, row):
+    job = dict(zip([c[0] for c in cursor.description], row))
+    job["params"] = json.loads(job["params"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+# === Submitting & polling (GUI side) ===
+def submit(prompt_id, params):
+    """
+    Queues prompt_id with params and makes sure a worker is running.
+    Returns the job id.
+    """
+    conn = _connect()
+    try:
+        cur = conn.execute("""
+            INSERT INTO asset_jobs (prompt_id, constituency, params, status, created_at, updated_at)
+            VALUES (?, ?, ?, 'queued', ?, ?)
+        """, (prompt_id, params.get("constituency_name"), json.dumps(params), time.time(), time.time()))
+        job_id = cur.lastrowid
+    finally:
+        conn.close()
+    ensure_worker()
+    return job_id
+
+def get_job(job_id):
+    conn = _connect()
+    try:
+        cur = conn.execute("SELECT * FROM asset_jobs WHERE job_id = ?", (job_id,))
+        row = cur.fetchone()
+        return _row_to_job(cur, row) if row else None
+    finally:
+        conn.close()
+
+def list_jobs(prompt_id=None, constituency=None, limit=10):
+    conn = _connect()
+    try:
+        cur = conn.execute("""
+            SELECT * FROM asset_jobs
+            WHERE (? IS NULL OR prompt_id = ?) AND (? IS NULL OR LOWER(constituency) = LOWER(?))
+            ORDER BY created_at DESC LIMIT ?
+        """, (prompt_id, prompt_id, constituency, constituency, limit))
+        return [_row_to_job(cur, row) for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+def watch_jobs(prompt_id=None, constituency=None, limit=10):
+    """
+    list_jobs for pollers: while any listed job is still queued or running,
+    makes sure a worker is alive to run it or to requeue it after a crash.
+    """
+    jobs = list_jobs(prompt_id, constituency, limit)
+    if any(job["status"] in ("queued", "running") for job in jobs):
+        ensure_worker()
+    return jobs
+
+def cancel(job_id):
+    conn = _connect()
+    try:
+        cur = conn.execute("""
+            UPDATE asset_jobs SET status = 'cancelled', finished_at = ?, updated_at = ?
+            WHERE job_id = ? AND status IN ('queued', 'running')
+        """, (time.time(), time.time(), job_id))
+        return cur.rowcount > 0
+    finally:
+        conn.close()
+
+def ensure_worker():
+    # One detached worker drains the queue; it exits on its own once idle
+    try:
+        with open(WORKER_PID_FILE) as f:
+            if _pid_alive(int(f.read().strip())):
+                return
+    except (OSError, ValueError):
+        pass
+    proc = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "worker"],
+        cwd=os.getcwd(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        stdin=subprocess.DEVNULL, start_new_session=True
+    )
+    with open(WORKER_PID_FILE, "w") as f:
+        f.write(str(proc.pid))
+
+# === Worker side ===
+def _claim_next(conn):
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Requeue jobs whose worker crashed mid-run
+        for job_id, pid, attempts in conn.execute(
+            "SELECT job_id, worker_pid, attempts FROM asset_jobs WHERE status = 'running'"
+        ).fetchall():
+            if pid != os.getpid() and not _pid_alive(pid):
+                if attempts >= MAX_ATTEMPTS:
+                    conn.execute("""
+                        UPDATE asset_jobs SET status = 'failed', message = ?, finished_at = ?, updated_at = ?
+                        WHERE job_id = ?
+                    """, (f"❌ Worker died {attempts} times; giving up.", now, now, job_id))
+                else:
+                    conn.execute("""
+                        UPDATE asset_jobs SET status = 'queued', worker_pid = NULL, progress_done = 0,
+                            message = '🔁 Worker crashed; retrying from the start', updated_at = ?
+                        WHERE job_id = ?
+                    """, (now, job_id))
+
+        cur = conn.execute("SELECT * FROM asset_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1")
+        row = cur.fetchone()
+        if not row:
+            conn.execute("COMMIT")
+            return None
+        job = _row_to_job(cur, row)
+        conn.execute("""
+            UPDATE asset_jobs SET status = 'running', worker_pid = ?, attempts = attempts + 1,
+                started_at = ?, updated_at = ?
+            WHERE job_id = ?
+        """, (os.getpid(), now, now, job["job_id"]))
+        conn.execute("COMMIT")
+        return job
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+def _progress_reporter(conn, job_id):
+    def report(done, total, message=None):
+        cur = conn.execute("""
+            UPDATE asset_jobs SET progress_done = ?, progress_total = ?, message = COALESCE(?, message), updated_at = ?
+            WHERE job_id = ? AND status = 'running'
+        """, (done, total, message, time.time(), job_id))
+        if cur.rowcount == 0:
+            raise JobCancelled(f"Asset job {job_id} was cancelled")
+    return report
+
+def _is_cancelled(conn, job_id):
+    row = conn.execute("SELECT status FROM asset_jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return not row or row[0] == "cancelled"
+
+def run_job(conn, job):
+    params = dict(job["params"])
+    params["progress"] = _progress_reporter(conn, job["job_id"])
+    params["cancelled"] = lambda: _is_cancelled(conn, job["job_id"])
+    try:
+        result = run_prompt(job["prompt_id"], params)
+    except PromptCancelled:
+        return
+
+    # The status guard below also keeps a cancellation that arrived after the last progress report
+    status = "done" if result.get("ok") else "failed"
+    stored = {k: v for k, v in result.items() if k in ("message", "files", "text", "log")}
+    now = time.time()
+    conn.execute("""
+        UPDATE asset_jobs SET status = ?, message = ?, result = ?, finished_at = ?, updated_at = ?
+        WHERE job_id = ? AND status = 'running'
+    """, (status, result.get("message", "").strip(), json.dumps(stored), now, now, job["job_id"]))
+
+def worker_loop():
+    conn = _connect()
+    idle_since = time.time()
+    try:
+        while True:
+            job = _claim_next(conn)
+            if job:
+                run_job(conn, job)
+                idle_since = time.time()
+                continue
+            if time.time() - idle_since > WORKER_IDLE_EXIT:
+                return
+            time.sleep(POLL_INTERVAL)
+    finally:
+        conn.close()
+
+# === MAIN ===
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "worker":
+        worker_loop()
+    elif command == "list":
+        for job in list_jobs(limit=20):
+            total = job["progress_total"] or "?"
+            print(f"#{job['job_id']} prompt_{job['prompt_id']} {job['constituency']} [{job['status']}] "
+                  f"{job['progress_done']}/{total} {job['message'] or ''}")
+    else:
+        print("❌ Usage: python3 asset_jobs.py [worker|list]")
+        exit(1)
@@ -0,0 +1,110 @@
+# booth_influencers.py — Top booths by influencer reach, with each booth's top influencers
+#
+# One windowed query replaces the per-booth follow-up queries: booths are ranked
+# by total followers, and ROW_NUMBER() picks the top influencers inside each of
+# the top-K booths only. With booth_influencer_rollup installed (rollups.py) the
+# booth ranking is an index seek on the rollup and only the K chosen booths
+# touch voter rows; otherwise group admins are aggregated on the fly (served by
+# idx_voters_influencers, see migrate.py).
+#
+#   python3 booth_influencers.py Mandya [K] [M]
+
+import json
+import sys
+
+from common import query
+
+DEFAULT_BOOTHS = 10
+DEFAULT_INFLUENCERS = 10
+
+ROLLUP_TOP_BOOTH_INFLUENCERS_SQL = """
+WITH booths AS MATERIALIZED (
+    SELECT booth_location, influencer_count, total_followers, booth_key
+    FROM booth_influencer_rollup
+    WHERE constituency_key = LOWER(?)
+    ORDER BY total_followers DESC, booth_key
+    LIMIT ?
+),
+ranked AS (
+    SELECT v.voter_id, v.name, v.followers_estimated, v.political_inclination, v.booth_location,
+           ROW_NUMBER() OVER (
+               PARTITION BY v.booth_location ORDER BY v.followers_estimated DESC, v.voter_id
+           ) AS rn
+    FROM booths b
+    CROSS JOIN voter_enriched_demo v
+        ON LOWER(v.constituency) = LOWER(?)
+       AND v.is_group_admin = 1
+       AND v.booth_location IS b.booth_location
+)
+SELECT b.booth_location, b.influencer_count, b.total_followers,
+       r.voter_id, r.name, r.followers_estimated, r.political_inclination
+FROM booths b
+LEFT JOIN ranked r ON r.booth_location IS b.booth_location AND r.rn <= ?
+ORDER BY b.total_followers DESC, b.booth_key, r.rn
+"""
+
+TOP_BOOTH_INFLUENCERS_SQL = """
+WITH admins AS MATERIALIZED (
+    SELECT voter_id, name, followers_estimated, political_inclination, booth_location
+    FROM voter_enriched_demo
+    WHERE LOWER(constituency) = LOWER(?)
+      AND is_group_admin = 1
+),
+booths AS (
+    SELECT booth_location, COUNT(*) AS influencer_count, SUM(followers_estimated) AS total_followers
+    FROM admins
+    GROUP BY booth_location
+    ORDER BY total_followers DESC, booth_location
+    LIMIT ?
+),
+ranked AS (
+    SELECT a.*, ROW_NUMBER() OVER (
+        PARTITION BY a.booth_location ORDER BY a.followers_estimated DESC, a.voter_id
+    ) AS rn
+    FROM admins a
+    JOIN booths b ON a.booth_location IS b.booth_location
+)
+SELECT b.booth_location, b.influencer_count, b.total_followers,
+       r.voter_id, r.name, r.followers_estimated, r.political_inclination
+FROM booths b
+LEFT JOIN ranked r ON r.booth_location IS b.booth_location AND r.rn <= ?
+ORDER BY b.total_followers DESC, b.booth_location, r.rn
+"""
+
+def _has_rollup():
+    return query("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'booth_influencer_rollup'", one=True) is not None
+
+def top_booth_influencers(constituency, k=DEFAULT_BOOTHS, m=DEFAULT_INFLUENCERS):
+    """
+    Returns the top-k booths of a constituency by total group-admin followers,
+    each with its top-m influencers:
+        [{"booth", "influencer_count", "total_followers",
+          "influencers": [{"voter_id", "name", "followers", "inclination"}, ...]}, ...]
+    """
+    key = constituency.lower()
+    if _has_rollup():
+        rows = query(ROLLUP_TOP_BOOTH_INFLUENCERS_SQL, (key, int(k), key, int(m)))
+    else:
+        rows = query(TOP_BOOTH_INFLUENCERS_SQL, (key, int(k), int(m)))
+
+    booths = []
+    for booth, count, total, voter_id, name, followers, inclination in rows:
+        if not booths or booths[-1]["booth"] != booth:
+            booths.append({"booth": booth, "influencer_count": count, "total_followers": total, "influencers": []})
+        if voter_id is not None:
+            booths[-1]["influencers"].append({
+                "voter_id": voter_id,
+                "name": name,
+                "followers": followers,
+                "inclination": inclination,
+            })
+    return booths
+
+# === MAIN ===
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("❌ Usage: python3 booth_influencers.py <constituency> [K] [M]")
+        exit(1)
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_BOOTHS
+    m = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_INFLUENCERS
+    print(json.dumps(top_booth_influencers(sys.argv[1], k, m), indent=2, ensure_ascii=False))
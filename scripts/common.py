@@ -0,0 +1,262 @@
+# common.py — Shared data-access layer for prompt scripts, the deck generator and the GUI
+#
+# Connections are opened once and reused for the life of the process (sqlite3
+# keeps a prepared-statement cache per connection, so reuse also skips
+# re-parsing hot queries). The database runs in WAL mode: readers use separate
+# read-only connections and never wait behind a prompt's write transaction.
+#
+#   query(sql, params)   one-shot read on a pooled reader; safe from any thread
+#   read_conn()          this thread's reader, for several reads in a row
+#   transaction()        this thread's writer in a write transaction; commits or rolls back
+#   db_connect()         this thread's writer + cursor; commit, don't close
+
+import itertools
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+DB_PATH = os.environ.get("KALPANA_DB_PATH", "voter_data/voter_data.db")
+BUSY_TIMEOUT_MS = 30000
+CACHE_SIZE_KB = 65536              # page cache per connection (64 MB)
+MMAP_SIZE = 256 * 1024 * 1024      # memory-map up to 256 MB of the DB file
+STATEMENT_CACHE = 256              # prepared statements kept per connection
+READER_POOL_SIZE = 4
+
+_local = threading.local()
+# Short-lived threads (Streamlit reruns, executor workers) borrow readers from here
+_reader_pool = queue.LifoQueue(maxsize=READER_POOL_SIZE)
+_pool_pid = os.getpid()
+_wal_lock = threading.Lock()
+_wal_ready = False
+_savepoints = itertools.count(1)
+
+def _tune(conn):
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+def _open_writer():
+    global _wal_ready
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=STATEMENT_CACHE)
+    _tune(conn)
+    # NORMAL is durable across application crashes in WAL mode and avoids an fsync per commit
+    conn.execute("PRAGMA synchronous = NORMAL")
+    with _wal_lock:
+        if not _wal_ready:
+            try:
+                conn.execute("PRAGMA journal_mode = WAL")
+            except sqlite3.OperationalError:
+                # Read-only media: stay in the existing journal mode
+                pass
+            _wal_ready = True
+    return conn
+
+def _open_reader(shared=False):
+    # WAL is a persistent property of the file; switch it on before the first reader
+    if not _wal_ready:
+        write_conn()
+    uri = f"file:{os.path.abspath(DB_PATH)}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT_MS / 1000,
+                           cached_statements=STATEMENT_CACHE, check_same_thread=not shared)
+    _tune(conn)
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+def _thread_conn(kind, opener):
+    # Connections inherited through fork() are unsafe; reopen in the child
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.__dict__.clear()
+        _local.pid = os.getpid()
+    conn = getattr(_local, kind, None)
+    if conn is None:
+        conn = opener()
+        setattr(_local, kind, conn)
+    return conn
+
+def read_conn():
+    return _thread_conn("reader", _open_reader)
+
+def write_conn():
+    return _thread_conn("writer", _open_writer)
+
+@contextmanager
+def transaction():
+    """
+    This thread's writer inside BEGIN IMMEDIATE: commits when the block ends,
+    rolls back if it raises, so a failed write never leaves the pooled
+    connection holding the write lock. Inside an already open transaction
+    it runs as a savepoint and only undoes its own writes on failure.
+    """
+    conn = write_conn()
+    if conn.in_transaction:
+        name = f"sp_{next(_savepoints)}"
+        conn.execute(f"SAVEPOINT {name}")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute(f"ROLLBACK TO {name}")
+            conn.execute(f"RELEASE {name}")
+            raise
+        conn.execute(f"RELEASE {name}")
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+def release_writer():
+    """
+    Rolls back anything left open on this thread's writer. Long-lived
+    threads run it after each unit of work (see prompt_registry.run_prompt)
+    so a script that raised mid-transaction doesn't block every other writer.
+    """
+    conn = getattr(_local, "writer", None) if getattr(_local, "pid", None) == os.getpid() else None
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+def close_all():
+    for kind in ("reader", "writer"):
+        conn = getattr(_local, kind, None)
+        if conn is not None:
+            conn.close()
+            setattr(_local, kind, None)
+    while True:
+        try:
+            _reader_pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+def query(sql, params=(), one=False):
+    global _reader_pool, _pool_pid
+    if _pool_pid != os.getpid():
+        _reader_pool, _pool_pid = queue.LifoQueue(maxsize=READER_POOL_SIZE), os.getpid()
+    try:
+        conn = _reader_pool.get_nowait()
+    except queue.Empty:
+        conn = _open_reader(shared=True)
+    try:
+        cursor = conn.execute(sql, params)
+        return cursor.fetchone() if one else cursor.fetchall()
+    finally:
+        try:
+            _reader_pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+def db_connect():
+    """
+    Pooled write connection and a fresh cursor, for scripts that read and
+    write prompt_outputs in one go. Commit as usual; don't close it. Prefer
+    transaction(), which also rolls back when the caller raises.
+    """
+    conn = write_conn()
+    return conn, conn.cursor()
+
+def execute_script(conn, script):
+    """
+    Runs a multi-statement script (triggers included) one statement at a time,
+    inside the caller's transaction — unlike executescript(), which commits.
+    """
+    current = ""
+    for line in script.strip().splitlines():
+        current += line + "\n"
+        if sqlite3.complete_statement(current):
+            conn.execute(current)
+            current = ""
+
+def get_constituency_code(name):
+    row = query("SELECT code FROM constituencies WHERE LOWER(name) = LOWER(?)", (name.lower(),), one=True)
+    return row[0] if row else None
+
+def get_context(params):
+    name = str(params.get("constituency_name", "Mandya")).strip()
+    row = query("SELECT code, name FROM constituencies WHERE LOWER(name) = LOWER(?)", (name.lower(),), one=True)
+    return {
+        "constituency_name": row[1] if row else name,
+        "constituency_code": row[0] if row else None,
+        "candidate_name": params.get("candidate_name"),
+        "variant_choice": str(params.get("variant_choice", "r")).strip().lower(),
+    }
+
+# === prompt_outputs writes ===
+def _has_column(conn, table, column):
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+def _has_variant_key(conn):
+    # Unique (prompt_id, LOWER(constituency), variant_number) from migration 006
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'uq_prompt_outputs_variant'"
+    ).fetchone() is not None
+
+def save_variants(prompt_id, constituency, texts, candidate_id=None, theme=None, rationale=None,
+                  source_script=None, created_at=None, first_variant=1):
+    """
+    Stores texts as variants first_variant.. of prompt_id for constituency in
+    one transaction: existing variants are updated in place, new ones
+    inserted, and variants beyond the new set removed. Regenerated variants
+    go back to 'draft'.
+    """
+    created_at = created_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    numbers = list(range(first_variant, first_variant + len(texts)))
+    rows = [(prompt_id, candidate_id, constituency, theme, n, text, created_at, source_script, rationale)
+            for n, text in zip(numbers, texts)]
+    with transaction() as conn:
+        if _has_variant_key(conn):
+            status = ", status = 'draft'" if _has_column(conn, "prompt_outputs", "status") else ""
+            conn.executemany(f"""
+                INSERT INTO prompt_outputs (prompt_id, candidate_id, constituency, theme, variant_number,
+                    generated_text, created_at, source_script, rationale)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (prompt_id, LOWER(constituency), variant_number) DO UPDATE SET
+                    candidate_id = excluded.candidate_id, constituency = excluded.constituency,
+                    theme = excluded.theme, generated_text = excluded.generated_text,
+                    created_at = excluded.created_at, source_script = excluded.source_script,
+                    rationale = excluded.rationale{status}
+            """, rows)
+            conn.execute(f"""
+                DELETE FROM prompt_outputs
+                WHERE prompt_id = ? AND LOWER(constituency) = LOWER(?)
+                  AND variant_number NOT IN ({', '.join('?' * len(numbers))})
+            """, (prompt_id, constituency, *numbers))
+        else:
+            # Pre-migration schema: replace the whole set inside the same transaction
+            clear_prompt_output(conn, prompt_id, constituency)
+            conn.executemany("""
+                INSERT INTO prompt_outputs (prompt_id, candidate_id, constituency, theme, variant_number,
+                    generated_text, created_at, source_script, rationale)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+def finalize_variant(prompt_id, constituency, variant_number, finalized_at=None):
+    """
+    Marks one stored variant as final in place (siblings go back to 'draft')
+    and returns its text, or None if that variant doesn't exist.
+    """
+    finalized_at = finalized_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with transaction() as conn:
+        row = conn.execute("""
+            SELECT rowid, generated_text FROM prompt_outputs
+            WHERE prompt_id = ? AND LOWER(constituency) = LOWER(?) AND variant_number = ?
+            LIMIT 1
+        """, (prompt_id, constituency, variant_number)).fetchone()
+        if row:
+            if _has_column(conn, "prompt_outputs", "status"):
+                conn.execute("""
+                    UPDATE prompt_outputs SET status = 'draft'
+                    WHERE prompt_id = ? AND LOWER(constituency) = LOWER(?) AND status = 'final' AND rowid <> ?
+                """, (prompt_id, constituency, row[0]))
+                conn.execute("UPDATE prompt_outputs SET status = 'final', created_at = ? WHERE rowid = ?",
+                             (finalized_at, row[0]))
+            else:
+                conn.execute("UPDATE prompt_outputs SET created_at = ? WHERE rowid = ?", (finalized_at, row[0]))
+    return row[1] if row else None
+
+def clear_prompt_output(cursor, prompt_id, constituency):
+    cursor.execute("DELETE FROM prompt_outputs WHERE prompt_id = ? AND LOWER(constituency) = LOWER(?)", (prompt_id, constituency.lower()))
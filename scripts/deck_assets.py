@@ -0,0 +1,113 @@
+# deck_assets.py — Pre-resized image cache for pitch deck rendering
+#
+# Candidate photos and party symbols are stored full-size, but a deck only
+# draws them in small boxes. image() resizes a source once to its render box
+# at TARGET_DPI, stores the result under CACHE_DIR keyed by source content
+# hash and pixel size, and keeps the decoded ImageReader in memory (the
+# READER_CACHE_SIZE most recently used), so a symbol shared by many decks is
+# decoded once per process and embedded at box resolution instead of full
+# resolution.
+#
+# Batch runs call warm() in the parent for the party symbols only (shared by
+# many decks) so every forked worker inherits them decoded; each worker
+# resizes its own candidate photo through the on-disk cache. Without Pillow,
+# image() returns the source path and rendering behaves as before.
+
+import functools
+import hashlib
+import os
+import threading
+
+from reportlab.lib.utils import ImageReader
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+CACHE_DIR = os.environ.get("KALPANA_ASSET_CACHE", "voter_data/asset_cache")
+TARGET_DPI = 150
+JPEG_QUALITY = 85
+POINTS_PER_INCH = 72
+READER_CACHE_SIZE = 128   # decoded images kept per process
+
+_digests = {}       # (path, mtime_ns, size) -> content hash
+_lock = threading.Lock()
+
+def _digest(path, st):
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    digest = _digests.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        digest = _digests[key] = h.hexdigest()[:20]
+    return digest
+
+def _box_pixels(width_pt, height_pt, dpi):
+    return max(1, round(width_pt / POINTS_PER_INCH * dpi)), max(1, round(height_pt / POINTS_PER_INCH * dpi))
+
+def _resize(path, cache_path, size, fit, transparent):
+    with Image.open(path) as img:
+        img = img.convert("RGBA" if transparent else "RGB")
+        if fit:
+            # Keep the aspect ratio inside the box (as preserveAspectRatio draws it)
+            img.thumbnail(size, Image.LANCZOS)
+        elif img.size != size:
+            img = img.resize(size, Image.LANCZOS)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp = f"{cache_path}.{os.getpid()}.tmp"
+        if transparent:
+            img.save(tmp, "PNG", optimize=True)
+        else:
+            img.save(tmp, "JPEG", quality=JPEG_QUALITY, optimize=True)
+        os.replace(tmp, cache_path)
+
+def image(path, width_pt, height_pt, fit=False, dpi=TARGET_DPI):
+    """
+    Returns an ImageReader for path resized to a width_pt x height_pt box
+    (fit=True keeps the aspect ratio inside it), or path itself when the
+    image can't be pre-resized. Never upscales beyond the source.
+    """
+    if Image is None:
+        return path
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path
+    box = _box_pixels(width_pt, height_pt, dpi)
+    with _lock:
+        try:
+            # The source stamp is part of the key, so an edited file is read again
+            return _reader(os.path.abspath(path), st.st_mtime_ns, st.st_size, box, fit)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not pre-resize {path}: {e}")
+            return path
+
+@functools.lru_cache(maxsize=READER_CACHE_SIZE)
+def _reader(path, mtime_ns, size, box, fit):
+    digest = _digest(path, os.stat(path))
+    with Image.open(path) as probe:
+        transparent = probe.mode in ("RGBA", "LA") or "transparency" in probe.info
+        if probe.size[0] <= box[0] and probe.size[1] <= box[1]:
+            # Already small enough: reuse the decoded source
+            return ImageReader(path)
+        # Stretched to the box when drawn anyway: only shrink the sides that
+        # exceed it (thumbnail never enlarges)
+        target = box if fit else (min(probe.size[0], box[0]), min(probe.size[1], box[1]))
+    ext = "png" if transparent else "jpg"
+    cache_path = os.path.join(CACHE_DIR, f"{digest}_{target[0]}x{target[1]}{'_fit' if fit else ''}.{ext}")
+    if not os.path.exists(cache_path):
+        _resize(path, cache_path, target, fit, transparent)
+    return ImageReader(cache_path)
+
+def warm(requests):
+    """Pre-resizes and decodes (path, width_pt, height_pt, fit) requests."""
+    done = 0
+    for path, width_pt, height_pt, fit in requests:
+        reader = image(path, width_pt, height_pt, fit=fit)
+        if not isinstance(reader, str):
+            reader.getRGBData()   # decode now; ImageReader keeps the pixels
+            done += 1
+    return done
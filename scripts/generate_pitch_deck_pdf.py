@@ -1,3 +1,12 @@
+# generate_pitch_deck_pdf.py — Pitch deck renderer built from a slide registry
+#
+# Each slide is a renderer registered with @slide(number, needs=(...)), where
+# needs names the data sources it reads. generate_pitch_deck_pdf() collects the
+# sources needed by the selected slides, loads them once on a single read
+# connection (one snapshot), and hands every renderer the same Deck, whose
+# .data holds the results. Unselected slides cost no queries; a new slide is a
+# new registered function (plus a @data_source if it needs new data).
+
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import ParagraphStyle
 from reportlab.platypus import Paragraph, Frame
@@ -9,73 +18,132 @@ from reportlab.graphics.charts.barcharts import VerticalBarChart
 from reportlab.graphics.charts.piecharts import Pie
 from reportlab.graphics import renderPDF
 import os
-import sqlite3
+import deck_assets
+from common import read_conn
+from rollups import sentiment_source
 
-DB_PATH = "voter_data/voter_data.db"
+DEFAULT_SLOGAN = "Your Voice, Your Power, Your Future."
+# Render boxes of the cover photo and party symbol (images are pre-resized to these)
+PHOTO_BOX = (4 * inch, 4 * inch)
+SYMBOL_BOX = (1.1 * inch, 1.1 * inch)
 
-def generate_pitch_deck_pdf(
-    output_path,
-    candidate_name,
-    constituency_name,
-    party_name,
-    swot,
-    caste,
-    religion,
-    age,
-    gender,
-    education,
-    profession,
-    photo_path,
-    symbol_path,
-    background_path,
-    footer_text,
-    theme_color,
-    top_issue=None,
-    slogan_text=None,
-    selected_slides=None
-):
-    c = canvas.Canvas(output_path, pagesize=A4)
-    width, height = A4
-    selected_slides = set(selected_slides or [])
+SLIDES = {}         # slide number (str) -> (renderer, data source names)
+DATA_SOURCES = {}   # name -> loader(conn, deck)
+
+def slide(number, needs=()):
+    def register(renderer):
+        SLIDES[str(number)] = (renderer, tuple(needs))
+        return renderer
+    return register
 
+def data_source(name):
+    def register(loader):
+        DATA_SOURCES[name] = loader
+        return loader
+    return register
+
+# === Data sources ===
+@data_source("eci_history")
+def _load_eci_history(conn, deck):
+    return conn.execute(
+        "SELECT year, party, vote_share FROM eci_election_history WHERE constituency = ? ORDER BY year ASC",
+        (deck.constituency_name,)
+    ).fetchall()
+
+@data_source("quotes")
+def _load_quotes(conn, deck):
+    return conn.execute(
+        "SELECT quote, source_type, sentiment FROM campaign_quotes WHERE constituency = ? LIMIT 5",
+        (deck.constituency_name,)
+    ).fetchall()
+
+@data_source("digital_campaigns")
+def _load_digital_campaigns(conn, deck):
+    return conn.execute(
+        "SELECT platform, followers FROM digital_campaigns WHERE constituency = ?", (deck.constituency_name,)
+    ).fetchall()
+
+@data_source("sentiment")
+def _load_sentiment(conn, deck):
+    # Aggregate tables are keyed by constituency code
+    code = deck.constituency_code
+    if code is None:
+        row = conn.execute("SELECT code FROM constituencies WHERE LOWER(name) = LOWER(?)", (deck.constituency_name,)).fetchone()
+        code = row[0] if row else None
+    return conn.execute(
+        f"SELECT positive_pct, negative_pct FROM {sentiment_source(conn)} WHERE constituency = ?", (code,)
+    ).fetchone()
+
+def prefetch(deck, slide_numbers, prefetched=None):
+    """
+    Loads every data source the given slides need, each once, in one read
+    transaction. Entries of prefetched (already loaded by the caller) are
+    used as-is.
+    """
+    needed = {name for number in slide_numbers for name in SLIDES[number][1]}
+    data = {name: value for name, value in (prefetched or {}).items() if name in needed}
+    missing = sorted(needed - set(data))
+    if missing:
+        conn = read_conn()
+        conn.execute("BEGIN")
+        try:
+            for name in missing:
+                data[name] = DATA_SOURCES[name](conn, deck)
+        finally:
+            conn.rollback()
+    return data
+
+# === Drawing ===
+class Deck:
+    """Canvas, drawing helpers and slide inputs shared by every renderer."""
+
+    content_style = ParagraphStyle(name='content', fontSize=14, textColor=colors.black, leading=20)
+
+    def __init__(self, output_path, theme_color, footer_text, **fields):
+        self.c = canvas.Canvas(output_path, pagesize=A4)
+        self.width, self.height = A4
+        self.rgb = self.hex_to_rgb(theme_color)
+        self.footer_text = footer_text
+        self.__dict__.update(fields)
+        self.data = {}
+
+    @staticmethod
     def hex_to_rgb(hex_color):
         hex_color = hex_color.lstrip("#")
         return tuple(int(hex_color[i:i+2], 16)/255 for i in (0, 2, 4))
 
-    rgb = hex_to_rgb(theme_color)
+    def draw_footer(self):
+        self.c.setFont("Helvetica-Bold", 11)
+        self.c.setFillColor(colors.black)
+        self.c.drawCentredString(self.width / 2.0, 0.5 * inch, self.footer_text)
 
-    def draw_footer():
-        c.setFont("Helvetica-Bold", 11)
-        c.setFillColor(colors.black)
-        c.drawCentredString(width / 2.0, 0.5 * inch, footer_text)
+    def draw_bottom_color_bar(self):
+        self.c.setFillColorRGB(*self.rgb)
+        self.c.rect(0, 0.75 * inch, self.width, 3, stroke=0, fill=1)
 
-    def draw_bottom_color_bar():
-        c.setFillColorRGB(*rgb)
-        c.rect(0, 0.75 * inch, width, 3, stroke=0, fill=1)
-
-    def draw_shadowed_title(text, y):
+    def draw_shadowed_title(self, text, y):
+        c = self.c
         c.setFont("Helvetica-Bold", 22)
         c.setFillColorRGB(0.3, 0.3, 0.3)
-        c.drawCentredString(width / 2 + 1, y - 1, text)
+        c.drawCentredString(self.width / 2 + 1, y - 1, text)
         c.setFillColor(colors.black)
-        c.drawCentredString(width / 2, y, text)
-
-    content_style = ParagraphStyle(name='content', fontSize=14, textColor=colors.black, leading=20)
+        c.drawCentredString(self.width / 2, y, text)
 
-    def draw_slide(title, text, source_note=None):
+    def draw_slide(self, title, text, source_note=None):
+        c = self.c
         c.showPage()
-        draw_footer()
-        draw_bottom_color_bar()
-        draw_shadowed_title(title, height - 1.3 * inch)
-        frame = Frame(inch, 1.2 * inch, width - 2 * inch, height - 3 * inch, showBoundary=0)
-        elements = [Paragraph(text, content_style)]
+        self.draw_footer()
+        self.draw_bottom_color_bar()
+        self.draw_shadowed_title(title, self.height - 1.3 * inch)
+        frame = Frame(inch, 1.2 * inch, self.width - 2 * inch, self.height - 3 * inch, showBoundary=0)
+        elements = [Paragraph(text, self.content_style)]
         frame.addFromList(elements, c)
         if source_note:
             c.setFont("Helvetica-Oblique", 8)
             c.setFillColor(colors.grey)
-            c.drawCentredString(width / 2.0, 1.05 * inch, f"*{source_note}")
+            c.drawCentredString(self.width / 2.0, 1.05 * inch, f"*{source_note}")
 
-    def draw_bar_chart(title, labels, values):
+    def draw_bar_chart(self, title, labels, values):
         d = Drawing(480, 300)
         bc = VerticalBarChart()
         bc.x = 50
@@ -92,19 +160,20 @@ def generate_pitch_deck_pdf(
         bc.valueAxis.valueStep = int(bc.valueAxis.valueMax / 5)
         d.add(bc)
         d.add(String(180, 270, title, fontSize=14))
+        self.c.showPage()
+        self.draw_footer()
+        self.draw_bottom_color_bar()
+        renderPDF.draw(d, self.c, inch, 1.5 * inch)
+
+    def draw_pie_chart(self, title, pos_pct, neg_pct):
+        c = self.c
         c.showPage()
-        draw_footer()
-        draw_bottom_color_bar()
-        renderPDF.draw(d, c, inch, 1.5 * inch)
-    
-    def draw_pie_chart(title, pos_pct, neg_pct):
-        c.showPage()
-        draw_footer()
-        draw_bottom_color_bar()
+        self.draw_footer()
+        self.draw_bottom_color_bar()
 
         # Heading above chart
         c.setFont("Helvetica-Bold", 16)
-        c.drawCentredString(width / 2.0, height - 1.2 * inch, title)
+        c.drawCentredString(self.width / 2.0, self.height - 1.2 * inch, title)
 
         # Pie chart setup
         d = Drawing(300, 300)
@@ -122,151 +191,219 @@ def generate_pitch_deck_pdf(
         d.add(pie)
 
         # Draw centered on page
-        x_offset = (width - 300) / 2
-        y_offset = (height - 300) / 2.5
+        x_offset = (self.width - 300) / 2
+        y_offset = (self.height - 300) / 2.5
         renderPDF.draw(d, c, x_offset, y_offset)
 
+# === Slides ===
+# Slide 1: Cover
+@slide(1)
+def _cover(deck):
+    c, width, height = deck.c, deck.width, deck.height
+    if os.path.exists(deck.photo_path):
+        photo = deck_assets.image(deck.photo_path, *PHOTO_BOX, fit=True)
+        c.drawImage(photo, width/2 - 2*inch, height/2 - 1.5*inch, width=4*inch, height=4*inch, preserveAspectRatio=True)
+    if os.path.exists(deck.symbol_path):
+        c.setFillColor(colors.white)
+        c.rect(width - 1.52 * inch, height - 1.52 * inch, 1.14 * inch, 1.14 * inch, fill=True, stroke=False)
+        c.drawImage(deck_assets.image(deck.symbol_path, *SYMBOL_BOX), width - 1.5*inch, height - 1.5*inch, width=1.1*inch, height=1.1*inch)
+    c.setFont("Helvetica-Bold", 20)
+    c.setFillColor(colors.black)
+    c.drawCentredString(width/2.0, height/2 - 2.2*inch, deck.slogan_text or DEFAULT_SLOGAN)
+    deck.draw_footer()
+    deck.draw_bottom_color_bar()
 
-    # Slide 1: Cover
-    if '1' in selected_slides:
-        if os.path.exists(photo_path):
-            c.drawImage(photo_path, width/2 - 2*inch, height/2 - 1.5*inch, width=4*inch, height=4*inch, preserveAspectRatio=True)
-        if os.path.exists(symbol_path):
-            c.setFillColor(colors.white)
-            c.rect(width - 1.52 * inch, height - 1.52 * inch, 1.14 * inch, 1.14 * inch, fill=True, stroke=False)
-            c.drawImage(symbol_path, width - 1.5*inch, height - 1.5*inch, width=1.1*inch, height=1.1*inch)
-        c.setFont("Helvetica-Bold", 20)
-        c.setFillColor(colors.black)
-        c.drawCentredString(width/2.0, height/2 - 2.2*inch, slogan_text or "Your Voice, Your Power, Your Future.")
-        draw_footer()
-        draw_bottom_color_bar()
-
-    # Slides 2–9: Identity, Vision, Youth, Women, Vulnerable, etc.
-    if '2' in selected_slides:
-        draw_slide("Who Am I?", f"""
-        <b>{candidate_name}</b> is contesting from <b>{constituency_name}</b> as a proud member of the <b>{party_name}</b>.<br/>
-        Identity: Caste – <b>{caste}</b>, Religion – <b>{religion}</b>
-        """)
-    if '3' in selected_slides:
-        draw_slide("Top Priority: " + top_issue, f"""
-        The top concern in <b>{constituency_name}</b> is <b>{top_issue}</b>.<br/>
-        Our action plan targets root causes with data-driven governance.
-        """)
-    if '4' in selected_slides:
-        draw_slide("Vision for the Future", "We envision smart roads, clean water, safe neighborhoods, and economic dignity for all.")
-    if '5' in selected_slides:
-        draw_slide("Jobs & Youth", "Skill centers, startup zones, internships, and education-to-employment pipelines.")
-    if '6' in selected_slides:
-        draw_slide("Women First", "Safety, self-help groups, leadership, health, financial literacy, opportunity.")
-    if '7' in selected_slides:
-        draw_slide("Support for Vulnerable", "Housing, food, medicine, pensions, and fast-track social inclusion.")
-    if '8' in selected_slides:
-        draw_slide("Why Me?", f"I’ve served {constituency_name} through crises and campaigns. I’m not just your leader — I’m one of you.")
-    if '9' in selected_slides:
-        draw_slide("Vote Appeal", f"A vote for <b>{candidate_name}</b> is a vote for dignity, development, and decisive leadership.")
-
-    # Slide 10: Electoral History (bar chart)
-    if '10' in selected_slides:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT year, party, vote_share FROM eci_election_history WHERE constituency = ? ORDER BY year ASC", (constituency_name,))
-        rows = cursor.fetchall()
-        conn.close()
-        if rows:
-            labels = [f"{r[0]}-{r[1]}" for r in rows]
-            shares = [r[2] for r in rows]
-            draw_bar_chart("Electoral History (Vote %)", labels, shares)
-            c.setFont("Helvetica-Oblique", 8)
-            c.setFillColor(colors.grey)
-            c.drawCentredString(width / 2.0, 1.25 * inch, "*source: ECI website")
-
-        else:
-            draw_slide("Electoral History", "No ECI data available.", source_note="Based on ECI trends")
-
-    # Slide 11: Reputation SWOT
-    if '11' in selected_slides:
-        draw_slide("Reputation Snapshot", swot or "No SWOT data available.")
-
-    # Slide 12: Public Quotes
-    if '12' in selected_slides:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT quote, source_type, sentiment FROM campaign_quotes WHERE constituency = ? LIMIT 5", (constituency_name,))
-        rows = cursor.fetchall()
-        conn.close()
-        if rows:
-            text = "".join([f"• <i>{q[0]}</i> ({q[1]}, {q[2]})<br/>" for q in rows])
-            draw_slide("What People Are Saying", text)
-        else:
-            draw_slide("Public Sentiment", "No quotes found.")
-
-    # Slide 13: Digital Campaign (bar chart)
-    if '13' in selected_slides:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT platform, followers FROM digital_campaigns WHERE constituency = ?", (constituency_name,))
-        rows = cursor.fetchall()
-        conn.close()
-        if rows:
-            platforms = [r[0] for r in rows]
-            followers = [r[1] for r in rows]
-            draw_bar_chart("Digital Reach (Followers)", platforms, followers)
-        else:
-            draw_slide("Digital Presence", "No platform data found.")
-
-    # Slide 14: Sentiment (pie chart)
-    if '14' in selected_slides:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT positive_pct, negative_pct FROM constituency_sentiment WHERE constituency = ?", (constituency_name,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            pos_pct, neg_pct = round(row[0]*100, 1), round(row[1]*100, 1)
-            draw_pie_chart("Public Sentiment Breakdown", pos_pct, neg_pct)
-        else:
-            draw_slide("Constituency Sentiment", "No data available.")
-
-    # Slide 15–17: Promises, Timeline, Brand
-    if '15' in selected_slides:
-        draw_slide("9 Key Promises", """
-        • Job portals<br/>• Women-led SHGs<br/>• Skill cards<br/>• Rural digitization<br/>• Smart rationing<br/>• Pensions<br/>• Irrigation<br/>• Transparency<br/>• Farmer Insurance
-        """)
-    if '16' in selected_slides:
-        draw_slide("Campaign Timeline", "Jan–Apr: Outreach • May: Booth Mapping • Jun: Rallies • Jul: Poll Push • Aug: Victory.")
-    if '17' in selected_slides:
-        draw_slide("Our Brand Framework", "Trust • Action • Clarity • Unity • Decency • Development")
-
-    # Slide 18: Candidate Profile
-    if '18' in selected_slides:
-        draw_slide("Candidate Profile", f"""
-        Age: <b>{age}</b><br/>
-        Gender: <b>{gender}</b><br/>
-        Education: <b>{education}</b><br/>
-        Profession: <b>{profession}</b>
-        """)
-
-    # Slide 19: Final Slogan + Contact
-    if '19' in selected_slides:
-        c.showPage()
-        draw_footer()
-        draw_bottom_color_bar()
-        c.setFont("Helvetica-Bold", 18)
-        c.drawCentredString(width/2.0, height - 1.5 * inch, slogan_text or "Your Voice, Your Power, Your Future.")
-        if os.path.exists(symbol_path):
-            c.drawImage(symbol_path, width/2 - 0.55*inch, height - 3.1*inch, width=1.1*inch, height=1.1*inch)
-        slug = candidate_name.lower().replace(" ", "")
-        links = [f"📧 {slug}@email.com", f"🌐 www.{slug}.com", f"X: twitter.com/{slug}"]
-        c.setFont("Helvetica", 11)
-        y = height - 4.2 * inch
-        for line in links:
-            c.drawCentredString(width/2.0, y, line)
-            y -= 0.3 * inch
-
-    # Slide 20: Thank You
-    if '20' in selected_slides:
-        draw_slide("Thank You", f"Together, let's transform {constituency_name} — one vote at a time.")
-
-    c.save()
-    print(f"✅ Pitch deck saved to {output_path}")
+# Slides 2–9: Identity, Vision, Youth, Women, Vulnerable, etc.
+@slide(2)
+def _identity(deck):
+    deck.draw_slide("Who Am I?", f"""
+    <b>{deck.candidate_name}</b> is contesting from <b>{deck.constituency_name}</b> as a proud member of the <b>{deck.party_name}</b>.<br/>
+    Identity: Caste – <b>{deck.caste}</b>, Religion – <b>{deck.religion}</b>
+    """)
 
+@slide(3)
+def _top_priority(deck):
+    deck.draw_slide("Top Priority: " + deck.top_issue, f"""
+    The top concern in <b>{deck.constituency_name}</b> is <b>{deck.top_issue}</b>.<br/>
+    Our action plan targets root causes with data-driven governance.
+    """)
+
+@slide(4)
+def _vision(deck):
+    deck.draw_slide("Vision for the Future", "We envision smart roads, clean water, safe neighborhoods, and economic dignity for all.")
+
+@slide(5)
+def _jobs_youth(deck):
+    deck.draw_slide("Jobs & Youth", "Skill centers, startup zones, internships, and education-to-employment pipelines.")
+
+@slide(6)
+def _women_first(deck):
+    deck.draw_slide("Women First", "Safety, self-help groups, leadership, health, financial literacy, opportunity.")
+
+@slide(7)
+def _vulnerable(deck):
+    deck.draw_slide("Support for Vulnerable", "Housing, food, medicine, pensions, and fast-track social inclusion.")
+
+@slide(8)
+def _why_me(deck):
+    deck.draw_slide("Why Me?", f"I’ve served {deck.constituency_name} through crises and campaigns. I’m not just your leader — I’m one of you.")
+
+@slide(9)
+def _vote_appeal(deck):
+    deck.draw_slide("Vote Appeal", f"A vote for <b>{deck.candidate_name}</b> is a vote for dignity, development, and decisive leadership.")
+
+# Slide 10: Electoral History (bar chart)
+@slide(10, needs=("eci_history",))
+def _electoral_history(deck):
+    rows = deck.data["eci_history"]
+    if rows:
+        labels = [f"{r[0]}-{r[1]}" for r in rows]
+        shares = [r[2] for r in rows]
+        deck.draw_bar_chart("Electoral History (Vote %)", labels, shares)
+        deck.c.setFont("Helvetica-Oblique", 8)
+        deck.c.setFillColor(colors.grey)
+        deck.c.drawCentredString(deck.width / 2.0, 1.25 * inch, "*source: ECI website")
+    else:
+        deck.draw_slide("Electoral History", "No ECI data available.", source_note="Based on ECI trends")
+
+# Slide 11: Reputation SWOT
+@slide(11)
+def _swot(deck):
+    deck.draw_slide("Reputation Snapshot", deck.swot or "No SWOT data available.")
+
+# Slide 12: Public Quotes
+@slide(12, needs=("quotes",))
+def _quotes(deck):
+    rows = deck.data["quotes"]
+    if rows:
+        text = "".join([f"• <i>{q[0]}</i> ({q[1]}, {q[2]})<br/>" for q in rows])
+        deck.draw_slide("What People Are Saying", text)
+    else:
+        deck.draw_slide("Public Sentiment", "No quotes found.")
+
+# Slide 13: Digital Campaign (bar chart)
+@slide(13, needs=("digital_campaigns",))
+def _digital_reach(deck):
+    rows = deck.data["digital_campaigns"]
+    if rows:
+        platforms = [r[0] for r in rows]
+        followers = [r[1] for r in rows]
+        deck.draw_bar_chart("Digital Reach (Followers)", platforms, followers)
+    else:
+        deck.draw_slide("Digital Presence", "No platform data found.")
+
+# Slide 14: Sentiment (pie chart)
+@slide(14, needs=("sentiment",))
+def _sentiment(deck):
+    row = deck.data["sentiment"]
+    if row:
+        pos_pct, neg_pct = round(row[0]*100, 1), round(row[1]*100, 1)
+        deck.draw_pie_chart("Public Sentiment Breakdown", pos_pct, neg_pct)
+    else:
+        deck.draw_slide("Constituency Sentiment", "No data available.")
+
+# Slide 15–17: Promises, Timeline, Brand
+@slide(15)
+def _promises(deck):
+    deck.draw_slide("9 Key Promises", """
+    • Job portals<br/>• Women-led SHGs<br/>• Skill cards<br/>• Rural digitization<br/>• Smart rationing<br/>• Pensions<br/>• Irrigation<br/>• Transparency<br/>• Farmer Insurance
+    """)
+
+@slide(16)
+def _timeline(deck):
+    deck.draw_slide("Campaign Timeline", "Jan–Apr: Outreach • May: Booth Mapping • Jun: Rallies • Jul: Poll Push • Aug: Victory.")
+
+@slide(17)
+def _brand(deck):
+    deck.draw_slide("Our Brand Framework", "Trust • Action • Clarity • Unity • Decency • Development")
+
+# Slide 18: Candidate Profile
+@slide(18)
+def _profile(deck):
+    deck.draw_slide("Candidate Profile", f"""
+    Age: <b>{deck.age}</b><br/>
+    Gender: <b>{deck.gender}</b><br/>
+    Education: <b>{deck.education}</b><br/>
+    Profession: <b>{deck.profession}</b>
+    """)
+
+# Slide 19: Final Slogan + Contact
+@slide(19)
+def _contact(deck):
+    c, width, height = deck.c, deck.width, deck.height
+    c.showPage()
+    deck.draw_footer()
+    deck.draw_bottom_color_bar()
+    c.setFont("Helvetica-Bold", 18)
+    c.drawCentredString(width/2.0, height - 1.5 * inch, deck.slogan_text or DEFAULT_SLOGAN)
+    if os.path.exists(deck.symbol_path):
+        c.drawImage(deck_assets.image(deck.symbol_path, *SYMBOL_BOX), width/2 - 0.55*inch, height - 3.1*inch, width=1.1*inch, height=1.1*inch)
+    slug = deck.candidate_name.lower().replace(" ", "")
+    links = [f"📧 {slug}@email.com", f"🌐 www.{slug}.com", f"X: twitter.com/{slug}"]
+    c.setFont("Helvetica", 11)
+    y = height - 4.2 * inch
+    for line in links:
+        c.drawCentredString(width/2.0, y, line)
+        y -= 0.3 * inch
+
+# Slide 20: Thank You
+@slide(20)
+def _thank_you(deck):
+    deck.draw_slide("Thank You", f"Together, let's transform {deck.constituency_name} — one vote at a time.")
+
+# === Generator ===
+def warm_assets(photo_paths=(), symbol_paths=()):
+    """
+    Pre-resizes and decodes deck images ahead of rendering (e.g. in a batch
+    parent before forking workers). Returns the number of images ready.
+    """
+    requests = [(p, *PHOTO_BOX, True) for p in set(photo_paths) if os.path.exists(p)]
+    requests += [(p, *SYMBOL_BOX, False) for p in set(symbol_paths) if os.path.exists(p)]
+    return deck_assets.warm(requests)
+
+def generate_pitch_deck_pdf(
+    output_path,
+    candidate_name,
+    constituency_name,
+    party_name,
+    swot,
+    caste,
+    religion,
+    age,
+    gender,
+    education,
+    profession,
+    photo_path,
+    symbol_path,
+    background_path,
+    footer_text,
+    theme_color,
+    top_issue=None,
+    slogan_text=None,
+    selected_slides=None,
+    progress=None,
+    constituency_code=None,
+    prefetched=None
+):
+    """
+    Renders the selected slides (numbers as strings) in slide order.
+    progress(done, total) is called after each slide; prefetched maps data
+    source names to values the caller has already loaded.
+    """
+    selected = sorted({str(s) for s in (selected_slides or [])} & set(SLIDES), key=int)
+    deck = Deck(
+        output_path, theme_color, footer_text,
+        candidate_name=candidate_name, constituency_name=constituency_name, constituency_code=constituency_code,
+        party_name=party_name, swot=swot, caste=caste, religion=religion, age=age, gender=gender,
+        education=education, profession=profession, photo_path=photo_path, symbol_path=symbol_path,
+        background_path=background_path, top_issue=top_issue, slogan_text=slogan_text,
+    )
+    deck.data = prefetch(deck, selected, prefetched)
+
+    for done, number in enumerate(selected, 1):
+        SLIDES[number][0](deck)
+        if progress:
+            progress(done, len(selected))
+
+    deck.c.save()
+    print(f"✅ Pitch deck saved to {output_path}")
@@ -2,10 +2,14 @@ import streamlit as st
 import sqlite3
 import os
 import glob
+import importlib
 import time
 from datetime import datetime
-
-DB_PATH = "voter_data/voter_data.db"
+from kalpana_llm_bridge import is_llm_error, stream_llama_n
+from prompt_registry import run_prompt
+from common import query, write_conn
+import asset_jobs
+import llm_queue
 
 # === Custom Styling ===
 st.markdown("""
@@ -22,38 +26,201 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # === Shared DB Helpers ===
+# prompt_outputs writes bump a per-(prompt, constituency) version via triggers,
+# so cached reads are keyed on that version and refresh exactly when a run
+# (in-process or CLI) stores new rows for the same prompt/constituency.
+OUTPUT_VERSION_DDL = """
+CREATE TABLE IF NOT EXISTS prompt_output_versions (
+    prompt_id INTEGER NOT NULL,
+    constituency_key TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (prompt_id, constituency_key)
+);
+CREATE TRIGGER IF NOT EXISTS trg_prompt_outputs_version_ins AFTER INSERT ON prompt_outputs BEGIN
+    INSERT INTO prompt_output_versions (prompt_id, constituency_key, version)
+    VALUES (NEW.prompt_id, LOWER(NEW.constituency), 1)
+    ON CONFLICT(prompt_id, constituency_key) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_prompt_outputs_version_upd AFTER UPDATE ON prompt_outputs BEGIN
+    INSERT INTO prompt_output_versions (prompt_id, constituency_key, version)
+    VALUES (NEW.prompt_id, LOWER(NEW.constituency), 1)
+    ON CONFLICT(prompt_id, constituency_key) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_prompt_outputs_version_del AFTER DELETE ON prompt_outputs BEGIN
+    INSERT INTO prompt_output_versions (prompt_id, constituency_key, version)
+    VALUES (OLD.prompt_id, LOWER(OLD.constituency), 1)
+    ON CONFLICT(prompt_id, constituency_key) DO UPDATE SET version = version + 1;
+END;
+"""
+
+@st.cache_resource
+def get_db():
+    # Triggers are installed once per process; reads go through common's reader pool
+    try:
+        write_conn().executescript(OUTPUT_VERSION_DDL)
+        versioned = True
+    except sqlite3.Error:
+        versioned = False
+    return {"versioned": versioned}
+
+def db_query(sql, params=(), one=False):
+    return query(sql, params, one=one)
+
+def get_output_version(prompt_id, constituency):
+    if not get_db()["versioned"]:
+        # Read-only DB without triggers: fall back to SQLite's global change counter
+        return db_query("PRAGMA data_version", one=True)[0]
+    row = db_query(
+        "SELECT version FROM prompt_output_versions WHERE prompt_id = ? AND constituency_key = ?",
+        (prompt_id, constituency.lower()), one=True
+    )
+    return row[0] if row else 0
+
+@st.cache_data(ttl=3600, show_spinner=False)
 def get_constituencies():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT name FROM constituencies ORDER BY name")
-    rows = cursor.fetchall()
-    conn.close()
+    rows = db_query("SELECT DISTINCT name FROM constituencies ORDER BY name")
     return [row[0] for row in rows]
 
-def get_prompt_variants(prompt_id, constituency):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
+@st.cache_data(max_entries=512, show_spinner=False)
+def _cached_prompt_variants(prompt_id, constituency_key, version):
+    return db_query("""
         SELECT variant_number, generated_text FROM prompt_outputs
         WHERE prompt_id = ? AND LOWER(constituency) = LOWER(?)
         ORDER BY variant_number
-    """, (prompt_id, constituency.lower()))
-    variants = cursor.fetchall()
-    conn.close()
-    return variants
+    """, (prompt_id, constituency_key))
 
-def get_prompt_rationale(prompt_id, constituency):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
+@st.cache_data(max_entries=512, show_spinner=False)
+def _cached_prompt_rationale(prompt_id, constituency_key, version):
+    row = db_query("""
         SELECT rationale FROM prompt_outputs
         WHERE prompt_id = ? AND LOWER(constituency) = LOWER(?)
         ORDER BY created_at DESC LIMIT 1
-    """, (prompt_id, constituency.lower()))
-    row = cursor.fetchone()
-    conn.close()
+    """, (prompt_id, constituency_key), one=True)
     return row[0] if row else None
 
+def get_prompt_variants(prompt_id, constituency):
+    return _cached_prompt_variants(prompt_id, constituency.lower(), get_output_version(prompt_id, constituency))
+
+def get_prompt_rationale(prompt_id, constituency):
+    return _cached_prompt_rationale(prompt_id, constituency.lower(), get_output_version(prompt_id, constituency))
+
+# === Live Streaming Generation ===
+# LLM-backed campaign prompts rendered token by token instead of via run_prompt
+STREAMING_PROMPTS = {4: "prompt_4"}
+STREAM_VARIANTS = 3
+
+def stream_campaign_variants(prompt_id, constituency, use_identity=False, regenerate=False):
+    module = importlib.import_module(STREAMING_PROMPTS[prompt_id])
+    code = module.get_constituency_code(constituency)
+    if not code:
+        st.error(f"❌ Invalid constituency: {constituency}")
+        return
+    ctx = module.add_voices(module.load_context(code))
+
+    boxes = [st.empty() for _ in range(STREAM_VARIANTS)]
+    texts = [""] * STREAM_VARIANTS
+    failed = {}
+    try:
+        for i, piece in stream_llama_n(
+            module.render_prompt(ctx, use_identity), n=STREAM_VARIANTS, use_cache=not regenerate,
+            prefix=getattr(module, "PROMPT_PREFIX", None), priority="interactive",
+            prompt_id=prompt_id
+        ):
+            if piece is None:
+                continue
+            if is_llm_error(piece):
+                failed[i] = piece
+            texts[i] += piece
+            boxes[i].markdown(f"**📝 Variant {i + 1}**\n\n{texts[i]}")
+    except (llm_queue.JobCancelled, llm_queue.JobTimeout) as e:
+        st.error(f"❌ Generation stopped: {e}")
+        return
+    except Exception as e:
+        st.error(f"❌ Generation failed: {type(e).__name__}: {e}")
+        return
+
+    if failed:
+        # Like prompt_4.run: keep the stored variants rather than overwrite them with errors
+        st.error(f"❌ {len(failed)} of {STREAM_VARIANTS} variant(s) failed, nothing stored: {next(iter(failed.values()))}")
+        return
+    # Persist only once every variant has finished
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    variants = [module.clean(t) for t in texts]
+    module.store_variants(ctx, variants, module.build_rationale(ctx), now)
+
+def run_campaign_prompt(prompt_id, constituency, use_identity, regenerate=False):
+    if prompt_id in STREAMING_PROMPTS:
+        stream_campaign_variants(prompt_id, constituency, use_identity, regenerate)
+        return
+    result = run_prompt(prompt_id, {
+        "constituency_name": constituency,
+        "use_identity_tags": 'y' if use_identity else 'n',
+        "variant_choice": 'r',
+        # Operator clicks jump ahead of batch/precompute jobs in the LLM queue
+        "kalpana_llm_priority": 'interactive',
+        # Deliberate regeneration skips cached LLM responses
+        "kalpana_llm_cache_bypass": 'y' if regenerate else 'n',
+    })
+    if not result["ok"]:
+        st.error(result["message"])
+    return result
+
+# === Background Asset Jobs ===
+# Long-running Strategy Tools assets run in a worker process (asset_jobs.py)
+BACKGROUND_PROMPTS = {
+    31: ("📥 Download Pitch Deck", "application/pdf", "voter_data/pitch_decks/pd_*_{slug}_*.pdf"),
+    32: ("🎬 Download Campaign Video", "video/mp4", "voter_data/videos/cv_*.mp4"),
+}
+JOB_POLL_SECONDS = 2
+
+def latest_asset_file(strategy_id, constituency, job):
+    files = (job.get("result") or {}).get("files") or []
+    files = [f for f in files if os.path.exists(f)]
+    if not files:
+        # Scripts without structured results (e.g. prompt_32) are found by name
+        pattern = BACKGROUND_PROMPTS[strategy_id][2].format(slug=constituency.lower().replace(" ", "_"))
+        files = sorted(glob.glob(pattern), reverse=True)
+    return files[0] if files else None
+
+def render_asset_jobs(strategy_id, constituency):
+    """
+    Shows the recent background jobs for this asset/constituency. Returns True
+    while any of them is still queued or running, so the page keeps polling.
+    """
+    jobs = asset_jobs.watch_jobs(strategy_id, constituency, limit=3)
+    if not jobs:
+        return False
+
+    st.markdown("### ⏳ Background Jobs:")
+    active = False
+    label, mime, _ = BACKGROUND_PROMPTS[strategy_id]
+    for job in jobs:
+        started = datetime.fromtimestamp(job["created_at"]).strftime("%Y-%m-%d %H:%M:%S")
+        header = f"Job #{job['job_id']} — {job['status']} (submitted {started})"
+        if job["attempts"] > 1:
+            # Crashed runs are retried from the start
+            header += f" — retry {job['attempts'] - 1} of {asset_jobs.MAX_ATTEMPTS - 1}"
+        if job["status"] in ("queued", "running"):
+            active = True
+            total = job["progress_total"] or 0
+            fraction = job["progress_done"] / total if total else 0.0
+            detail = f"{job['progress_done']}/{total} slides rendered" if total else (job["message"] or "Waiting for worker...")
+            st.progress(fraction, text=f"{header}: {detail}")
+            if st.button("✖️ Cancel", key=f"cancel_job_{job['job_id']}"):
+                asset_jobs.cancel(job["job_id"])
+                st.rerun()
+        elif job["status"] == "done":
+            st.success(header)
+            path = latest_asset_file(strategy_id, constituency, job)
+            if path:
+                with open(path, "rb") as f:
+                    st.download_button(label, data=f, file_name=os.path.basename(path), mime=mime, key=f"download_job_{job['job_id']}")
+            with st.expander("View Output"):
+                st.code((job["result"] or {}).get("log", "") + (job["message"] or ""))
+        else:
+            st.error(f"{header}: {job['message'] or ''}")
+    return active
+
 # === Streamlit App ===
 st.set_page_config(page_title="voteR - AI Political Toolkit", layout="wide")
 st.title("\U0001F5F3 voteR — AI Political Analysis Engine")
@@ -83,10 +250,7 @@ with tab1:
     prompt_id = selected_campaign[0]
 
     if st.button("\U0001F680 Generate Asset"):
-        os.environ['CONSTITUENCY_NAME'] = constituency
-        os.environ['USE_IDENTITY_TAGS'] = 'y' if use_identity else 'n'
-        os.environ['VARIANT_CHOICE'] = 'r'
-        os.system(f"python3 prompt_{prompt_id}.py")
+        run_campaign_prompt(prompt_id, constituency, use_identity)
         st.rerun()
 
     rationale = get_prompt_rationale(prompt_id, constituency)
@@ -98,23 +262,24 @@ with tab1:
     if variants:
         st.markdown("### ✨ Choose your preferred flyer variant:")
         variant_map = {f"{v[0]}. {v[1][:500].replace('\n', ' ')}": v[0] for v in variants}
-        refresh_key = f"variant_select_{prompt_id}_{constituency}_{len(variants)}_{int(time.time() // 60)}"
+        refresh_key = f"variant_select_{prompt_id}_{constituency}_{get_output_version(prompt_id, constituency)}"
         selected_label = st.radio("Select a variant", list(variant_map.keys()), key=refresh_key)
         selected_variant = variant_map[selected_label]
 
         if st.button("♻️ Regenerate Variants"):
-            os.environ['CONSTITUENCY_NAME'] = constituency
-            os.environ['USE_IDENTITY_TAGS'] = 'y' if use_identity else 'n'
-            os.environ['VARIANT_CHOICE'] = 'r'
-            os.system(f"python3 prompt_{prompt_id}.py")
+            run_campaign_prompt(prompt_id, constituency, use_identity, regenerate=True)
             st.rerun()
 
         if st.button("\U0001F4C4 Export PDF" if prompt_id == 1 else "\u2705 Finalize Variant"):
-            os.environ['CONSTITUENCY_NAME'] = constituency
-            os.environ['USE_IDENTITY_TAGS'] = 'y' if use_identity else 'n'
-            os.environ['VARIANT_CHOICE'] = str(selected_variant)
-            os.system(f"python3 prompt_{prompt_id}.py")
-            st.success("✅ Variant finalized and saved.")
+            result = run_prompt(prompt_id, {
+                "constituency_name": constituency,
+                "use_identity_tags": 'y' if use_identity else 'n',
+                "variant_choice": str(selected_variant),
+            })
+            if result["ok"]:
+                st.success("✅ Variant finalized and saved.")
+            else:
+                st.error(result["message"])
 
             if prompt_id == 1:
                 flyer_files = glob.glob(f"voter_data/flyers/flyer_*{constituency.lower()}*.pdf")
@@ -146,10 +311,9 @@ with tab2:
     diag_id = selected_diag[0]
 
     if st.button("\U0001F4AC Generate Insight"):
-        os.environ['VOTER_ID'] = voter_id
-        result = os.popen(f"python3 prompt_{diag_id}.py").read()
+        result = run_prompt(diag_id, {"voter_id": voter_id})
         with st.expander("View Output"):
-            st.code(result)
+            st.code(result["log"] or result["message"])
 
 # === TAB 3 ===
 with tab3:
@@ -207,17 +371,13 @@ with tab3:
         selected_slide_ids = [slide_dict[label] for label in selected_slide_labels]
 
     if st.button("📋 Generate Asset"):
-        os.environ['CONSTITUENCY_NAME'] = constituency
-        os.environ['VARIANT_CHOICE'] = 'r'
+        params = {"constituency_name": constituency, "variant_choice": 'r'}
         if strategy_id == 31:
-            os.environ['SELECTED_SLIDES'] = ",".join(selected_slide_ids)
+            params["selected_slides"] = ",".join(selected_slide_ids)
 
         if strategy_id in [31, 32]:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM candidates WHERE LOWER(constituency) = LOWER(?) AND is_opponent = 0 LIMIT 1", (constituency.lower(),))
-            row = cursor.fetchone()
-            os.environ['CANDIDATE_NAME'] = row[0] if row else "unknown"
+            row = db_query("SELECT name FROM candidates WHERE LOWER(constituency) = LOWER(?) AND is_opponent = 0 LIMIT 1", (constituency.lower(),), one=True)
+            params["candidate_name"] = row[0] if row else "unknown"
 
         # ✅ Show rationale block for Prompt 31
         if strategy_id == 31:
@@ -225,25 +385,15 @@ with tab3:
             if rationale:
                 st.markdown(f"### 🧠 Rationale:\n{rationale}")
 
-        output = os.popen(f"python3 prompt_{strategy_id}.py").read()
-        st.markdown("### 🧠 Output:")
-        st.code(output)
+        if strategy_id in BACKGROUND_PROMPTS:
+            job_id = asset_jobs.submit(strategy_id, params)
+            st.info(f"🚀 Job #{job_id} submitted — you can keep working or refresh; progress appears below.")
+        else:
+            result = run_prompt(strategy_id, params)
+            st.markdown("### 🧠 Output:")
+            st.code(result["log"] + result["message"])
 
-        if strategy_id == 31:
-            constituency_slug = constituency.lower().replace(" ", "_")
-            files = glob.glob(f"voter_data/pitch_decks/pd_*_{constituency_slug}_*.pdf")
-            files.sort(reverse=True)
-            
-            if files:
-                with open(files[0], "rb") as f:
-                    st.download_button("📥 Download Pitch Deck", data=f, file_name=os.path.basename(files[0]), mime="application/pdf")
-
-        elif strategy_id == 32:
-            files = glob.glob("voter_data/videos/cv_*.mp4")
-            files.sort(reverse=True)
-            if files:
-                with open(files[0], "rb") as f:
-                    st.download_button("🎬 Download Campaign Video", data=f, file_name=os.path.basename(files[0]), mime="video/mp4")
+    poll_jobs = strategy_id in BACKGROUND_PROMPTS and render_asset_jobs(strategy_id, constituency)
 
 
 # === Bilingual Disclaimer Footer ===
@@ -263,3 +413,8 @@ The system can be customized with actual data under formal engagement and compli
 ನೈಜ ಡೇಟಾವನ್ನು ಬಳಸಿ ವೈಯಕ್ತಿಕೀಕೃತ ಪದ್ದತಿಗೆ, ಒಪ್ಪಂದದ ಆಧಾರದ ಮೇಲೆ ವ್ಯವಸ್ಥೆ ರೂಪಿಸಬಹುದು.
 </p>
 """, unsafe_allow_html=True)
+
+# Keep polling background jobs after the page has fully rendered
+if poll_jobs:
+    time.sleep(JOB_POLL_SECONDS)
+    st.rerun()
@@ -0,0 +1,275 @@
+# hashtag_index.py — Parsed hashtag index over social_posts
+#
+# Each post's raw hashtag string is parsed once into hashtag_postings rows
+# (post, tag, voter, constituency, booth, posted_at), so "top hashtags for a
+# voter / booth / constituency" is an index range read instead of a scan that
+# re-parses every hashtags column. Constituency and booth come from the
+# voter's voter_enriched_demo row at indexing time; triggers there re-queue a
+# voter's posts when the voter is added, moved or removed.
+#
+# Triggers on social_posts only queue changed rowids in hashtag_index_pending;
+# sync() parses the queued posts. It runs after every bulk ingest (ingest.py)
+# and from "python3 hashtag_index.py sync" (cron) for other writers. The query
+# helpers below only read the index and never take the write lock, so posts
+# written outside ingest show up after the next sync.
+#
+# Postings are keyed by social_posts.rowid. The table has no INTEGER PRIMARY
+# KEY, so VACUUM may renumber its rowids: run "rebuild" after a VACUUM.
+# Installed by migration 005 (migrate.py).
+#
+#   python3 hashtag_index.py sync                       # index queued posts
+#   python3 hashtag_index.py rebuild                    # re-index every post
+#   python3 hashtag_index.py status                     # posts waiting for sync
+#   python3 hashtag_index.py top <constituency> [days]  # top hashtags
+#   python3 hashtag_index.py voter <voter_id>           # one voter's hashtags
+
+import json
+import re
+import sys
+from datetime import datetime, timedelta
+
+from common import execute_script, query, write_conn
+
+SYNC_BATCH = 2000
+# social_posts timestamp column, if the table has one (first match wins)
+TIME_COLUMNS = ("posted_at", "created_at", "timestamp", "post_date")
+TAG_RE = re.compile(r"#([^\s#.,;:!?\"'()\[\]{}<>]+)")
+SPLIT_RE = re.compile(r"[,;\s]+")
+
+DDL = """
+CREATE TABLE IF NOT EXISTS hashtag_postings (
+    post_rowid INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    uses INTEGER NOT NULL DEFAULT 1,
+    voter_id TEXT,
+    constituency_key TEXT,
+    booth_key TEXT,
+    posted_at TEXT,
+    PRIMARY KEY (tag, post_rowid)
+);
+CREATE INDEX IF NOT EXISTS idx_hashtag_postings_post ON hashtag_postings (post_rowid);
+CREATE INDEX IF NOT EXISTS idx_hashtag_postings_voter ON hashtag_postings (voter_id, tag, uses);
+CREATE INDEX IF NOT EXISTS idx_hashtag_postings_area ON hashtag_postings (constituency_key, booth_key, posted_at, tag, uses);
+CREATE INDEX IF NOT EXISTS idx_hashtag_postings_tag ON hashtag_postings (tag, constituency_key, posted_at);
+
+CREATE TABLE IF NOT EXISTS hashtag_index_pending (post_rowid INTEGER PRIMARY KEY);
+
+CREATE TRIGGER IF NOT EXISTS trg_hashtag_pending_ins AFTER INSERT ON social_posts BEGIN
+    INSERT OR IGNORE INTO hashtag_index_pending (post_rowid) VALUES (NEW.rowid);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_hashtag_pending_upd AFTER UPDATE ON social_posts BEGIN
+    INSERT OR IGNORE INTO hashtag_index_pending (post_rowid) VALUES (OLD.rowid);
+    INSERT OR IGNORE INTO hashtag_index_pending (post_rowid) VALUES (NEW.rowid);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_hashtag_pending_del AFTER DELETE ON social_posts BEGIN
+    INSERT OR IGNORE INTO hashtag_index_pending (post_rowid) VALUES (OLD.rowid);
+END;
+"""
+
+# Postings copy the voter's constituency and booth, so voter changes re-queue their posts
+VOTER_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS trg_hashtag_voter_ins AFTER INSERT ON voter_enriched_demo BEGIN
+    INSERT OR IGNORE INTO hashtag_index_pending (post_rowid)
+    SELECT rowid FROM social_posts WHERE voter_id = NEW.voter_id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_hashtag_voter_upd
+AFTER UPDATE OF voter_id, constituency, booth_location ON voter_enriched_demo BEGIN
+    INSERT OR IGNORE INTO hashtag_index_pending (post_rowid)
+    SELECT rowid FROM social_posts WHERE voter_id IN (OLD.voter_id, NEW.voter_id);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_hashtag_voter_del AFTER DELETE ON voter_enriched_demo BEGIN
+    INSERT OR IGNORE INTO hashtag_index_pending (post_rowid)
+    SELECT rowid FROM social_posts WHERE voter_id = OLD.voter_id;
+END;
+"""
+
+def parse_hashtags(text):
+    """
+    Returns {tag: uses} for a raw hashtags string. Tags are lower-cased
+    without the leading '#'; strings without any '#' are treated as a
+    comma/space separated tag list.
+    """
+    if not text:
+        return {}
+    tags = TAG_RE.findall(text) if "#" in text else SPLIT_RE.split(text)
+    counts = {}
+    for tag in tags:
+        tag = tag.strip().lower()
+        if tag:
+            counts[tag] = counts.get(tag, 0) + 1
+    return counts
+
+# === Maintenance ===
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def installed(conn=None):
+    sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'hashtag_postings'"
+    return (conn.execute(sql).fetchone() if conn else query(sql, one=True)) is not None
+
+def install(conn):
+    # Runs inside the caller's transaction; every existing post is queued
+    execute_script(conn, DDL)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'voter_enriched_demo'").fetchone():
+        execute_script(conn, VOTER_TRIGGERS)
+    conn.execute("INSERT OR IGNORE INTO hashtag_index_pending (post_rowid) SELECT rowid FROM social_posts")
+
+def queue_loaded(conn, table, first_rowid):
+    """
+    Queues what the triggers would have for rows of table inserted from
+    first_rowid on while they were suspended (ingest.py --bulk). Runs inside
+    the caller's transaction.
+    """
+    if table == "social_posts":
+        conn.execute("INSERT OR IGNORE INTO hashtag_index_pending (post_rowid) SELECT rowid FROM social_posts WHERE rowid >= ?",
+                     (first_rowid,))
+    elif table == "voter_enriched_demo":
+        conn.execute("""
+            INSERT OR IGNORE INTO hashtag_index_pending (post_rowid)
+            SELECT rowid FROM social_posts WHERE voter_id IN (SELECT voter_id FROM voter_enriched_demo WHERE rowid >= ?)
+        """, (first_rowid,))
+
+def _source_sql(conn):
+    cols = _columns(conn, "social_posts")
+    time_col = next((c for c in TIME_COLUMNS if c in cols), None)
+    posted_at = f"p.{time_col}" if time_col else "NULL"
+    fallback = "p.constituency" if "constituency" in cols else "NULL"
+    return f"""
+        SELECT p.rowid, p.voter_id, p.hashtags, {posted_at},
+               LOWER(COALESCE((SELECT v.constituency FROM voter_enriched_demo v WHERE v.voter_id = p.voter_id LIMIT 1), {fallback})),
+               (SELECT COALESCE(v.booth_location, '') FROM voter_enriched_demo v WHERE v.voter_id = p.voter_id LIMIT 1)
+        FROM social_posts p
+        WHERE p.rowid IN (SELECT value FROM json_each(?))
+    """
+
+def sync(conn=None, batch=SYNC_BATCH):
+    """
+    Indexes posts queued by the social_posts triggers. Returns the number of
+    posts processed.
+    """
+    conn = conn or write_conn()
+    if not installed(conn):
+        return 0
+    source = _source_sql(conn)
+    processed = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [row[0] for row in conn.execute(
+                "SELECT post_rowid FROM hashtag_index_pending ORDER BY post_rowid LIMIT ?", (batch,)
+            )]
+            if not ids:
+                conn.commit()
+                return processed
+            id_list = json.dumps(ids)
+            conn.execute("DELETE FROM hashtag_postings WHERE post_rowid IN (SELECT value FROM json_each(?))", (id_list,))
+            postings = []
+            for rowid, voter_id, hashtags, posted_at, constituency_key, booth_key in conn.execute(source, (id_list,)).fetchall():
+                for tag, uses in parse_hashtags(hashtags).items():
+                    postings.append((rowid, tag, uses, voter_id, constituency_key, booth_key, posted_at))
+            conn.executemany("""
+                INSERT INTO hashtag_postings (post_rowid, tag, uses, voter_id, constituency_key, booth_key, posted_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, postings)
+            conn.execute("DELETE FROM hashtag_index_pending WHERE post_rowid IN (SELECT value FROM json_each(?))", (id_list,))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        processed += len(ids)
+
+def rebuild(conn=None):
+    conn = conn or write_conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM hashtag_postings")
+        conn.execute("INSERT OR IGNORE INTO hashtag_index_pending (post_rowid) SELECT rowid FROM social_posts")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return sync(conn)
+
+def pending():
+    return query("SELECT COUNT(*) FROM hashtag_index_pending", one=True)[0] if installed() else 0
+
+# === Query helpers ===
+def _window(days=None, since=None, until=None):
+    if days is not None:
+        since = (datetime.now() - timedelta(days=float(days))).isoformat(sep=" ", timespec="seconds")
+    clauses, params = [], []
+    if since:
+        clauses.append("posted_at >= ?")
+        params.append(since)
+    if until:
+        clauses.append("posted_at < ?")
+        params.append(until)
+    return "".join(f" AND {c}" for c in clauses), params
+
+def _top(where, params, limit, days, since, until):
+    window, window_params = _window(days, since, until)
+    rows = query(f"""
+        SELECT tag, SUM(uses) AS uses, COUNT(DISTINCT post_rowid) AS posts, COUNT(DISTINCT voter_id) AS voters
+        FROM hashtag_postings
+        WHERE {where}{window}
+        GROUP BY tag
+        ORDER BY uses DESC, tag
+        LIMIT ?
+    """, (*params, *window_params, int(limit)))
+    return [{"tag": tag, "uses": uses, "posts": posts, "voters": voters} for tag, uses, posts, voters in rows]
+
+def top_hashtags_for_voter(voter_id, limit=10, days=None, since=None, until=None):
+    return _top("voter_id = ?", (voter_id,), limit, days, since, until)
+
+def top_hashtags_for_booth(constituency, booth, limit=10, days=None, since=None, until=None):
+    return _top("constituency_key = ? AND booth_key = ?", (constituency.lower(), booth or ""), limit, days, since, until)
+
+def top_hashtags_for_constituency(constituency, limit=10, days=None, since=None, until=None):
+    return _top("constituency_key = ?", (constituency.lower(),), limit, days, since, until)
+
+def booths_for_hashtag(tag, constituency, limit=10, days=None, since=None, until=None):
+    """
+    Booths of a constituency where tag is used most — the "buzz areas" for it.
+    """
+    window, window_params = _window(days, since, until)
+    rows = query(f"""
+        SELECT booth_key, SUM(uses) AS uses, COUNT(DISTINCT voter_id) AS voters
+        FROM hashtag_postings
+        WHERE tag = ? AND constituency_key = ?{window}
+        GROUP BY booth_key
+        ORDER BY uses DESC, booth_key
+        LIMIT ?
+    """, (tag.lstrip("#").lower(), constituency.lower(), *window_params, int(limit)))
+    return [{"booth": booth or None, "uses": uses, "voters": voters} for booth, uses, voters in rows]
+
+def voter_hashtags(voter_id):
+    """
+    The voter's hashtags as a "#a #b" string (most used first), or None when
+    the index isn't installed.
+    """
+    if not installed():
+        return None
+    return " ".join(f"#{t['tag']}" for t in top_hashtags_for_voter(voter_id, limit=50))
+
+# === MAIN ===
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "sync"
+    if command in ("sync", "rebuild") and not installed():
+        print("⚠️ Hashtag index not installed — run: python3 migrate.py")
+        exit(1)
+    if command == "sync":
+        print(f"✅ Indexed {sync()} post(s).")
+    elif command == "status":
+        print(f"ℹ️ {pending()} post(s) waiting for the next sync." if installed() else "⚠️ Hashtag index not installed.")
+    elif command == "rebuild":
+        print(f"✅ Re-indexed {rebuild()} post(s).")
+    elif command == "top" and len(sys.argv) > 2:
+        days = sys.argv[3] if len(sys.argv) > 3 else None
+        for t in top_hashtags_for_constituency(sys.argv[2], limit=20, days=days):
+            print(f"#{t['tag']}: {t['uses']} uses, {t['posts']} posts, {t['voters']} voters")
+    elif command == "voter" and len(sys.argv) > 2:
+        for t in top_hashtags_for_voter(sys.argv[2], limit=50):
+            print(f"#{t['tag']}: {t['uses']}")
+    else:
+        print("❌ Usage: python3 hashtag_index.py [sync|rebuild|status|top <constituency> [days]|voter <voter_id>]")
+        exit(1)
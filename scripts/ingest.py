@@ -0,0 +1,456 @@
+# ingest.py — Streaming bulk loader for voter and social data
+#
+# Streams a CSV or JSONL file (or stdin) in chunks, validates and normalizes
+# each record, and inserts with executemany inside large transactions. The
+# number of input records consumed is stored in ingest_checkpoints in the same
+# transaction as the rows, so an interrupted load resumes exactly where it
+# stopped. Rejected records go to <source>.rejects.jsonl with the reason.
+#
+#   python3 ingest.py voter_enriched_demo voters.csv
+#   python3 ingest.py social_posts posts.jsonl --defer-indexes
+#   python3 ingest.py campaign_quotes - --format jsonl < quotes.jsonl
+#   python3 ingest.py social_posts posts.jsonl --restart   # ignore the checkpoint
+#   python3 ingest.py voter_enriched_demo voters.csv --bulk
+#
+# --defer-indexes drops the table's secondary indexes for the load and rebuilds
+# them at the end; their SQL is kept in ingest_deferred_indexes so a crashed
+# load restores them on the next run.
+#
+# --bulk also drops the table's derived-data triggers (rollups, hashtag index,
+# context index, snapshot tracking) for the load. At the end they are
+# recreated and the derived tables caught up once: rollups rebuilt, loaded
+# rows queued for the indexes and their snapshot partitions marked dirty. The
+# triggers are kept in ingest_suspended_triggers, so a crashed load restores
+# them (and catches up) on the next run, like deferred indexes.
+
+import csv
+import json
+import os
+import sys
+import time
+
+import hashtag_index
+import retriever
+import rollups
+import snapshot_export
+from common import write_conn
+
+CHUNK_ROWS = 5000
+COMMIT_ROWS = 50000
+LOAD_CACHE_SIZE_KB = 262144   # 256 MB page cache while loading
+# Set for the load and restored afterwards
+LOAD_PRAGMAS = {
+    "cache_size": -LOAD_CACHE_SIZE_KB,
+    # No fsync per commit: a killed or crashed load resumes from its
+    # checkpoint (a power cut during the load may need a reload)
+    "synchronous": 0,
+    "temp_store": 2,                            # index rebuilds sort in memory
+    "journal_size_limit": 64 * 1024 * 1024,     # truncate the WAL the large transactions grow
+}
+# Name prefixes of triggers maintaining derived tables, dropped by --bulk
+DERIVED_TRIGGERS = ("trg_booth_rollup_", "trg_post_rollup_", "trg_hashtag_", "trg_context_", "trg_snapshot_")
+
+def _text(value):
+    value = str(value).strip()
+    return value or None
+
+def _int(value):
+    return int(float(value))
+
+def _flag(value):
+    text = str(value).strip().lower()
+    if text in ("1", "true", "yes", "y", "t"):
+        return 1
+    if text in ("0", "false", "no", "n", "f"):
+        return 0
+    raise ValueError(f"not a yes/no value: {value!r}")
+
+def _float(value):
+    return float(value)
+
+# Known columns per table: (normalizer, required). Other columns present in
+# both the input and the table are loaded as trimmed text.
+TABLES = {
+    "voter_enriched_demo": {
+        "voter_id": (_text, True),
+        "constituency": (_text, True),
+        "is_group_admin": (_flag, False),
+        "followers_estimated": (_int, False),
+    },
+    "social_posts": {
+        "voter_id": (_text, True),
+        "hashtags": (_text, False),
+        "sentiment_score": (_float, False),
+    },
+    "campaign_quotes": {
+        "constituency": (_text, True),
+        "quote": (_text, True),
+    },
+    "digital_campaigns": {
+        "constituency": (_text, True),
+        "platform": (_text, True),
+        "followers": (_int, False),
+    },
+}
+
+# === Input ===
+def read_records(stream, fmt):
+    """
+    Yields (record, error) per input record; error is set for lines that
+    could not be parsed.
+    """
+    if fmt == "csv":
+        for row in csv.DictReader(stream):
+            yield {k.strip(): v for k, v in row.items() if k}, None
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield {"_raw": line.rstrip("\n")}, f"invalid JSON: {e}"
+            continue
+        yield (record, None) if isinstance(record, dict) else ({"_raw": record}, "not a JSON object")
+
+def _detect_format(path, fmt):
+    if fmt:
+        return fmt
+    return "jsonl" if path.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+# === Normalization ===
+class Normalizer:
+    def __init__(self, conn, table):
+        self.columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if not self.columns:
+            raise SystemExit(f"❌ Table {table} does not exist in this database.")
+        self.spec = {k: v for k, v in TABLES.get(table, {}).items() if k in self.columns}
+        # Canonical constituency names, matched case-insensitively
+        self.constituencies = {}
+        if "constituency" in self.columns:
+            self.constituencies = {name.lower(): name for (name,) in conn.execute("SELECT name FROM constituencies")}
+
+    def target_columns(self, record):
+        return [c for c in self.columns if c in record]
+
+    def normalize(self, record, columns):
+        values = []
+        for column in columns:
+            normalize, required = self.spec.get(column, (_text, False))
+            raw = record.get(column)
+            if raw is None or (isinstance(raw, str) and not raw.strip()):
+                if required:
+                    raise ValueError(f"missing {column}")
+                values.append(None)
+                continue
+            try:
+                value = normalize(raw)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"bad {column}: {e}")
+            if column == "constituency" and self.constituencies:
+                if value.lower() not in self.constituencies:
+                    raise ValueError(f"unknown constituency {value!r}")
+                value = self.constituencies[value.lower()]
+            values.append(value)
+        for column, (_, required) in self.spec.items():
+            if required and column not in columns:
+                raise ValueError(f"missing {column}")
+        return tuple(values)
+
+# === Checkpoints & deferred indexes ===
+def _ensure_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+            source TEXT NOT NULL,
+            target_table TEXT NOT NULL,
+            source_size INTEGER,
+            source_mtime REAL,
+            records_done INTEGER NOT NULL DEFAULT 0,
+            inserted INTEGER NOT NULL DEFAULT 0,
+            rejected INTEGER NOT NULL DEFAULT 0,
+            finished INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL,
+            PRIMARY KEY (source, target_table)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_deferred_indexes (
+            name TEXT PRIMARY KEY,
+            target_table TEXT NOT NULL,
+            sql TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_suspended_triggers (
+            name TEXT PRIMARY KEY,
+            target_table TEXT NOT NULL,
+            sql TEXT NOT NULL,
+            first_rowid INTEGER NOT NULL
+        )
+    """)
+    conn.commit()
+
+def _load_checkpoint(conn, source, table, size, mtime, restart):
+    row = conn.execute("""
+        SELECT source_size, source_mtime, records_done, inserted, rejected, finished
+        FROM ingest_checkpoints WHERE source = ? AND target_table = ?
+    """, (source, table)).fetchone()
+    if restart or not row or (row[0], row[1]) != (size, mtime):
+        # New source, changed file or explicit restart: start from the top
+        conn.execute("""
+            INSERT INTO ingest_checkpoints (source, target_table, source_size, source_mtime, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (source, target_table) DO UPDATE SET
+                source_size = excluded.source_size, source_mtime = excluded.source_mtime,
+                records_done = 0, inserted = 0, rejected = 0, finished = 0, updated_at = excluded.updated_at
+        """, (source, table, size, mtime, time.time()))
+        conn.commit()
+        return 0, 0, 0, False
+    return row[2], row[3], row[4], bool(row[5])
+
+def _drop_indexes(conn, table):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for name, sql in conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+        ).fetchall():
+            if sql.upper().startswith("CREATE UNIQUE"):
+                continue   # constraints stay enforced during the load
+            conn.execute("INSERT OR REPLACE INTO ingest_deferred_indexes (name, target_table, sql) VALUES (?, ?, ?)",
+                         (name, table, sql))
+            conn.execute(f"DROP INDEX {name}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def restore_indexes(conn, table=None):
+    """
+    Recreates indexes dropped by --defer-indexes (also after a crashed load).
+    """
+    rows = conn.execute(
+        "SELECT name, sql FROM ingest_deferred_indexes WHERE ? IS NULL OR target_table = ?", (table, table)
+    ).fetchall()
+    for name, sql in rows:
+        started = time.time()
+        conn.execute(sql.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1))
+        conn.execute("DELETE FROM ingest_deferred_indexes WHERE name = ?", (name,))
+        conn.commit()
+        print(f"🔧 Rebuilt index {name} in {time.time() - started:.1f}s")
+    return len(rows)
+
+def _suspend_triggers(conn, table):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Rows from here on are loaded without the triggers
+        first_rowid = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) + 1 FROM {table}").fetchone()[0]
+        for name, sql in conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?", (table,)
+        ).fetchall():
+            if not name.startswith(DERIVED_TRIGGERS):
+                continue
+            conn.execute("INSERT OR REPLACE INTO ingest_suspended_triggers (name, target_table, sql, first_rowid) VALUES (?, ?, ?, ?)",
+                         (name, table, sql, first_rowid))
+            conn.execute(f"DROP TRIGGER {name}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def resume_triggers(conn, table=None):
+    """
+    Recreates triggers dropped by --bulk (also after a crashed load) and
+    catches their derived tables up with the rows loaded without them.
+    """
+    rows = conn.execute(
+        "SELECT name, target_table, sql, first_rowid FROM ingest_suspended_triggers WHERE ? IS NULL OR target_table = ?",
+        (table, table)
+    ).fetchall()
+    if not rows:
+        return 0
+    started = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        loads = {}
+        for name, target, sql, first_rowid in rows:
+            conn.execute(sql.replace("CREATE TRIGGER", "CREATE TRIGGER IF NOT EXISTS", 1))
+            conn.execute("DELETE FROM ingest_suspended_triggers WHERE name = ?", (name,))
+            loads.setdefault((target, first_rowid), set()).add(name)
+        for (target, first_rowid), names in loads.items():
+            def suspended(*prefixes):
+                return any(name.startswith(prefixes) for name in names)
+            if suspended("trg_booth_rollup_", "trg_post_rollup_"):
+                rollups.rebuild(conn, [t for t in rollups.installed(conn) if rollups.SOURCE_TABLE[t] == target])
+            if suspended("trg_hashtag_"):
+                hashtag_index.queue_loaded(conn, target, first_rowid)
+            if suspended("trg_context_"):
+                retriever.queue_loaded(conn, target, first_rowid)
+            if suspended("trg_snapshot_"):
+                snapshot_export.mark_loaded(conn, target, first_rowid)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    print(f"🔧 Restored {len(rows)} trigger(s) and caught up derived tables in {time.time() - started:.1f}s")
+    return len(rows)
+
+def _set_pragmas(conn, values):
+    previous = {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in values}
+    for name, value in values.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return previous
+
+def _trim_rejects(path, records_done):
+    """
+    Drops rejects logged for records after the checkpoint (written before a
+    crash but not committed), so a resumed load doesn't log them twice.
+    """
+    if not os.path.exists(path):
+        return
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(path, encoding="utf-8") as src, open(tmp, "w", encoding="utf-8") as dst:
+        for line in src:
+            try:
+                if json.loads(line)["record"] > records_done:
+                    continue
+            except (ValueError, KeyError, TypeError):
+                # Partial line from the crash
+                continue
+            dst.write(line)
+    os.replace(tmp, path)
+
+# === Load ===
+def ingest(table, path, fmt=None, restart=False, defer_indexes=False, bulk=False,
+           chunk_rows=CHUNK_ROWS, commit_rows=COMMIT_ROWS):
+    """
+    Loads path ("-" for stdin) into table. bulk implies defer_indexes and
+    also suspends the derived-data triggers. Returns a stats dict.
+    """
+    conn = write_conn()
+    _ensure_tables(conn)
+    # Leftovers from an interrupted --defer-indexes / --bulk load
+    restore_indexes(conn)
+    resume_triggers(conn)
+    normalizer = Normalizer(conn, table)
+    fmt = _detect_format(path, fmt)
+
+    from_stdin = path == "-"
+    source = "<stdin>" if from_stdin else os.path.abspath(path)
+    size, mtime = (None, None) if from_stdin else (os.path.getsize(path), os.path.getmtime(path))
+    skip, inserted, rejected, finished = (0, 0, 0, False) if from_stdin else \
+        _load_checkpoint(conn, source, table, size, mtime, restart)
+    if finished:
+        print(f"✅ {path} was already loaded into {table} ({inserted} rows). Use --restart to load it again.")
+        return {"inserted": inserted, "rejected": rejected, "records": skip, "skipped": skip}
+    if skip:
+        print(f"♻️  Resuming {path} after {skip} records ({inserted} inserted, {rejected} rejected so far)")
+
+    if defer_indexes or bulk:
+        _drop_indexes(conn, table)
+    if bulk:
+        _suspend_triggers(conn, table)
+    saved_pragmas = _set_pragmas(conn, LOAD_PRAGMAS)
+
+    stream = sys.stdin if from_stdin else open(path, newline="" if fmt == "csv" else None, encoding="utf-8")
+    rejects_path = f"{path}.rejects.jsonl"
+    if skip and not from_stdin:
+        _trim_rejects(rejects_path, skip)
+    rejects = None if from_stdin else open(rejects_path, "a" if skip else "w", encoding="utf-8")
+    records_done = skip
+    started = time.time()
+    loaded_now = 0
+    pending = {}          # column tuple -> rows, flushed per chunk
+    pending_rows = since_commit = 0
+
+    def flush():
+        nonlocal pending_rows
+        for columns, rows in pending.items():
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+            )
+        pending.clear()
+        pending_rows = 0
+
+    def commit():
+        nonlocal since_commit
+        flush()
+        if not from_stdin:
+            conn.execute("""
+                UPDATE ingest_checkpoints SET records_done = ?, inserted = ?, rejected = ?, updated_at = ?
+                WHERE source = ? AND target_table = ?
+            """, (records_done, inserted, rejected, time.time(), source, table))
+        conn.commit()
+        since_commit = 0
+        elapsed = max(time.time() - started, 1e-6)
+        print(f"⏳ {records_done} records — {inserted} inserted, {rejected} rejected — {loaded_now / elapsed:,.0f} rows/s")
+
+    try:
+        for position, (record, error) in enumerate(read_records(stream, fmt)):
+            if position < skip:
+                continue
+            records_done = position + 1
+            try:
+                if error:
+                    raise ValueError(error)
+                columns = tuple(normalizer.target_columns(record))
+                values = normalizer.normalize(record, columns)
+            except ValueError as e:
+                rejected += 1
+                if rejects:
+                    rejects.write(json.dumps({"record": position + 1, "reason": str(e), "data": record},
+                                             ensure_ascii=False, default=str) + "\n")
+                continue
+            pending.setdefault(columns, []).append(values)
+            pending_rows += 1
+            since_commit += 1
+            inserted += 1
+            loaded_now += 1
+            if pending_rows >= chunk_rows:
+                flush()
+            if since_commit >= commit_rows:
+                commit()
+        commit()
+        if not from_stdin:
+            conn.execute("UPDATE ingest_checkpoints SET finished = 1 WHERE source = ? AND target_table = ?", (source, table))
+            conn.commit()
+    except BaseException:
+        conn.rollback()
+        _set_pragmas(conn, saved_pragmas)
+        raise
+    finally:
+        if not from_stdin:
+            stream.close()
+        if rejects:
+            rejects.close()
+
+    try:
+        if defer_indexes or bulk:
+            restore_indexes(conn, table)
+        if bulk:
+            resume_triggers(conn, table)
+        if table in ("social_posts", "voter_enriched_demo"):
+            # Voter rows re-queue their posts: their constituency/booth is copied into postings
+            print(f"🏷️  Hashtag index: {hashtag_index.sync(conn)} post(s) indexed")
+        if table in ("social_posts", "campaign_quotes"):
+            print(f"🔎 Context index: {retriever.sync(conn)} row(s) indexed")
+    finally:
+        _set_pragmas(conn, saved_pragmas)
+    conn.execute("PRAGMA optimize")
+
+    elapsed = max(time.time() - started, 1e-6)
+    print(f"✅ Loaded {loaded_now} rows into {table} in {elapsed:.1f}s ({loaded_now / elapsed:,.0f} rows/s); "
+          f"{rejected} rejected in total.")
+    return {"inserted": inserted, "rejected": rejected, "records": records_done, "skipped": skip}
+
+# === MAIN ===
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    flags = {a for a in args if a in ("--restart", "--defer-indexes", "--bulk")}
+    fmt = args[args.index("--format") + 1] if "--format" in args and args.index("--format") + 1 < len(args) else None
+    positional = [a for i, a in enumerate(args)
+                  if not a.startswith("--") and not (i > 0 and args[i - 1] == "--format")]
+    if len(positional) != 2 or fmt not in (None, "csv", "jsonl"):
+        print("❌ Usage: python3 ingest.py <table> <file.csv|file.jsonl|-> [--format csv|jsonl] [--defer-indexes | --bulk] [--restart]")
+        exit(1)
+    ingest(positional[0], positional[1], fmt=fmt, restart="--restart" in flags,
+           defer_indexes="--defer-indexes" in flags, bulk="--bulk" in flags)
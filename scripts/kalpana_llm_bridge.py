@@ -1,33 +1,667 @@
+import glob
+import hashlib
+import json
+import os
+import queue
+import re
+import signal
+import sqlite3
 import subprocess
 import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import llm_cache
+import llm_metrics
+import llm_queue
 
 LLAMA_BIN = "/root/llama.cpp/build/bin/llama-cli"
+LLAMA_BATCHED_BIN = "/root/llama.cpp/build/bin/llama-batched"
+LLAMA_SERVER_BIN = "/root/llama.cpp/build/bin/llama-server"
 MODEL_PATH = "/root/llama.cpp/models/mistral-7b-instruct-v0.1.Q4_K_M.gguf"
 MAX_TOKENS = "300"
 DELIMITER = "\n=== RESPONSE START ===\n"
+# Failed calls return (or stream) text starting with this marker instead of raising
+LLM_ERROR = "[LLM ERROR]"
+
+# Backend selection: "server" keeps one llama-server process warm across calls
+# (and across prompt_N.py processes); "cli" is the original one-shot llama-cli path.
+LLM_BACKEND = os.environ.get("KALPANA_LLM_BACKEND", "server").strip().lower()
+SERVER_HOST = os.environ.get("KALPANA_LLM_HOST", "127.0.0.1")
+SERVER_PORT = int(os.environ.get("KALPANA_LLM_PORT", "8088"))
+SERVER_CTX = os.environ.get("KALPANA_LLM_CTX", "4096")
+# Parallel decoding slots, split evenly across the llm_queue workers; call_llama_n()
+# decodes up to one worker's share of variants in one batch
+SERVER_SLOTS = int(os.environ.get("KALPANA_LLM_SLOTS", "3"))
+SERVER_PID_FILE = os.path.join(tempfile.gettempdir(), f"kalpana_llama_server_{SERVER_PORT}.pid")
+SERVER_LOG_FILE = os.path.join(tempfile.gettempdir(), f"kalpana_llama_server_{SERVER_PORT}.log")
+# Saved KV state of shared prompt-template prefixes (see prefix_cache_path)
+PREFIX_CACHE_DIR = os.environ.get("KALPANA_LLM_PREFIX_CACHE", "voter_data/prompt_cache")
+PREFIX_CACHE_MAX_AGE_DAYS = 30
+SERVER_START_TIMEOUT = 120
+REQUEST_TIMEOUT = 600
+
+_server_lock = threading.Lock()
+
+def is_llm_error(text):
+    return text.startswith(LLM_ERROR)
 
-def call_llama(prompt):
+def call_llama(prompt, use_cache=True, prefix=None, priority=None, prompt_id=None):
     try:
         # Add unique delimiter to mark where the model should begin responding
         full_prompt = prompt.strip() + DELIMITER
+        started = time.time()
+
+        key = _cache_key(full_prompt, -1, 0)
+        cached = _cache_get(key, use_cache)
+        if cached is not None:
+            _record_metrics(prompt_id, started, started, [], 1, cache_hit=True)
+            return cached
+
+        timings = []
+        # Wait for a free inference slot so concurrent callers don't thrash the CPU
+        with llm_queue.llm_slot(priority, label="call_llama") as job_id:
+            admitted = time.time()
+            if LLM_BACKEND == "server":
+                params = _server_prefix_params(full_prompt, prefix, _job_slots(job_id)[0])
+                response = extract_after_delimiter(
+                    _server_completion(full_prompt, timings, cache_prompt=True, **params))
+            else:
+                response = extract_after_delimiter(_cli_completion(full_prompt, prefix, timings))
+
+        _record_metrics(prompt_id, started, admitted, timings, 1)
+        _cache_put(key, response)
+        return response
+
+    except Exception as e:
+        return f"{LLM_ERROR} {e}"
+
+def call_llama_n(prompt, n=3, seeds=None, use_cache=True, prefix=None, priority=None, prompt_id=None):
+    """
+    Generates n variants for the same prompt, evaluating the prompt once and
+    decoding the variants as parallel sequences. Returns a list of n strings;
+    failed variants carry an LLM_ERROR string like call_llama.
+
+    prefix, when given, is the fixed template text the prompt starts with;
+    its evaluated state is cached on disk and only the rest is evaluated.
+    priority is "interactive" or "batch" (default from KALPANA_LLM_PRIORITY).
+    prompt_id labels the call in the llm_metrics report.
+    """
+    seeds = _pad_seeds(seeds, n)
+
+    try:
+        full_prompt = prompt.strip() + DELIMITER
+        started = time.time()
+
+        keys = [_cache_key(full_prompt, seed, i) for i, seed in enumerate(seeds)]
+        results = [_cache_get(key, use_cache) for key in keys]
+        missing = [i for i, r in enumerate(results) if r is None]
+        if not missing:
+            _record_metrics(prompt_id, started, started, [], n, cache_hit=True)
+            return results
 
-        # Write full prompt to a temporary file
-        with tempfile.NamedTemporaryFile(mode="w+", delete=False) as tmp:
-            tmp.write(full_prompt)
-            tmp_path = tmp.name
+        timings = []
+        # All variants decode as one batch, so they share a single queue slot
+        with llm_queue.llm_slot(priority, label=f"call_llama_n[{len(missing)}]") as job_id:
+            admitted = time.time()
+            if LLM_BACKEND == "server":
+                outputs = _server_completions(full_prompt, [seeds[i] for i in missing], _job_slots(job_id), prefix, timings)
+            else:
+                outputs = _cli_batched_completions(full_prompt, len(missing), seeds[missing[0]], timings)
+
+        _record_metrics(prompt_id, started, admitted, timings, len(missing), parallel=True)
+        for i, output in zip(missing, outputs):
+            results[i] = extract_after_delimiter(output)
+            _cache_put(keys[i], results[i])
+        return results
+
+    except Exception as e:
+        return [f"{LLM_ERROR} {e}"] * n
 
+def stream_llama(prompt, seed=-1, use_cache=True, prefix=None, priority=None, prompt_id=None):
+    """
+    Generator yielding response text pieces as llama.cpp emits them. The
+    concatenated pieces equal what call_llama would return before stripping.
+    A cache hit is yielded as a single piece without waiting for a queue slot.
+    """
+    full_prompt = prompt.strip() + DELIMITER
+    started = time.time()
+    cached = _cache_get(_cache_key(full_prompt, seed, 0), use_cache)
+    if cached is not None:
+        _record_metrics(prompt_id, started, started, [], 1, cache_hit=True)
+        yield cached
+        return
+
+    timings = []
+    hits = []
+    with _streaming_slot(priority, "stream_llama") as job_id:
+        admitted = time.time()
+        for piece in _stream_variant(full_prompt, seed, 0, use_cache, prefix, timings, _job_slots(job_id), hits):
+            _check_cancelled(job_id)
+            yield piece
+    _record_metrics(prompt_id, started, admitted, timings, 1, cache_hit=bool(hits))
+
+def stream_llama_n(prompt, n=3, seeds=None, use_cache=True, prefix=None, priority=None, prompt_id=None):
+    """
+    Streams n variants at once, yielding (variant_index, text_piece) tuples
+    in arrival order. Each variant ends with a (variant_index, None) marker.
+    Cached variants are yielded first, before waiting for a queue slot.
+    Cancelling the queue job (llm_queue.cancel) stops generation mid-stream.
+    """
+    seeds = _pad_seeds(seeds, n)
+    full_prompt = prompt.strip() + DELIMITER
+    started = time.time()
+    timings = []
+    # Variants another caller cached while this one waited for its slot
+    hits = []
+
+    missing = []
+    for i, seed in enumerate(seeds):
+        cached = _cache_get(_cache_key(full_prompt, seed, i), use_cache)
+        if cached is None:
+            missing.append(i)
+        else:
+            yield i, cached
+            yield i, None
+    if not missing:
+        _record_metrics(prompt_id, started, started, [], n, cache_hit=True)
+        return
+
+    with _streaming_slot(priority, f"stream_llama_n[{len(missing)}]") as job_id:
+        admitted = time.time()
+        if LLM_BACKEND != "server":
+            # One llama-cli process at a time; variants stream one after another
+            for i in missing:
+                try:
+                    for piece in _stream_variant(full_prompt, seeds[i], i, use_cache, prefix, timings, hits=hits):
+                        _check_cancelled(job_id)
+                        yield i, piece
+                except llm_queue.JobCancelled:
+                    raise
+                except Exception as e:
+                    yield i, f"{LLM_ERROR} {e}"
+                yield i, None
+            _record_metrics(prompt_id, started, admitted, timings, len(missing), cache_hit=len(hits) == len(missing))
+            return
+
+        events = queue.Queue()
+        stop = threading.Event()
+
+        def pump(i, seed):
+            try:
+                for piece in _stream_variant(full_prompt, seed, i, use_cache, prefix, timings, slots, hits):
+                    if stop.is_set():
+                        # Closing the response makes llama-server drop the task
+                        break
+                    events.put((i, piece))
+            except Exception as e:
+                events.put((i, f"{LLM_ERROR} {e}"))
+            events.put((i, None))
+
+        ensure_server()
+        slots = _job_slots(job_id)
+        workers = [threading.Thread(target=pump, args=(i, seeds[i]), daemon=True) for i in missing]
+        for w in workers:
+            w.start()
+
+        try:
+            remaining = len(missing)
+            while remaining:
+                try:
+                    i, piece = events.get(timeout=1.0)
+                except queue.Empty:
+                    # A stalled server still honours cancellation and the deadline
+                    _check_cancelled(job_id)
+                    continue
+                if piece is None:
+                    remaining -= 1
+                else:
+                    _check_cancelled(job_id)
+                yield i, piece
+        finally:
+            stop.set()
+    _record_metrics(prompt_id, started, admitted, timings, len(missing),
+                    cache_hit=len(hits) == len(missing), parallel=True)
+
+def _record_metrics(prompt_id, started, admitted, timings, variants, cache_hit=False, parallel=False):
+    now = time.time()
+    llm_metrics.record(
+        prompt_id=prompt_id,
+        backend=LLM_BACKEND,
+        variants=variants,
+        cache_hit=int(cache_hit),
+        queue_ms=round((admitted - started) * 1000, 1),
+        wall_ms=round((now - started) * 1000, 1),
+        **llm_metrics.combine(timings, parallel)
+    )
+
+_cancel_checked = {}
+
+@contextmanager
+def _streaming_slot(priority, label):
+    # llm_queue.llm_slot for the streaming calls, forgetting the job's last
+    # cancellation poll however the job leaves its slot
+    with llm_queue.llm_slot(priority, label=label) as job_id:
+        try:
+            yield job_id
+        finally:
+            _cancel_checked.pop(job_id, None)
+
+def _check_cancelled(job_id, interval=1.0):
+    # Enforces the job's run deadline, and polls the queue for a cancellation
+    # at most once per interval, while tokens stream in
+    llm_queue.check_deadline(job_id)
+    now = time.time()
+    if now - _cancel_checked.get(job_id, 0) < interval:
+        return
+    _cancel_checked[job_id] = now
+    if llm_queue.is_cancelled(job_id):
+        raise llm_queue.JobCancelled(f"LLM job {job_id} was cancelled")
+
+def _pad_seeds(seeds, n):
+    if seeds is None:
+        seeds = [-1] * n
+    return list(seeds)[:n] + [-1] * (n - len(seeds))
+
+def _stream_variant(full_prompt, seed, variant, use_cache, prefix=None, timings=None, slots=None, hits=None):
+    # hits, when given, collects the variant if it was served from the cache
+    key = _cache_key(full_prompt, seed, variant)
+    cached = _cache_get(key, use_cache)
+    if cached is not None:
+        if hits is not None:
+            hits.append(variant)
+        yield cached
+        return
+
+    if LLM_BACKEND == "server":
+        slots = slots or [0]
+        params = _server_prefix_params(full_prompt, prefix, slots[variant % len(slots)])
+        pieces = _server_stream(full_prompt, timings, seed=seed, cache_prompt=True, **params)
+    else:
+        pieces = _cli_stream(full_prompt, seed, prefix, timings)
+
+    received = []
+    for piece in pieces:
+        received.append(piece)
+        yield piece
+    _cache_put(key, extract_after_delimiter("".join(received)))
+
+# === Response cache ===
+def _cache_key(full_prompt, seed, variant):
+    # Variant index is part of the key so unseeded variants don't collapse into one entry
+    return llm_cache.make_key(full_prompt, MODEL_PATH, MAX_TOKENS, {"seed": seed, "variant": variant})
+
+def _cache_get(key, use_cache):
+    try:
+        return llm_cache.get(key, bypass=not use_cache)
+    except sqlite3.Error:
+        # A broken or locked cache must never block generation
+        return None
+
+def _cache_put(key, response):
+    if not response or is_llm_error(response):
+        return
+    try:
+        llm_cache.put(key, response)
+    except sqlite3.Error:
+        pass
+
+# === Prompt-prefix KV cache ===
+def _model_fingerprint():
+    try:
+        st = os.stat(MODEL_PATH)
+        ident = f"{os.path.abspath(MODEL_PATH)}:{st.st_size}:{int(st.st_mtime)}"
+    except OSError:
+        ident = os.path.abspath(MODEL_PATH)
+    return hashlib.sha256(ident.encode("utf-8")).hexdigest()[:16]
+
+def prefix_cache_path(prefix, kind):
+    """
+    On-disk state file for a template prefix. Files are named by model and
+    template hash, so editing the template or swapping/updating the model
+    simply misses; files left behind by an older model are pruned here.
+    kind is "session" (llama-cli --prompt-cache) or "slot" (llama-server).
+    """
+    os.makedirs(PREFIX_CACHE_DIR, exist_ok=True)
+    model_hash = _model_fingerprint()
+    template_hash = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+
+    cutoff = time.time() - PREFIX_CACHE_MAX_AGE_DAYS * 86400
+    for path in glob.glob(os.path.join(PREFIX_CACHE_DIR, "*.bin")):
+        stale_model = not os.path.basename(path).startswith(model_hash)
+        try:
+            if stale_model or os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+    return os.path.join(PREFIX_CACHE_DIR, f"{model_hash}_{template_hash}_{kind}.bin")
+
+def _usable_prefix(full_prompt, prefix):
+    if not prefix:
+        return None
+    prefix = prefix.strip()
+    return prefix if prefix and full_prompt.startswith(prefix) else None
+
+def _cli_prefix_args(full_prompt, prefix):
+    prefix = _usable_prefix(full_prompt, prefix)
+    if not prefix:
+        return []
+    path = prefix_cache_path(prefix, "session")
+    if not os.path.exists(path):
+        # Evaluate the prefix alone once; llama-cli saves the session before sampling
+        subprocess.run([
+            LLAMA_BIN,
+            "-m", MODEL_PATH,
+            "-p", prefix,
+            "-n", "1",
+            "--prompt-cache", path
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
+    if not os.path.exists(path):
+        return []
+    # Read-only so later runs never overwrite the prefix-only state with a full prompt
+    return ["--prompt-cache", path, "--prompt-cache-ro"]
+
+def _job_slots(job_id):
+    """
+    llama-server slots owned by the queue worker slot job_id holds. Workers
+    own disjoint slots, so a state restored into a slot stays there until
+    the job's own completion uses it, even with several jobs running.
+    """
+    per_worker = max(1, SERVER_SLOTS // llm_queue.LLM_WORKERS)
+    first = ((llm_queue.worker_of(job_id) or 0) * per_worker) % SERVER_SLOTS
+    return list(range(first, first + per_worker))
+
+def _server_prefix_params(full_prompt, prefix, slot):
+    prefix = _usable_prefix(full_prompt, prefix)
+    if not prefix:
+        return {}
+    ensure_server()
+    path = prefix_cache_path(prefix, "slot")
+    filename = os.path.basename(path)
+    try:
+        if not os.path.exists(path):
+            _post_json("/completion", {"prompt": prefix, "n_predict": 0, "id_slot": slot, "cache_prompt": True})
+            _post_json(f"/slots/{slot}?action=save", {"filename": filename})
+        else:
+            _post_json(f"/slots/{slot}?action=restore", {"filename": filename})
+    except (urllib.error.URLError, ConnectionError, KeyError, ValueError):
+        # Slot busy or save path unsupported: the call still works, just evaluates the full prompt
+        return {}
+    return {"id_slot": slot}
+
+def _cli_stream(full_prompt, seed, prefix=None, timings=None):
+    with tempfile.NamedTemporaryFile(mode="w+", delete=False) as tmp:
+        tmp.write(full_prompt)
+        tmp_path = tmp.name
+    # stderr goes to a file so the perf summary can be parsed without blocking the pipe
+    err = tempfile.TemporaryFile()
+
+    proc = subprocess.Popen([
+        LLAMA_BIN,
+        "-m", MODEL_PATH,
+        "-f", tmp_path,
+        "-n", MAX_TOKENS,
+        "-s", str(seed)
+    ] + _cli_prefix_args(full_prompt, prefix), stdout=subprocess.PIPE, stderr=err, stdin=subprocess.DEVNULL)
+
+    # llama-cli echoes the prompt first; hold output back until the delimiter
+    marker = DELIMITER.strip()
+    pending = ""
+    started = False
+    try:
+        while True:
+            chunk = proc.stdout.read1(4096)
+            if not chunk:
+                break
+            text = chunk.decode("utf-8", errors="ignore")
+            if started:
+                yield text
+                continue
+            pending += text
+            if marker in pending:
+                started = True
+                rest = pending.split(marker, 1)[1]
+                if rest:
+                    yield rest
+        if not started and pending:
+            yield pending
+        proc.wait()
+        if timings is not None:
+            err.seek(0)
+            timings.append(llm_metrics.parse_llama_timings(err.read().decode("utf-8", errors="ignore")))
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        err.close()
+        os.remove(tmp_path)
+
+def _cli_completion(full_prompt, prefix=None, timings=None):
+    # Write full prompt to a temporary file
+    with tempfile.NamedTemporaryFile(mode="w+", delete=False) as tmp:
+        tmp.write(full_prompt)
+        tmp_path = tmp.name
+
+    try:
         result = subprocess.run([
             LLAMA_BIN,
             "-m", MODEL_PATH,
             "-f", tmp_path,
             "-n", MAX_TOKENS
-        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        ] + _cli_prefix_args(full_prompt, prefix), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+           stdin=subprocess.DEVNULL, timeout=REQUEST_TIMEOUT)
+    finally:
+        os.remove(tmp_path)
 
-        full_output = result.stdout.decode("utf-8")
-        return extract_after_delimiter(full_output)
+    if timings is not None:
+        timings.append(llm_metrics.parse_llama_timings(result.stderr.decode("utf-8", errors="ignore")))
+    return result.stdout.decode("utf-8")
 
-    except Exception as e:
-        return f"[LLM ERROR] {e}"
+def _cli_batched_completions(full_prompt, n, seed, timings=None):
+    # llama-batched evaluates the prompt once, copies its KV cache to n
+    # sequences and decodes them together, printing "sequence i:" blocks
+    result = subprocess.run([
+        LLAMA_BATCHED_BIN,
+        "-m", MODEL_PATH,
+        "-p", full_prompt,
+        "-n", MAX_TOKENS,
+        "-np", str(n),
+        "-s", str(seed)
+    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL, timeout=REQUEST_TIMEOUT)
+
+    streams = parse_batched_output(result.stdout.decode("utf-8", errors="ignore"))
+    if len(streams) < n:
+        raise RuntimeError(f"llama-batched returned {len(streams)} of {n} sequences (exit {result.returncode})")
+    if timings is not None:
+        timings.append(llm_metrics.parse_llama_timings(result.stderr.decode("utf-8", errors="ignore")))
+    return [streams[i] for i in range(n)]
+
+# Log lines llama-batched prints after the last sequence block
+BATCHED_TRAILER_RE = re.compile(r"^(?:main|llama_\w+|ggml_\w+|common_\w+):", re.MULTILINE)
+
+def parse_batched_output(stdout):
+    """
+    Splits llama-batched stdout into {sequence index: text}. The perf and
+    log lines printed after the final "sequence i:" block are cut off so
+    the last variant doesn't absorb them.
+    """
+    parts = re.split(r"^sequence (\d+):\s*$", stdout, flags=re.MULTILINE)
+    streams = {int(parts[i]): parts[i + 1] for i in range(1, len(parts) - 1, 2)}
+    if streams:
+        last = max(streams)
+        trailer = BATCHED_TRAILER_RE.search(streams[last])
+        if trailer:
+            streams[last] = streams[last][:trailer.start()]
+    return streams
+
+# === llama-server backend ===
+def _server_url(path):
+    return f"http://{SERVER_HOST}:{SERVER_PORT}{path}"
+
+def _post_json(path, payload, timeout=REQUEST_TIMEOUT):
+    req = urllib.request.Request(
+        _server_url(path),
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+def server_healthy():
+    """
+    True when a llama-server is listening on the configured port, has the
+    model loaded and is serving the configured MODEL_PATH.
+    """
+    try:
+        with urllib.request.urlopen(_server_url("/health"), timeout=2) as resp:
+            if resp.status != 200:
+                return False
+        with urllib.request.urlopen(_server_url("/props"), timeout=2) as resp:
+            props = json.loads(resp.read().decode("utf-8"))
+        loaded = props.get("model_path") or props.get("default_generation_settings", {}).get("model")
+        return not loaded or os.path.abspath(loaded) == os.path.abspath(MODEL_PATH)
+    except (urllib.error.URLError, OSError, ValueError):
+        return False
+
+def _read_server_pid():
+    try:
+        with open(SERVER_PID_FILE) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def stop_server():
+    pid = _read_server_pid()
+    if pid:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+    if os.path.exists(SERVER_PID_FILE):
+        os.remove(SERVER_PID_FILE)
+
+def ensure_server():
+    """
+    Makes sure a warm llama-server is running, (re)starting it if the health
+    check fails. The server is detached from the calling process so later
+    prompt scripts reuse the already-loaded model.
+    """
+    with _server_lock:
+        if not server_healthy():
+            _start_server()
+
+def _start_server():
+    # Stale or crashed server: clear it before starting a fresh one
+    stop_server()
+    os.makedirs(PREFIX_CACHE_DIR, exist_ok=True)
+
+    with open(SERVER_LOG_FILE, "ab") as log:
+        proc = subprocess.Popen([
+            LLAMA_SERVER_BIN,
+            "-m", MODEL_PATH,
+            # Context is split evenly across slots, so scale it to keep per-slot size
+            "-c", str(int(SERVER_CTX) * SERVER_SLOTS),
+            "-np", str(SERVER_SLOTS),
+            "-cb",
+            "--slot-save-path", os.path.abspath(PREFIX_CACHE_DIR),
+            "--host", SERVER_HOST,
+            "--port", str(SERVER_PORT)
+        ], stdout=log, stderr=log, stdin=subprocess.DEVNULL, start_new_session=True)
+
+    with open(SERVER_PID_FILE, "w") as f:
+        f.write(str(proc.pid))
+
+    deadline = time.time() + SERVER_START_TIMEOUT
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"llama-server exited with code {proc.returncode}, see {SERVER_LOG_FILE}")
+        if server_healthy():
+            return
+        time.sleep(0.5)
+    raise RuntimeError(f"llama-server not healthy after {SERVER_START_TIMEOUT}s, see {SERVER_LOG_FILE}")
+
+def _server_completion(full_prompt, timings=None, **params):
+    payload = {"prompt": full_prompt, "n_predict": int(MAX_TOKENS)}
+    payload.update(params)
+    ensure_server()
+    try:
+        result = _post_json("/completion", payload)
+    except (urllib.error.URLError, ConnectionError):
+        # Server died mid-request: health check restarts it, then retry once
+        ensure_server()
+        result = _post_json("/completion", payload)
+    if timings is not None:
+        timings.append(llm_metrics.server_timings(result.get("timings")))
+    return result["content"]
+
+def _server_stream(full_prompt, timings=None, **params):
+    payload = {"prompt": full_prompt, "n_predict": int(MAX_TOKENS), "stream": True}
+    payload.update(params)
+    ensure_server()
+    req = urllib.request.Request(
+        _server_url("/completion"),
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    # Server-sent events: one "data: {json}" line per generated token
+    with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as resp:
+        for line in resp:
+            line = line.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            event = json.loads(line[len("data:"):])
+            if event.get("content"):
+                yield event["content"]
+            if event.get("stop"):
+                if timings is not None:
+                    timings.append(llm_metrics.server_timings(event.get("timings")))
+                break
+
+def _server_completions(full_prompt, seeds, slots, prefix=None, timings=None):
+    # The prompt is evaluated once in the job's first slot and its KV state
+    # copied to its other slots; requests are then issued together so the
+    # server's continuous batching decodes every variant in the same batch.
+    ensure_server()
+    slots = _fanout_slots(full_prompt, prefix, slots[:len(seeds)], timings)
+    with ThreadPoolExecutor(max_workers=len(slots)) as pool:
+        futures = [
+            pool.submit(_server_completion, full_prompt, timings, seed=seed, cache_prompt=True, **slots[i % len(slots)])
+            for i, seed in enumerate(seeds)
+        ]
+        return [f.result() for f in futures]
+
+def _fanout_slots(full_prompt, prefix, slots, timings=None):
+    """
+    Evaluates full_prompt in the first of slots and restores the saved slot
+    state into the others, so each variant starts from the cached prompt
+    instead of evaluating it again. Falls back to independent slots (each
+    evaluating the prompt itself) when slot save/restore is unavailable.
+    """
+    first = slots[0]
+    params = _server_prefix_params(full_prompt, prefix, first)
+    if len(slots) == 1:
+        return [params]
+    filename = f"{_model_fingerprint()}_{hashlib.sha256(full_prompt.encode('utf-8')).hexdigest()[:16]}_fanout.bin"
+    try:
+        result = _post_json("/completion", {"prompt": full_prompt, "n_predict": 0, "id_slot": first, "cache_prompt": True})
+        _post_json(f"/slots/{first}?action=save", {"filename": filename})
+        for slot in slots[1:]:
+            _post_json(f"/slots/{slot}?action=restore", {"filename": filename})
+    except (urllib.error.URLError, ConnectionError, KeyError, ValueError):
+        return [_server_prefix_params(full_prompt, prefix, slot) for slot in slots]
+    finally:
+        # The copy is only needed until every slot has restored it
+        try:
+            os.remove(os.path.join(PREFIX_CACHE_DIR, filename))
+        except OSError:
+            pass
+    if timings is not None:
+        timings.append(llm_metrics.server_timings(result.get("timings")))
+    return [{"id_slot": slot} for slot in slots]
 
 def extract_after_delimiter(output):
     """
@@ -38,4 +672,3 @@ def extract_after_delimiter(output):
         return output.split("=== RESPONSE START ===", 1)[1].strip()
     else:
         return output.strip()
-
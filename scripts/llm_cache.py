@@ -0,0 +1,170 @@
+# llm_cache.py — Content-addressed SQLite cache for LLM responses
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+CACHE_PATH = os.environ.get("KALPANA_LLM_CACHE", "voter_data/llm_cache.db")
+CACHE_MAX_ENTRIES = int(os.environ.get("KALPANA_LLM_CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_BYTES = int(os.environ.get("KALPANA_LLM_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+CACHE_MAX_AGE_DAYS = float(os.environ.get("KALPANA_LLM_CACHE_MAX_AGE_DAYS", "30"))
+# Set to y/1 to skip lookups (responses are still stored), e.g. for "Regenerate Variants"
+CACHE_BYPASS = os.environ.get("KALPANA_LLM_CACHE_BYPASS", "n").strip().lower() in ("1", "y", "yes", "true")
+
+_schema_ready = False
+
+def _connect():
+    global _schema_ready
+    os.makedirs(os.path.dirname(CACHE_PATH) or ".", exist_ok=True)
+    # WAL + busy timeout let several prompt processes read and write the cache at once
+    conn = sqlite3.connect(CACHE_PATH, timeout=30)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    if not _schema_ready:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                cache_key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_llm_responses_last_used ON llm_responses(last_used);
+            CREATE TABLE IF NOT EXISTS llm_cache_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        _schema_ready = True
+    return conn
+
+def make_key(prompt, model_path, max_tokens, sampling=None):
+    """
+    Hash of everything that determines a response: prompt text, model,
+    token limit and sampling parameters (seed, temperature, variant, ...).
+    """
+    material = json.dumps({
+        "prompt": prompt,
+        "model": os.path.abspath(model_path),
+        "max_tokens": str(max_tokens),
+        "sampling": sampling or {},
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+def _bump(conn, name):
+    conn.execute("""
+        INSERT INTO llm_cache_counters (name, value) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET value = value + 1
+    """, (name,))
+
+def get(key, bypass=False):
+    if bypass or CACHE_BYPASS:
+        return None
+    now = time.time()
+    conn = _connect()
+    try:
+        with conn:
+            row = conn.execute(
+                "SELECT response FROM llm_responses WHERE cache_key = ? AND created_at >= ?",
+                (key, now - CACHE_MAX_AGE_DAYS * 86400)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE llm_responses SET last_used = ?, hits = hits + 1 WHERE cache_key = ?", (now, key))
+                _bump(conn, "hits")
+                return row[0]
+            _bump(conn, "misses")
+            return None
+    finally:
+        conn.close()
+
+def put(key, response):
+    now = time.time()
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("""
+                INSERT INTO llm_responses (cache_key, response, size_bytes, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    response = excluded.response,
+                    size_bytes = excluded.size_bytes,
+                    created_at = excluded.created_at,
+                    last_used = excluded.last_used
+            """, (key, response, len(response.encode("utf-8")), now, now))
+            _evict(conn, now)
+    finally:
+        conn.close()
+
+def _evict(conn, now):
+    # Age limit first, then least-recently-used beyond the entry/byte budget
+    conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - CACHE_MAX_AGE_DAYS * 86400,))
+    cur = conn.execute("""
+        DELETE FROM llm_responses WHERE cache_key IN (
+            SELECT cache_key FROM (
+                SELECT cache_key,
+                       ROW_NUMBER() OVER (ORDER BY last_used DESC) AS rank,
+                       SUM(size_bytes) OVER (ORDER BY last_used DESC) AS running_bytes
+                FROM llm_responses
+            )
+            WHERE rank > ? OR running_bytes > ?
+        )
+    """, (CACHE_MAX_ENTRIES, CACHE_MAX_BYTES))
+    if cur.rowcount > 0:
+        conn.execute("""
+            INSERT INTO llm_cache_counters (name, value) VALUES ('evictions', ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        """, (cur.rowcount,))
+
+def evict():
+    conn = _connect()
+    try:
+        with conn:
+            _evict(conn, time.time())
+    finally:
+        conn.close()
+
+def clear():
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM llm_responses")
+            conn.execute("DELETE FROM llm_cache_counters")
+    finally:
+        conn.close()
+
+def stats():
+    conn = _connect()
+    try:
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_responses").fetchone()
+        counters = dict(conn.execute("SELECT name, value FROM llm_cache_counters").fetchall())
+    finally:
+        conn.close()
+    hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+    return {
+        "entries": entries,
+        "bytes": size,
+        "hits": hits,
+        "misses": misses,
+        "evictions": counters.get("evictions", 0),
+        "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+    }
+
+# === MAIN ===
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "stats":
+        for name, value in stats().items():
+            print(f"{name}: {value}")
+    elif command == "evict":
+        evict()
+        print("✅ Eviction done.")
+    elif command == "clear":
+        clear()
+        print("✅ LLM cache cleared.")
+    else:
+        print("❌ Usage: python3 llm_cache.py [stats|evict|clear]")
+        exit(1)
@@ -0,0 +1,193 @@
+# llm_metrics.py — Per-call llama.cpp timing records and latency/throughput report
+
+import os
+import re
+import sqlite3
+import sys
+import time
+
+METRICS_PATH = os.environ.get("KALPANA_LLM_METRICS", "voter_data/llm_metrics.db")
+
+# llama.cpp perf summary lines (llama_perf_context_print / older llama_print_timings), e.g.
+#   prompt eval time =     456.78 ms /    42 tokens (...)
+#          eval time =    7890.12 ms /   299 runs   (...)
+TIMING_RE = re.compile(
+    r"(load time|prompt eval time|eval time)\s*=\s*([\d.]+)\s*ms(?:\s*/\s*(\d+)\s*(?:tokens|runs))?"
+)
+
+FIELDS = [
+    "prompt_id", "backend", "variants", "cache_hit", "prompt_tokens", "generated_tokens",
+    "load_ms", "prompt_eval_ms", "eval_ms", "queue_ms", "wall_ms",
+]
+
+_schema_ready = False
+
+def _connect():
+    global _schema_ready
+    os.makedirs(os.path.dirname(METRICS_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(METRICS_PATH, timeout=30)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    if not _schema_ready:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS llm_metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                prompt_id TEXT,
+                backend TEXT,
+                variants INTEGER,
+                cache_hit INTEGER,
+                prompt_tokens INTEGER,
+                generated_tokens INTEGER,
+                load_ms REAL,
+                prompt_eval_ms REAL,
+                eval_ms REAL,
+                queue_ms REAL,
+                wall_ms REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_llm_metrics_prompt ON llm_metrics(prompt_id, created_at);
+        """)
+        _schema_ready = True
+    return conn
+
+def parse_llama_timings(text):
+    """
+    Extracts load / prompt-eval / eval timings and token counts from the
+    perf summary llama-cli and llama-batched print on stderr.
+    """
+    out = {}
+    for label, ms, count in TIMING_RE.findall(text):
+        if label == "load time":
+            out["load_ms"] = float(ms)
+        elif label == "prompt eval time":
+            out["prompt_eval_ms"] = float(ms)
+            out["prompt_tokens"] = int(count) if count else None
+        else:
+            out["eval_ms"] = float(ms)
+            out["generated_tokens"] = int(count) if count else None
+    return out
+
+def server_timings(timings):
+    # llama-server reports the same figures in the "timings" object of a completion
+    timings = timings or {}
+    return {
+        "load_ms": 0.0,
+        "prompt_tokens": timings.get("prompt_n"),
+        "prompt_eval_ms": timings.get("prompt_ms"),
+        "generated_tokens": timings.get("predicted_n"),
+        "eval_ms": timings.get("predicted_ms"),
+    }
+
+def combine(runs, parallel=False):
+    """
+    Folds the timings of several backend runs (one per variant) into one
+    record. Token counts add up; durations add up for sequential runs and
+    take the longest for runs decoded side by side.
+    """
+    total = {}
+    for run in runs:
+        for field in ("prompt_tokens", "generated_tokens"):
+            if run.get(field) is not None:
+                total[field] = total.get(field, 0) + run[field]
+        for field in ("load_ms", "prompt_eval_ms", "eval_ms"):
+            if run.get(field) is not None:
+                prev = total.get(field, 0.0)
+                total[field] = max(prev, run[field]) if parallel else prev + run[field]
+    return total
+
+def normalize_prompt_id(prompt_id=None):
+    """
+    Returns the numeric prompt id ("4") whether given 4, "4", "prompt_4.py"
+    or nothing (then the running script's name is used), so in-process and
+    CLI runs of the same prompt aggregate under one key.
+    """
+    if prompt_id is None:
+        prompt_id = os.path.basename(sys.argv[0])
+    prompt_id = str(prompt_id)
+    match = re.fullmatch(r"(?:prompt_)?(\d+)(?:\.py)?", prompt_id)
+    return str(int(match.group(1))) if match else prompt_id
+
+def record(**fields):
+    fields["prompt_id"] = normalize_prompt_id(fields.get("prompt_id"))
+    row = [fields.get(f) for f in FIELDS]
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(f"""
+                    INSERT INTO llm_metrics (created_at, {", ".join(FIELDS)})
+                    VALUES (?, {", ".join("?" for _ in FIELDS)})
+                """, [time.time()] + row)
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        # Metrics are best-effort; never fail a generation over them
+        pass
+
+def _pct(values, p):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(p * len(values)))], 1)
+
+def report(days=7):
+    """
+    Per prompt script: call count, cache hit rate, p50/p95 wall and queue
+    latency, and prompt-eval / generation throughput in tokens per second.
+    """
+    conn = _connect()
+    try:
+        rows = conn.execute(f"""
+            SELECT prompt_id, {", ".join(FIELDS[1:])} FROM llm_metrics
+            WHERE created_at >= ? ORDER BY prompt_id
+        """, (time.time() - days * 86400,)).fetchall()
+    finally:
+        conn.close()
+
+    groups = {}
+    for row in rows:
+        # Rows recorded before ids were normalized still carry "prompt_4.py"
+        groups.setdefault(normalize_prompt_id(row[0]), []).append(dict(zip(FIELDS, row)))
+
+    result = []
+    for prompt_id, recs in groups.items():
+        generated = [r for r in recs if not r["cache_hit"]]
+        gen_tokens = sum(r["generated_tokens"] or 0 for r in generated)
+        gen_ms = sum(r["eval_ms"] or 0 for r in generated)
+        prompt_tokens = sum(r["prompt_tokens"] or 0 for r in generated)
+        prompt_ms = sum(r["prompt_eval_ms"] or 0 for r in generated)
+        load = [r["load_ms"] for r in generated if r["load_ms"] is not None]
+        result.append({
+            "prompt_id": prompt_id,
+            "calls": len(recs),
+            "cache_hit_rate": round(1 - len(generated) / len(recs), 3),
+            "wall_p50_ms": _pct([r["wall_ms"] for r in recs], 0.5),
+            "wall_p95_ms": _pct([r["wall_ms"] for r in recs], 0.95),
+            "queue_p95_ms": _pct([r["queue_ms"] for r in recs], 0.95),
+            "avg_load_ms": round(sum(load) / len(load), 1) if load else None,
+            "avg_prompt_tokens": round(prompt_tokens / len(generated), 1) if generated else None,
+            "avg_generated_tokens": round(gen_tokens / len(generated), 1) if generated else None,
+            "prompt_tok_per_s": round(prompt_tokens / (prompt_ms / 1000), 1) if prompt_ms else None,
+            "gen_tok_per_s": round(gen_tokens / (gen_ms / 1000), 1) if gen_ms else None,
+        })
+    return result
+
+# === MAIN ===
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "report"
+    if command != "report":
+        print("❌ Usage: python3 llm_metrics.py report [days]")
+        exit(1)
+
+    days = float(sys.argv[2]) if len(sys.argv) > 2 else 7
+    rows = report(days)
+    if not rows:
+        print(f"ℹ️ No LLM calls recorded in the last {days:g} days.")
+        exit(0)
+
+    print(f"\n📈 LLM latency & throughput (last {days:g} days)\n")
+    for r in rows:
+        print(f"• {r['prompt_id']}: {r['calls']} calls, cache hit {r['cache_hit_rate'] * 100:.0f}%")
+        print(f"    wall p50/p95: {r['wall_p50_ms']} / {r['wall_p95_ms']} ms, queue p95: {r['queue_p95_ms']} ms")
+        print(f"    load: {r['avg_load_ms']} ms, prompt: {r['avg_prompt_tokens']} tok @ {r['prompt_tok_per_s']} tok/s, "
+              f"generated: {r['avg_generated_tokens']} tok @ {r['gen_tok_per_s']} tok/s")
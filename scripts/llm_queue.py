@@ -0,0 +1,281 @@
+# llm_queue.py — Bounded-concurrency, priority-ordered admission queue for LLM jobs
+#
+# Every process that wants to run an inference inserts a ticket and waits until
+# it is among the highest-priority queued tickets that fit in the free worker
+# slots. Tickets live in SQLite, so GUI sessions and batch scripts share one queue.
+# A running job holds a numbered worker slot, which the bridge maps to the
+# llama-server slots the job may use.
+
+import os
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+
+QUEUE_PATH = os.environ.get("KALPANA_LLM_QUEUE", "voter_data/llm_queue.db")
+LLM_WORKERS = int(os.environ.get("KALPANA_LLM_WORKERS", "1"))
+JOB_TIMEOUT = float(os.environ.get("KALPANA_LLM_JOB_TIMEOUT", "900"))
+POLL_INTERVAL = 0.25
+HISTORY_DAYS = 7
+
+# Lower value is served first
+PRIORITIES = {"interactive": 0, "batch": 10}
+DEFAULT_PRIORITY = os.environ.get("KALPANA_LLM_PRIORITY", "batch").strip().lower()
+
+class JobCancelled(Exception):
+    pass
+
+class JobTimeout(Exception):
+    pass
+
+_schema_ready = False
+_run_deadlines = {}   # job_id -> time by which a job running in this process must finish
+_workers = {}         # job_id -> worker slot (0..LLM_WORKERS-1) held by a job running in this process
+
+def _connect():
+    global _schema_ready
+    os.makedirs(os.path.dirname(QUEUE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(QUEUE_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    if not _schema_ready:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS llm_jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                priority INTEGER NOT NULL,
+                label TEXT,
+                status TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                enqueued_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                worker INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_llm_jobs_status ON llm_jobs(status, priority, enqueued_at);
+        """)
+        # Queues created before worker slots were numbered
+        if "worker" not in [r[1] for r in conn.execute("PRAGMA table_info(llm_jobs)")]:
+            conn.execute("ALTER TABLE llm_jobs ADD COLUMN worker INTEGER")
+        _schema_ready = True
+    return conn
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+def _reap_dead(conn, now):
+    # Tickets whose process died (crash, Ctrl-C, killed Streamlit rerun) free their slot
+    rows = conn.execute("SELECT job_id, pid FROM llm_jobs WHERE status IN ('queued', 'running')").fetchall()
+    for job_id, pid in rows:
+        if not _pid_alive(pid):
+            conn.execute("UPDATE llm_jobs SET status = 'failed', finished_at = ? WHERE job_id = ?", (now, job_id))
+
+def enqueue(priority=None, label=None):
+    level = PRIORITIES.get((priority or DEFAULT_PRIORITY).lower(), PRIORITIES["batch"])
+    conn = _connect()
+    try:
+        cur = conn.execute("""
+            INSERT INTO llm_jobs (priority, label, status, pid, enqueued_at)
+            VALUES (?, ?, 'queued', ?, ?)
+        """, (level, label or os.path.basename(sys.argv[0]), os.getpid(), time.time()))
+        return cur.lastrowid
+    finally:
+        conn.close()
+
+def wait_turn(job_id, timeout=None):
+    """
+    Blocks until job_id may run, then marks it running and returns the
+    worker slot it holds (the lowest one no other running job holds).
+    Raises JobCancelled if the ticket was cancelled while queued, JobTimeout
+    if it waited longer than timeout seconds.
+    """
+    limit = JOB_TIMEOUT if timeout is None else timeout
+    deadline = time.time() + limit
+    conn = _connect()
+    try:
+        while True:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                status = conn.execute("SELECT status FROM llm_jobs WHERE job_id = ?", (job_id,)).fetchone()
+                if not status or status[0] == "cancelled":
+                    conn.execute("COMMIT")
+                    raise JobCancelled(f"LLM job {job_id} was cancelled")
+
+                _reap_dead(conn, now)
+                running = conn.execute("SELECT COUNT(*) FROM llm_jobs WHERE status = 'running'").fetchone()[0]
+                free = LLM_WORKERS - running
+                if free > 0:
+                    ahead = conn.execute("""
+                        SELECT job_id FROM llm_jobs WHERE status = 'queued'
+                        ORDER BY priority, enqueued_at, job_id LIMIT ?
+                    """, (free,)).fetchall()
+                    if job_id in [r[0] for r in ahead]:
+                        held = {r[0] for r in conn.execute("SELECT worker FROM llm_jobs WHERE status = 'running'")}
+                        worker = min(set(range(LLM_WORKERS)) - held)
+                        conn.execute("""
+                            UPDATE llm_jobs SET status = 'running', started_at = ?, worker = ? WHERE job_id = ?
+                        """, (now, worker, job_id))
+                        conn.execute("COMMIT")
+                        return worker
+
+                if now >= deadline:
+                    conn.execute("UPDATE llm_jobs SET status = 'timeout', finished_at = ? WHERE job_id = ?", (now, job_id))
+                    conn.execute("COMMIT")
+                    raise JobTimeout(f"LLM job {job_id} waited more than {int(limit)}s in queue")
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+            time.sleep(POLL_INTERVAL)
+    finally:
+        conn.close()
+
+def finish(job_id, status="done"):
+    now = time.time()
+    conn = _connect()
+    try:
+        # Never overwrite a cancellation that arrived while the job was running
+        conn.execute("""
+            UPDATE llm_jobs SET status = ?, finished_at = ?
+            WHERE job_id = ? AND status IN ('queued', 'running')
+        """, (status, now, job_id))
+        conn.execute("DELETE FROM llm_jobs WHERE finished_at < ?", (now - HISTORY_DAYS * 86400,))
+    finally:
+        conn.close()
+
+def cancel(job_id):
+    conn = _connect()
+    try:
+        cur = conn.execute("""
+            UPDATE llm_jobs SET status = 'cancelled', finished_at = ?
+            WHERE job_id = ? AND status IN ('queued', 'running')
+        """, (time.time(), job_id))
+        return cur.rowcount > 0
+    finally:
+        conn.close()
+
+def check_deadline(job_id):
+    """
+    Raises JobTimeout, and marks the job 'timeout', once a job has held its
+    slot longer than its timeout. Streaming callers check it between pieces.
+    """
+    deadline = _run_deadlines.get(job_id)
+    if deadline is not None and time.time() > deadline[0]:
+        finish(job_id, "timeout")
+        raise JobTimeout(f"LLM job {job_id} ran more than {int(deadline[1])}s")
+
+def worker_of(job_id):
+    """
+    Worker slot held by a job running in this process (see wait_turn), or
+    None outside llm_slot.
+    """
+    return _workers.get(job_id)
+
+def is_cancelled(job_id):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT status FROM llm_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return not row or row[0] == "cancelled"
+    finally:
+        conn.close()
+
+@contextmanager
+def llm_slot(priority=None, label=None, timeout=None):
+    """
+    Holds one of LLM_WORKERS inference slots for the duration of the block
+    and yields the job id (for cancellation and deadline checks). timeout
+    (default JOB_TIMEOUT) bounds the wait for a slot and, separately, the
+    time the job may hold it (see check_deadline).
+    """
+    limit = JOB_TIMEOUT if timeout is None else timeout
+    job_id = enqueue(priority, label)
+    try:
+        worker = wait_turn(job_id, limit)
+    except BaseException:
+        finish(job_id, "cancelled")
+        raise
+    _run_deadlines[job_id] = (time.time() + limit, limit)
+    _workers[job_id] = worker
+    try:
+        yield job_id
+    except BaseException:
+        # Keeps a 'timeout' or 'cancelled' status already set
+        finish(job_id, "failed")
+        raise
+    finally:
+        _run_deadlines.pop(job_id, None)
+        _workers.pop(job_id, None)
+    finish(job_id, "done")
+
+def stats():
+    """
+    Queue depth per priority class, running jobs, and wait/run time
+    percentiles over the last 24 hours of finished jobs.
+    """
+    names = {v: k for k, v in PRIORITIES.items()}
+    conn = _connect()
+    try:
+        _reap_dead(conn, time.time())
+        depth = conn.execute("SELECT priority, COUNT(*) FROM llm_jobs WHERE status = 'queued' GROUP BY priority").fetchall()
+        running = conn.execute("SELECT COUNT(*) FROM llm_jobs WHERE status = 'running'").fetchone()[0]
+        rows = conn.execute("""
+            SELECT started_at - enqueued_at, finished_at - started_at FROM llm_jobs
+            WHERE status = 'done' AND finished_at >= ?
+        """, (time.time() - 86400,)).fetchall()
+        outcomes = dict(conn.execute("""
+            SELECT status, COUNT(*) FROM llm_jobs WHERE finished_at >= ? GROUP BY status
+        """, (time.time() - 86400,)).fetchall())
+    finally:
+        conn.close()
+
+    def pct(values, p):
+        if not values:
+            return 0.0
+        values = sorted(values)
+        return round(values[min(len(values) - 1, int(p * len(values)))], 2)
+
+    waits = [r[0] for r in rows]
+    runs = [r[1] for r in rows]
+    return {
+        "workers": LLM_WORKERS,
+        "running": running,
+        "queued": {names.get(p, str(p)): c for p, c in depth},
+        "wait_p50_s": pct(waits, 0.5),
+        "wait_p95_s": pct(waits, 0.95),
+        "run_p50_s": pct(runs, 0.5),
+        "run_p95_s": pct(runs, 0.95),
+        "outcomes_24h": outcomes,
+    }
+
+def list_jobs():
+    conn = _connect()
+    try:
+        return conn.execute("""
+            SELECT job_id, priority, label, status, pid, enqueued_at FROM llm_jobs
+            WHERE status IN ('queued', 'running') ORDER BY status DESC, priority, enqueued_at
+        """).fetchall()
+    finally:
+        conn.close()
+
+# === MAIN ===
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "stats":
+        for name, value in stats().items():
+            print(f"{name}: {value}")
+    elif command == "list":
+        for job_id, priority, label, status, pid, enqueued_at in list_jobs():
+            waited = round(time.time() - enqueued_at, 1)
+            print(f"#{job_id} [{status}] prio={priority} {label} pid={pid} age={waited}s")
+    elif command == "cancel" and len(sys.argv) > 2:
+        ok = cancel(int(sys.argv[2]))
+        print("✅ Cancelled." if ok else "❌ Job not queued or running.")
+    else:
+        print("❌ Usage: python3 llm_queue.py [stats|list|cancel <job_id>]")
+        exit(1)
@@ -0,0 +1,279 @@
+# migrate.py — Versioned schema migrations for voter_data.db
+#
+# Migrations are applied in order and recorded in schema_migrations; each one
+# runs in its own transaction. Steps that target a table missing from this
+# database are skipped with a note and the migration is still recorded.
+#
+# Key convention: aggregate tables (constituency_sentiment,
+# constituency_issue_sentiment and the post rollups that supersede them) are
+# keyed by constituency code; entity tables
+# (candidates, voter_enriched_demo, prompt_outputs, ...) by constituency name,
+# matched case-insensitively. The LOWER(constituency) expression indexes below
+# let those `LOWER(constituency) = LOWER(?)` filters seek instead of scan.
+#
+#   python3 migrate.py            # apply pending migrations (same as "up")
+#   python3 migrate.py status     # applied / pending versions
+#   python3 migrate.py check      # EXPLAIN QUERY PLAN for hot queries; exit 1 on any full scan
+
+import re
+import sys
+import time
+
+import booth_influencers
+import hashtag_index
+import retriever
+import rollups
+import snapshot_export
+from common import write_conn
+
+# === Helpers ===
+def _has_table(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def _index(conn, name, table, *columns):
+    # columns may be expressions; every plain column they mention must exist
+    if not _has_table(conn, table):
+        print(f"  ⏭️  {name}: table {table} not found")
+        return
+    have = _columns(conn, table)
+    needed = {c.replace("LOWER(", "").replace(")", "").split()[0] for c in columns}
+    missing = needed - have
+    if missing:
+        print(f"  ⏭️  {name}: {table} has no column(s) {', '.join(sorted(missing))}")
+        return
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+    print(f"  ✅ {name}")
+
+# === Migrations ===
+def _m001_constituency_lookups(conn):
+    _index(conn, "idx_constituencies_name", "constituencies", "LOWER(name)", "code", "name")
+    _index(conn, "idx_constituencies_code", "constituencies", "code", "name")
+    _index(conn, "idx_candidates_constituency", "candidates", "LOWER(constituency)", "is_opponent")
+    _index(conn, "idx_candidates_constituency_exact", "candidates", "constituency")
+    _index(conn, "idx_sentiment_constituency", "constituency_sentiment", "constituency")
+    _index(conn, "idx_issue_sentiment_constituency", "constituency_issue_sentiment", "constituency", "post_count DESC", "issue")
+    _index(conn, "idx_eci_history_constituency", "eci_election_history", "constituency", "year")
+    _index(conn, "idx_campaign_quotes_constituency", "campaign_quotes", "constituency")
+    _index(conn, "idx_digital_campaigns_constituency", "digital_campaigns", "constituency")
+
+def _m002_hot_filter_covering(conn):
+    # Trailing constituency makes the booth rollup in prompt_27 a covering scan
+    _index(conn, "idx_voters_influencers", "voter_enriched_demo",
+           "LOWER(constituency)", "is_group_admin", "booth_location", "followers_estimated", "constituency")
+    _index(conn, "idx_voters_voter_id", "voter_enriched_demo", "voter_id")
+    _index(conn, "idx_social_posts_voter_id", "social_posts", "voter_id")
+    _index(conn, "idx_prompt_outputs_lookup", "prompt_outputs", "prompt_id", "LOWER(constituency)", "variant_number")
+    _index(conn, "idx_prompt_outputs_recent", "prompt_outputs", "prompt_id", "LOWER(constituency)", "created_at")
+
+def _m003_aggregates_by_code(conn):
+    # Rows stored under the constituency name are re-keyed to its code
+    if not _has_table(conn, "constituencies"):
+        print("  ⏭️  constituencies table not found")
+        return
+    for table in ("constituency_sentiment", "constituency_issue_sentiment"):
+        if not _has_table(conn, table):
+            print(f"  ⏭️  {table} not found")
+            continue
+        cur = conn.execute(f"""
+            UPDATE OR IGNORE {table}
+            SET constituency = (SELECT c.code FROM constituencies c WHERE LOWER(c.name) = LOWER({table}.constituency))
+            WHERE constituency NOT IN (SELECT code FROM constituencies)
+              AND EXISTS (SELECT 1 FROM constituencies c WHERE LOWER(c.name) = LOWER({table}.constituency))
+        """)
+        print(f"  ✅ {table}: {cur.rowcount} row(s) re-keyed to constituency code")
+
+def _m004_rollups(conn):
+    rollups.install(conn)
+    for table, n in rollups.rebuild(conn).items():
+        print(f"  ✅ {table}: {n} rows")
+
+def _m005_hashtag_index(conn):
+    if not _has_table(conn, "social_posts") or not {"voter_id", "hashtags"} <= _columns(conn, "social_posts"):
+        print("  ⏭️  hashtag index: social_posts needs columns voter_id, hashtags")
+        return
+    hashtag_index.install(conn)
+    print("  ✅ hashtag_postings (posts queued; indexed on first sync)")
+
+def _m006_prompt_output_key(conn):
+    if not _has_table(conn, "prompt_outputs"):
+        print("  ⏭️  prompt_outputs not found")
+        return
+    # Keep the newest row of any duplicated variant left by interleaved runs
+    cur = conn.execute("""
+        DELETE FROM prompt_outputs WHERE rowid NOT IN (
+            SELECT MAX(rowid) FROM prompt_outputs GROUP BY prompt_id, LOWER(constituency), variant_number
+        )
+    """)
+    print(f"  ✅ removed {cur.rowcount} duplicate variant row(s)")
+    if "status" not in _columns(conn, "prompt_outputs"):
+        conn.execute("ALTER TABLE prompt_outputs ADD COLUMN status TEXT NOT NULL DEFAULT 'draft'")
+        print("  ✅ prompt_outputs.status")
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_prompt_outputs_variant
+        ON prompt_outputs (prompt_id, LOWER(constituency), variant_number)
+    """)
+    conn.execute("DROP INDEX IF EXISTS idx_prompt_outputs_lookup")
+    print("  ✅ uq_prompt_outputs_variant")
+
+def _m007_snapshot_tracking(conn):
+    snapshot_export.install(conn)
+
+def _m008_context_index(conn):
+    retriever.install(conn)
+
+MIGRATIONS = [
+    (1, "constituency lookup indexes", _m001_constituency_lookups),
+    (2, "covering indexes for hot filters", _m002_hot_filter_covering),
+    (3, "aggregate tables keyed by constituency code", _m003_aggregates_by_code),
+    (4, "incrementally maintained rollup tables", _m004_rollups),
+    (5, "hashtag inverted index", _m005_hashtag_index),
+    (6, "unique prompt_outputs variant key and status", _m006_prompt_output_key),
+    (7, "snapshot dirty-partition tracking", _m007_snapshot_tracking),
+    (8, "retrieval index over posts and quotes", _m008_context_index),
+]
+
+# === Hot queries checked by "check" (table or tables it needs, sql, params) ===
+HOT_QUERIES = [
+    # booth_influencers.top_booth_influencers (prompt_27), with and without the booth rollup
+    (("booth_influencer_rollup", "voter_enriched_demo"),
+     booth_influencers.ROLLUP_TOP_BOOTH_INFLUENCERS_SQL, ("x", 10, "x", 10)),
+    ("voter_enriched_demo", booth_influencers.TOP_BOOTH_INFLUENCERS_SQL, ("x", 10, 10)),
+    ("voter_enriched_demo", "SELECT name, constituency, political_inclination FROM voter_enriched_demo WHERE voter_id = ?", ("v",)),
+    ("social_posts", "SELECT hashtags FROM social_posts WHERE voter_id = ?", ("v",)),
+    ("prompt_outputs", """
+        SELECT variant_number, generated_text FROM prompt_outputs
+        WHERE prompt_id = ? AND LOWER(constituency) = LOWER(?) ORDER BY variant_number
+    """, (4, "x")),
+    ("prompt_outputs", """
+        SELECT rationale FROM prompt_outputs
+        WHERE prompt_id = ? AND LOWER(constituency) = LOWER(?) ORDER BY created_at DESC LIMIT 1
+    """, (4, "x")),
+    ("prompt_outputs", "DELETE FROM prompt_outputs WHERE prompt_id = ? AND LOWER(constituency) = LOWER(?)", (4, "x")),
+    ("hashtag_postings", """
+        SELECT tag, SUM(uses) FROM hashtag_postings WHERE constituency_key = ? AND booth_key = ?
+        GROUP BY tag ORDER BY 2 DESC LIMIT 10
+    """, ("x", "b")),
+    ("hashtag_postings", "SELECT tag, SUM(uses) FROM hashtag_postings WHERE voter_id = ? GROUP BY tag", ("v",)),
+    ("constituencies", "SELECT code FROM constituencies WHERE LOWER(name) = LOWER(?)", ("x",)),
+    ("constituencies", "SELECT name FROM constituencies WHERE code = ?", ("x",)),
+    ("candidates", "SELECT candidate_id, name FROM candidates WHERE LOWER(constituency) = LOWER(?) AND is_opponent = 0", ("x",)),
+    ("candidates", "SELECT candidate_id, name FROM candidates WHERE constituency = ?", ("x",)),
+    ("constituency_sentiment", "SELECT positive_pct, negative_pct FROM constituency_sentiment WHERE constituency = ?", ("x",)),
+    ("constituency_issue_sentiment", """
+        SELECT issue FROM constituency_issue_sentiment WHERE constituency = ? ORDER BY post_count DESC LIMIT 1
+    """, ("x",)),
+    (("constituency_post_rollup", "constituency_sentiment"),
+     f"SELECT positive_pct, negative_pct FROM {rollups.SENTIMENT_ROLLUP} WHERE constituency = ?", ("x",)),
+    (("issue_post_rollup", "constituency_issue_sentiment"), f"""
+        SELECT issue FROM {rollups.ISSUE_ROLLUP} WHERE constituency = ? ORDER BY post_count DESC LIMIT 3
+    """, ("x",)),
+]
+
+# === Commands ===
+def _ensure_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at REAL NOT NULL
+        )
+    """)
+    conn.commit()
+
+def applied_versions(conn):
+    _ensure_table(conn)
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+def migrate(conn=None):
+    """
+    Applies pending migrations in order and returns the versions applied.
+    """
+    conn = conn or write_conn()
+    done = applied_versions(conn)
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version in done:
+            continue
+        print(f"⬆️  {version:03d} {name}")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            step(conn)
+            conn.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                         (version, name, time.time()))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version)
+    if 5 in applied:
+        print(f"  ✅ hashtag index: {hashtag_index.sync(conn)} post(s) indexed")
+    if 8 in applied:
+        print(f"  ✅ context index: {retriever.sync(conn)} row(s) indexed")
+    if applied:
+        # Refresh planner statistics for the new indexes
+        conn.execute("PRAGMA optimize")
+    return applied
+
+def query_plan(conn, sql, params=()):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+def full_scans(plan, sql=""):
+    """
+    Tables a query plan reads in full (SCAN without an index). Scans of a CTE
+    or subquery result ("SCAN (subquery-3)", "SCAN booths" or its alias in
+    sql) don't count: the tables behind it appear as steps of their own.
+    """
+    derived = {step.split()[1] for step in plan if step.startswith(("MATERIALIZE ", "CO-ROUTINE "))}
+    for name in list(derived):
+        derived.update(re.findall(rf"\b{re.escape(name)}\s+(?:AS\s+)?(\w+)", sql, re.IGNORECASE))
+    return [step.split()[1] for step in plan
+            if step.startswith("SCAN ") and "INDEX" not in step
+            and not step.split()[1].startswith("(") and step.split()[1] not in derived]
+
+def check(conn=None):
+    """
+    Prints the query plan of every hot query and returns the ones that still
+    scan a whole table. Independent of row counts, so an empty or fixture
+    database is checked as strictly as production.
+    """
+    conn = conn or write_conn()
+    scans = []
+    for tables, sql, params in HOT_QUERIES:
+        if not all(_has_table(conn, table) for table in ((tables,) if isinstance(tables, str) else tables)):
+            continue
+        sql = " ".join(sql.split())
+        try:
+            plan = query_plan(conn, sql, params)
+        except Exception as e:
+            print(f"⚠️  {sql[:70]}… — {e}")
+            continue
+        full_scan = bool(full_scans(plan, sql))
+        print(f"{'❌' if full_scan else '✅'} {sql[:90]}")
+        for step in plan:
+            print(f"     {step}")
+        if full_scan:
+            scans.append(sql)
+    return scans
+
+# === MAIN ===
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "up"
+    if command == "up":
+        applied = migrate()
+        print(f"✅ Applied {len(applied)} migration(s)." if applied else "✅ Schema is up to date.")
+    elif command == "status":
+        done = applied_versions(write_conn())
+        for version, name, _ in MIGRATIONS:
+            print(f"{'✔' if version in done else '·'} {version:03d} {name}")
+    elif command == "check":
+        scans = check()
+        if scans:
+            print(f"❌ {len(scans)} hot query(ies) still scan a full table — run: python3 migrate.py up")
+            exit(1)
+        print("✅ All hot queries use an index.")
+    else:
+        print("❌ Usage: python3 migrate.py [up|status|check]")
+        exit(1)
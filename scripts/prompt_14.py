@@ -1,12 +1,30 @@
-import sqlite3
+import argparse
+import itertools
+import json
+import sys
+import time
 import yaml
+import hashtag_index
+from common import read_conn, write_conn
+from prompt_registry import params_from_env
 
-DB_PATH = "voter_data/voter_data.db"
 PROMPT_ID = 14
+BATCH_CHUNK = 5000
+
+# Hashtags from every post by the voter, not just the first one
+HASHTAGS_SQL = "SELECT GROUP_CONCAT(hashtags, ' ') FROM social_posts WHERE voter_id = ? AND hashtags <> ''"
+
+def leaning_label(inclination):
+    return inclination if inclination else "Undeclared / Neutral"
+
+def build_rationale(hashtags):
+    return (
+        f"Political inclination was extracted from voter enrichment. "
+        f"{'Hashtag activity in social posts supported this leaning.' if hashtags else 'No public hashtags found.'}"
+    )
 
 def detect_political_inclination(voter_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cursor = read_conn().cursor()
 
     # Get from enriched table
     cursor.execute("SELECT name, constituency, political_inclination FROM voter_enriched_demo WHERE voter_id = ?", (voter_id,))
@@ -14,17 +32,18 @@ def detect_political_inclination(voter_id):
 
     if not row:
         print("❌ No data found for that EPIC No (voter_id).")
-        return
+        return None
 
     name, constituency, inclination = row
 
-    # Optional fallback to social_posts hashtags
-    cursor.execute("SELECT hashtags FROM social_posts WHERE voter_id = ?", (voter_id,))
-    post_row = cursor.fetchone()
-    hashtags = post_row[0] if post_row else ""
+    # Optional fallback to social_posts hashtags (parsed index when installed)
+    hashtags = hashtag_index.voter_hashtags(voter_id)
+    if hashtags is None:
+        cursor.execute(HASHTAGS_SQL, (voter_id,))
+        hashtags = cursor.fetchone()[0] or ""
 
     # Decide label
-    leaning = inclination if inclination else "Undeclared / Neutral"
+    leaning = leaning_label(inclination)
 
     output = {
         "Name": name,
@@ -33,21 +52,123 @@ def detect_political_inclination(voter_id):
         "Hashtags (if any)": hashtags
     }
 
-    rationale = (
-        f"Political inclination was extracted from voter enrichment. "
-        f"{'Hashtag activity in social posts supported this leaning.' if hashtags else 'No public hashtags found.'}"
-    )
+    rationale = build_rationale(hashtags)
 
     print("\n🗳️ Political Inclination Detection:\n")
     print(yaml.dump(output, allow_unicode=True))
     print("🧠 Rationale:\n" + rationale)
+    return {"data": output, "rationale": rationale}
+
+# === BATCH ===
+BATCH_SQL = """
+SELECT b.voter_id, v.name, v.constituency, v.political_inclination, v.voter_id IS NOT NULL, {hashtags}
+FROM temp.batch_voter_ids b
+LEFT JOIN voter_enriched_demo v ON v.voter_id = b.voter_id
+GROUP BY b.seq
+ORDER BY b.seq
+"""
+RAW_HASHTAGS = "(SELECT GROUP_CONCAT(p.hashtags, ' ') FROM social_posts p WHERE p.voter_id = b.voter_id AND p.hashtags <> '')"
+INDEXED_HASHTAGS = "(SELECT GROUP_CONCAT('#' || h.tag, ' ') FROM hashtag_postings h WHERE h.voter_id = b.voter_id)"
+
+def read_voter_ids(stream):
+    """
+    Yields EPIC numbers from a text/CSV stream, one per line (first column),
+    skipping blanks, comments and a voter_id/epic_no header.
+    """
+    for line in stream:
+        voter_id = line.split(",", 1)[0].strip().strip('"')
+        if voter_id and not voter_id.startswith("#") and voter_id.lower() not in ("voter_id", "epic_no"):
+            yield voter_id
+
+def detect_batch(voter_ids, out, chunk_size=BATCH_CHUNK):
+    """
+    Resolves an iterable of voter ids in chunks through a temp-table join and
+    writes one JSON object per id to out, in input order. Only one chunk is
+    held in memory. Returns (total, found).
+    """
+    conn = write_conn()
+    indexed = hashtag_index.installed(conn)
+    batch_sql = BATCH_SQL.format(hashtags=INDEXED_HASHTAGS if indexed else RAW_HASHTAGS)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS batch_voter_ids (seq INTEGER PRIMARY KEY, voter_id TEXT NOT NULL)")
+    ids = iter(voter_ids)
+    total = found = 0
+    started = time.time()
+    while True:
+        chunk = list(itertools.islice(ids, chunk_size))
+        if not chunk:
+            break
+        # A savepoint, not rollback(): it leaves a transaction the caller has open on this
+        # shared writer alone, and releasing it outside one still ends the read snapshot
+        # between chunks so WAL checkpoints can proceed
+        conn.execute("SAVEPOINT batch_chunk")
+        try:
+            conn.execute("DELETE FROM temp.batch_voter_ids")
+            conn.executemany("INSERT INTO temp.batch_voter_ids (voter_id) VALUES (?)", ((v,) for v in chunk))
+            for voter_id, name, constituency, inclination, matched, hashtags in conn.execute(batch_sql):
+                hashtags = hashtags or ""
+                record = {"voter_id": voter_id, "found": bool(matched)}
+                if matched:
+                    found += 1
+                    record.update({
+                        "name": name,
+                        "constituency": constituency,
+                        "political_inclination": leaning_label(inclination),
+                        "hashtags": hashtags,
+                        "rationale": build_rationale(hashtags),
+                    })
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        finally:
+            conn.execute("ROLLBACK TO batch_chunk")
+            conn.execute("RELEASE batch_chunk")
+        total += len(chunk)
+        elapsed = max(time.time() - started, 1e-6)
+        print(f"⏳ {total} voter ids resolved ({found} found) — {total / elapsed:.0f} ids/s", file=sys.stderr)
+    return total, found
+
+def run_batch(batch_file, batch_output="-"):
+    src = sys.stdin if batch_file == "-" else open(batch_file, encoding="utf-8")
+    dst = sys.stdout if batch_output == "-" else open(batch_output, "w", encoding="utf-8")
+    try:
+        total, found = detect_batch(read_voter_ids(src), dst)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+    return {"ok": True, "message": f"✅ {total} voter ids processed, {found} found.", "files": [] if batch_output == "-" else [batch_output]}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Hashtag-based voter leaning detection (prompt 14).")
+    parser.add_argument("--batch", nargs="?", const="-", metavar="IDS_FILE",
+                        help="detect for every voter id in IDS_FILE (one per line; '-' or no value: stdin)")
+    parser.add_argument("--out", default="-", metavar="RESULTS_JSONL",
+                        help="batch results as JSON lines (default '-': stdout)")
+    return parser.parse_args(argv)
+
+# === RUN ===
+def run(params):
+    if params.get("batch_file"):
+        return run_batch(params["batch_file"], params.get("batch_output") or "-")
+    voter_id = str(params.get("voter_id", "")).strip()
+    if not voter_id:
+        return {"ok": False, "message": "❌ VOTER_ID not provided."}
+    detected = detect_political_inclination(voter_id)
+    if not detected:
+        return {"ok": False, "message": "❌ No data found for that EPIC No (voter_id)."}
+    return {"ok": True, "message": "", **detected}
 
 if __name__ == "__main__":
+    # Batch: python3 prompt_14.py --batch ids.txt|- [--out results.jsonl]
+    args = parse_args()
+    if args.batch:
+        result = run_batch(args.batch, args.out)
+        print(result["message"], file=sys.stderr)
+        exit(0)
+
 # PATCH START
-    import os
-    voter_id = os.getenv('VOTER_ID')
-    if not voter_id:
-        voter_id = voter_id = input("🔍 Enter EPIC No (voter_id): ").strip()
+    params = params_from_env()
+    if not params.get("voter_id") and not params.get("batch_file"):
+        params["voter_id"] = input("🔍 Enter EPIC No (voter_id): ").strip()
 # PATCH END
-    detect_political_inclination(voter_id)
+    run(params)
 
@@ -1,48 +1,65 @@
 # prompt_31.py – FINAL WORKING VERSION (Safe, Schema-Compliant, GUI-Compatible)
 
 import os
-import sqlite3
 import json
+import multiprocessing
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
-from generate_pitch_deck_pdf_fixed import generate_pitch_deck_pdf
+from generate_pitch_deck_pdf import generate_pitch_deck_pdf, warm_assets
+from common import read_conn, get_constituency_code, save_variants
+from prompt_registry import params_from_env
+from rollups import issue_source, sentiment_source
 
-DB_PATH = "voter_data/voter_data.db"
 SLOGAN_PATH = "voter_data/pitch_decks/slogans.json"
-
-def get_constituency_code_from_name(name):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT code FROM constituencies WHERE LOWER(name) = LOWER(?)", (name.lower(),))
-    row = cursor.fetchone()
-    conn.close()
-    return row[0] if row else None
+DECK_DIR = "voter_data/pitch_decks"
+ALL_SLIDES = ",".join(str(n) for n in range(1, 21))
+DEFAULT_SLOGAN = "Your Voice, Your Power, Your Future."
+
+# One row per constituency and its own (non-opponent) candidates, for batch runs;
+# {issues} and {sentiment} are filled from rollups.issue_source() / sentiment_source()
+CONTEXTS_SQL = """
+SELECT k.code, k.name,
+       c.name, c.actual_party, c.caste, c.religion, c.age, c.gender, c.photo, c.symbol, c.swot,
+       c.education, c.profession, c.candidate_id,
+       (SELECT i.issue FROM {issues} i WHERE i.constituency = k.code ORDER BY i.post_count DESC LIMIT 1),
+       s.avg_sentiment_score, s.positive_pct, s.negative_pct
+FROM constituencies k
+JOIN candidates c ON LOWER(c.constituency) = LOWER(k.name) AND c.is_opponent = 0
+LEFT JOIN {sentiment} s ON s.constituency = k.code
+ORDER BY k.name, c.rowid
+"""
 
 def load_candidate_context(constituency_code):
-    conn = sqlite3.connect(DB_PATH)
+    conn = read_conn()
     cursor = conn.cursor()
 
     cursor.execute("SELECT name FROM constituencies WHERE code = ?", (constituency_code,))
     row = cursor.fetchone()
     constituency_name = row[0] if row else "Unknown"
 
-    cursor.execute("SELECT avg_sentiment_score, positive_pct, negative_pct FROM constituency_sentiment WHERE constituency = ?", (constituency_code,))
+    # Also feeds the deck's sentiment slide, so it is read once
+    cursor.execute(f"SELECT avg_sentiment_score, positive_pct, negative_pct FROM {sentiment_source(conn)} WHERE constituency = ?", (constituency_code,))
     sentiment = cursor.fetchone()
 
-    cursor.execute("SELECT issue FROM constituency_issue_sentiment WHERE constituency = ? ORDER BY post_count DESC LIMIT 1", (constituency_name,))
+    cursor.execute(f"SELECT issue FROM {issue_source(conn)} WHERE constituency = ? ORDER BY post_count DESC LIMIT 1", (constituency_code,))
     issue_row = cursor.fetchone()
 
     cursor.execute("""
-        SELECT name, actual_party, caste, religion, age, gender, photo, symbol, swot, education, profession
+        SELECT name, actual_party, caste, religion, age, gender, photo, symbol, swot, education, profession, candidate_id
         FROM candidates
         WHERE LOWER(constituency) = LOWER(?) AND is_opponent = 0
     """, (constituency_name,))
     candidate = cursor.fetchone()
 
-    conn.close()
-
     if not candidate:
         raise ValueError(f"❌ No candidate found for constituency: {constituency_name}")
 
+    return build_context(constituency_code, constituency_name, candidate, issue_row[0] if issue_row else None, sentiment)
+
+def build_context(constituency_code, constituency_name, candidate, issue, sentiment):
     return {
         "constituency_code": constituency_code,
         "constituency_name": constituency_name,
@@ -57,20 +74,25 @@ def load_candidate_context(constituency_code):
         "swot": candidate[8],
         "education": candidate[9],
         "profession": candidate[10],
-        "issue": issue_row[0] if issue_row else "development",
+        "candidate_id": candidate[11],
+        "issue": issue or "development",
         "avg_sentiment_score": round(sentiment[0], 2) if sentiment else 0.0,
         "positive_pct": round(sentiment[1]*100, 1) if sentiment else 0.0,
-        "negative_pct": round(sentiment[2]*100, 1) if sentiment else 0.0
+        "negative_pct": round(sentiment[2]*100, 1) if sentiment else 0.0,
+        "sentiment": (sentiment[1], sentiment[2]) if sentiment else None
     }
 
-def load_slogan_for_constituency(name):
+def load_slogans():
     try:
         with open(SLOGAN_PATH, "r") as f:
-            data = json.load(f)
-        return data.get(name, {}).get("slogan")
+            return json.load(f)
     except Exception as e:
         print(f"⚠️ Could not load slogans.json: {e}")
-        return None
+        return {}
+
+def load_slogan_for_constituency(name, slogans=None):
+    data = slogans if slogans is not None else load_slogans()
+    return data.get(name, {}).get("slogan")
 
 def show_rationale(ctx, slogan):
     print("\n📊 Pitch Deck Generation: Strategic Rationale\n")
@@ -81,28 +103,8 @@ def show_rationale(ctx, slogan):
     print(f"🪧 Slogan to be used: **{slogan}**")
     print("\n✅ Deck will combine emotion + vision + performance framing.\n")
 
-# === MAIN ===
-if __name__ == "__main__":
-    constituency = os.environ.get("CONSTITUENCY_NAME", "Mandya")
-    if not constituency:
-        print("❌ CONSTITUENCY_NAME not provided via environment.")
-        exit(1)
-
-    selected_raw = os.environ.get("SELECTED_SLIDES", "1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20")
-    selected_slides = [s.strip() for s in selected_raw.split(",") if s.strip().isdigit() and 1 <= int(s.strip()) <= 20]
-    print(f"📊 Slides selected: {', '.join(selected_slides)}")
-
-    constituency_code = get_constituency_code_from_name(constituency)
-    if not constituency_code:
-        print(f"❌ Constituency '{constituency}' not found.")
-        exit(1)
-
-    ctx = load_candidate_context(constituency_code)
-    slogan = load_slogan_for_constituency(ctx["constituency_name"]) or "Your Voice, Your Power, Your Future."
-
-    show_rationale(ctx, slogan)
-
-    rationale_text = f"""📊 Pitch Deck Generation: Strategic Rationale
+def build_rationale(ctx):
+    return f"""📊 Pitch Deck Generation: Strategic Rationale
 
 To craft this deck for **{ctx['candidate_name']}** ({ctx['party_name']}, {ctx['constituency_name']}), we analyzed:
 - 🔍 Voter sentiment & top issues: **{ctx['issue']}**
@@ -117,56 +119,33 @@ The final pitch deck will:
 
 🎯 Generating deck now..."""
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # ✅ Fetch candidate_id using correct column
-    cursor.execute("""
-        SELECT candidate_id FROM candidates
-        WHERE LOWER(name) = LOWER(?) AND LOWER(constituency) = LOWER(?) AND is_opponent = 0
-    """, (ctx["candidate_name"], ctx["constituency_name"]))
-    row = cursor.fetchone()
-    if not row:
-        raise ValueError(f"❌ Could not find candidate_id for {ctx['candidate_name']} in {ctx['constituency_name']}")
-    candidate_id = row[0]
-
-    # ✅ Delete previous prompt_31 entry for this constituency
-    cursor.execute("DELETE FROM prompt_outputs WHERE prompt_id = 31 AND LOWER(constituency) = LOWER(?)", (ctx["constituency_name"].lower(),))
+def store_rationale(ctx, rationale_text):
+    # Replace the prompt_31 entry for this constituency: variant 0 carries the rationale
+    save_variants(
+        31, ctx["constituency_name"], ["__rationale_only__"], candidate_id=ctx["candidate_id"],
+        rationale=rationale_text, source_script="prompt_31.py", first_variant=0
+    )
 
-    # ✅ Insert dummy variant + text + rationale to meet schema
-    cursor.execute("""
-        INSERT INTO prompt_outputs (
-            prompt_id, constituency, candidate_id,
-            variant_number, generated_text, rationale, created_at, source_script
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        31,
-        ctx["constituency_name"],
-        candidate_id,
-        0,
-        "__rationale_only__",
-        rationale_text,
-        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "prompt_31.py"
-    ))
-
-    conn.commit()
-    conn.close()
+def parse_slides(selected_raw):
+    return [s.strip() for s in selected_raw.split(",") if s.strip().isdigit() and 1 <= int(s.strip()) <= 20]
 
-    print("\n" + rationale_text + "\n")
-    print("✅ Generating PDF pitch deck...")
+def asset_paths(ctx):
+    return f"voter_data/photos/{ctx['photo']}", f"voter_data/symbols/{ctx['symbol'].replace('.png', '_flat.png')}"
 
-    photo_path = f"voter_data/photos/{ctx['photo']}"
-    symbol_path = f"voter_data/symbols/{ctx['symbol'].replace('.png', '_flat.png')}"
+def render_deck(ctx, slogan, selected_slides, progress=None):
+    """
+    Renders ctx's deck into DECK_DIR and returns the output path.
+    """
+    photo_path, symbol_path = asset_paths(ctx)
     bg_path = "assets/bg_bjp.jpg" if ctx["party_name"].lower() == "bjp" else "assets/bg_congress.jpg"
     footer_text = "Bharat Mata Ki Jai" if ctx["party_name"].lower() == "bjp" else "Jai Hind, Jai Jawan, Jai Kisan"
     theme_color = "#F26522" if ctx["party_name"].lower() == "bjp" else "#2E7D32"
 
     date_tag = datetime.now().strftime("%Y%m%d")
-    candidate_slug = ctx["candidate_name"].lower().replace(" ", "_")
+    candidate_slug = ctx["candidate_name"].lower().replace(" ", "_").replace("/", "_")
     constituency_slug = ctx["constituency_name"].lower().replace(" ", "_")
-    output_file = f"voter_data/pitch_decks/pd_{candidate_slug}_{constituency_slug}_{date_tag}.pdf"
+    # The candidate id keeps decks of same-named candidates apart
+    output_file = f"{DECK_DIR}/pd_{candidate_slug}_{ctx['candidate_id']}_{constituency_slug}_{date_tag}.pdf"
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
 
     generate_pitch_deck_pdf(
@@ -188,8 +167,179 @@ The final pitch deck will:
         footer_text=footer_text,
         theme_color=theme_color,
         slogan_text=slogan,
-        selected_slides=selected_slides
+        selected_slides=selected_slides,
+        progress=progress,
+        constituency_code=ctx["constituency_code"],
+        prefetched={"sentiment": ctx["sentiment"]}
     )
+    return output_file
+
+# === BATCH ===
+def read_constituency_names(stream):
+    """
+    Yields constituency names from a text/CSV stream, one per line (first
+    column), skipping blanks, comments and a constituency/name header.
+    """
+    for line in stream:
+        name = line.split(",", 1)[0].strip().strip('"')
+        if name and not name.startswith("#") and name.lower() not in ("constituency", "constituency_name", "name"):
+            yield name
+
+def load_all_contexts(names=None):
+    """
+    Deck contexts for every own candidate of every constituency (or only of
+    those in names, matched case-insensitively) in one query. Returns
+    (contexts, missing names).
+    """
+    wanted = {n.lower() for n in names} if names else None
+    contexts = []
+    conn = read_conn()
+    for row in conn.execute(CONTEXTS_SQL.format(issues=issue_source(conn), sentiment=sentiment_source(conn))):
+        code, name = row[0], row[1]
+        if wanted is not None and name.lower() not in wanted:
+            continue
+        contexts.append(build_context(code, name, row[2:14], row[14], row[15:18] if row[15] is not None else None))
+    missing = sorted(wanted - {c["constituency_name"].lower() for c in contexts}) if wanted else []
+    return contexts, missing
+
+_shared = {}
+
+def _init_worker(shared):
+    # Read-only data loaded once by the parent (inherited as-is under fork)
+    _shared.update(shared)
+
+def deck_key(ctx):
+    # Manifest key: a constituency can have several own candidates
+    return f"{ctx['constituency_name']}/{ctx['candidate_id']}"
+
+def _render_one(ctx, selected_slides):
+    started = time.time()
+    entry = {"key": deck_key(ctx), "constituency": ctx["constituency_name"], "candidate": ctx["candidate_name"]}
+    try:
+        slogan = load_slogan_for_constituency(ctx["constituency_name"], _shared.get("slogans", {})) or DEFAULT_SLOGAN
+        entry.update(ok=True, output=render_deck(ctx, slogan, selected_slides), slogan=slogan)
+    except Exception as e:
+        entry.update(ok=False, error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc())
+    entry["seconds"] = round(time.time() - started, 2)
+    return entry
+
+def run_batch(names=None, selected_slides=None, workers=None):
+    """
+    Renders a deck per own candidate of every constituency (or of names)
+    across a process pool and writes a JSON manifest with per-deck output,
+    timing and errors, keyed by constituency and candidate. One failed deck
+    doesn't stop the others.
+    """
+    selected_slides = selected_slides or parse_slides(ALL_SLIDES)
+    contexts, missing = load_all_contexts(names)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(contexts) or 1))
+    print(f"📊 Rendering {len(contexts)} deck(s) on {workers} worker(s); slides: {', '.join(selected_slides)}")
+
+    started = time.time()
+    entries = [{"key": name, "constituency": name, "ok": False, "error": "constituency or candidate not found",
+                "seconds": 0.0} for name in missing]
+    # Resize and decode the party symbols (shared across decks) once here;
+    # fork shares them (and the parent's loaded modules and data) with every
+    # worker. Each worker resizes its own photo through the on-disk cache.
+    if {"1", "19"} & set(selected_slides):
+        symbols = [asset_paths(ctx)[1] for ctx in contexts if ctx["symbol"]]
+        print(f"🖼️  {warm_assets(symbol_paths=symbols)} symbol(s) prepared")
+    methods = multiprocessing.get_all_start_methods()
+    mp_context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                             initializer=_init_worker, initargs=({"slogans": load_slogans()},)) as pool:
+        futures = {pool.submit(_render_one, ctx, selected_slides): ctx for ctx in contexts}
+        for done, future in enumerate(as_completed(futures), 1):
+            ctx = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:   # worker process died
+                entry = {"key": deck_key(ctx), "constituency": ctx["constituency_name"],
+                         "candidate": ctx["candidate_name"], "ok": False, "error": f"{type(e).__name__}: {e}", "seconds": None}
+            if entry["ok"]:
+                try:
+                    store_rationale(ctx, build_rationale(ctx))
+                except Exception as e:
+                    entry["warning"] = f"rationale not stored: {type(e).__name__}: {e}"
+            entries.append(entry)
+            status = f"✅ {entry['seconds']}s" if entry["ok"] else f"❌ {entry['error']}"
+            print(f"⏳ {done}/{len(contexts)} {ctx['constituency_name']} ({ctx['candidate_name']}): {status}", file=sys.stderr)
+
+    failed = [e for e in entries if not e["ok"]]
+    manifest = {
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "selected_slides": selected_slides,
+        "workers": workers,
+        "seconds": round(time.time() - started, 2),
+        "decks": len(entries) - len(failed),
+        "failed": len(failed),
+        "entries": {e.pop("key"): e
+                    for e in sorted(entries, key=lambda e: (e["constituency"].lower(), e.get("candidate") or ""))},
+    }
+    os.makedirs(DECK_DIR, exist_ok=True)
+    manifest_path = f"{DECK_DIR}/batch_manifest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    message = f"✅ {manifest['decks']} deck(s) rendered, {len(failed)} failed in {manifest['seconds']}s — manifest: {manifest_path}"
+    return {"ok": manifest["decks"] > 0, "message": message,
+            "files": [manifest_path] + [e["output"] for e in entries if e["ok"]]}
+
+# === RUN ===
+def run(params):
+    """
+    Entry point for prompt_registry. params mirror the CLI environment
+    (constituency_name, selected_slides, batch_file, batch_workers); the result lists the deck under "files".
+    An optional params["progress"](done, total) callback receives slide progress.
+    With batch_file ("all", or a file of constituency names / "-"), decks are
+    rendered for many constituencies at once (see run_batch).
+    """
+    selected_slides = parse_slides(params.get("selected_slides", ALL_SLIDES))
+    if params.get("batch_file"):
+        batch_file = params["batch_file"]
+        if batch_file == "all":
+            names = None
+        elif batch_file == "-":
+            names = list(read_constituency_names(sys.stdin))
+        else:
+            with open(batch_file, encoding="utf-8") as f:
+                names = list(read_constituency_names(f))
+        return run_batch(names, selected_slides, workers=int(params.get("batch_workers") or 0) or None)
+
+    constituency = params.get("constituency_name", "Mandya")
+    if not constituency:
+        return {"ok": False, "message": "❌ CONSTITUENCY_NAME not provided via environment."}
+
+    print(f"📊 Slides selected: {', '.join(selected_slides)}")
 
-    print(f"\n✅ Pitch deck saved to {output_file}")
+    constituency_code = get_constituency_code(constituency)
+    if not constituency_code:
+        return {"ok": False, "message": f"❌ Constituency '{constituency}' not found."}
 
+    ctx = load_candidate_context(constituency_code)
+    slogan = load_slogan_for_constituency(ctx["constituency_name"]) or DEFAULT_SLOGAN
+
+    show_rationale(ctx, slogan)
+
+    rationale_text = build_rationale(ctx)
+    store_rationale(ctx, rationale_text)
+
+    print("\n" + rationale_text + "\n")
+    print("✅ Generating PDF pitch deck...")
+
+    output_file = render_deck(ctx, slogan, selected_slides, progress=params.get("progress"))
+
+    return {"ok": True, "message": f"\n✅ Pitch deck saved to {output_file}", "files": [output_file], "rationale": rationale_text}
+
+# === MAIN ===
+if __name__ == "__main__":
+    # Batch: python3 prompt_31.py --batch all|names.txt|- [--workers N]
+    params = params_from_env()
+    args = sys.argv[1:]
+    if "--batch" in args:
+        params["batch_file"] = args[args.index("--batch") + 1] if args.index("--batch") + 1 < len(args) else "all"
+    if "--workers" in args:
+        params["batch_workers"] = args[args.index("--workers") + 1]
+    result = run(params)
+    print(result["message"])
+    exit(0 if result["ok"] else 1)
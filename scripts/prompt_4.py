@@ -1,149 +1,140 @@
 # prompt_4.py — Call to Action to Vote (GUI-Safe, CPU-Efficient)
 
-import sqlite3
-import os
 from datetime import datetime
-from kalpana_llm_bridge import call_llama
+from common import read_conn, get_constituency_code, save_variants, finalize_variant
+from kalpana_llm_bridge import call_llama_n, is_llm_error
+from prompt_registry import params_from_env
+from retriever import retrieve
+from rollups import issue_source, sentiment_source
 
-DB_PATH = "voter_data/voter_data.db"
 PROMPT_ID = 4
 THEME = "Call to Vote"
-
-def get_constituency_code(name):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT code FROM constituencies WHERE LOWER(name) = LOWER(?)", (name.lower(),))
-    row = cursor.fetchone()
-    conn.close()
-    return row[0] if row else None
+GROUNDING_K = 3
 
 def load_context(code):
-    conn = sqlite3.connect(DB_PATH)
+    conn = read_conn()
     cursor = conn.cursor()
 
     cursor.execute("SELECT name FROM constituencies WHERE code = ?", (code,))
     constituency = cursor.fetchone()[0]
 
-    cursor.execute("SELECT avg_sentiment_score, positive_pct, negative_pct FROM constituency_sentiment WHERE constituency = ?", (code,))
+    cursor.execute(f"SELECT avg_sentiment_score, positive_pct, negative_pct FROM {sentiment_source(conn)} WHERE constituency = ?", (code,))
     sentiment = cursor.fetchone()
 
-    cursor.execute("SELECT candidate_id, name, actual_party, swot FROM candidates WHERE constituency = ?", (constituency,))
+    cursor.execute("SELECT candidate_id, name, actual_party, swot, caste, religion FROM candidates WHERE constituency = ?", (constituency,))
     candidate = cursor.fetchone()
-    conn.close()
+
+    cursor.execute(f"SELECT issue FROM {issue_source(conn)} WHERE constituency = ? ORDER BY post_count DESC LIMIT 1", (code,))
+    issue = cursor.fetchone()
+    top_issue = issue[0] if issue else "development"
 
     return {
+        "code": code,
         "candidate_id": candidate[0],
         "constituency": constituency,
         "candidate_name": candidate[1] if candidate else "Candidate X",
         "party_name": candidate[2] if candidate else "Party X",
         "swot": candidate[3] if candidate else "Trusted and visionary.",
-        "sentiment": f"{round(sentiment[0], 3)} ({round(sentiment[1] * 100, 1)}% 👍, {round(sentiment[2] * 100, 1)}% 👎)" if sentiment else "Neutral"
+        "caste": candidate[4] if candidate else None,
+        "religion": candidate[5] if candidate else None,
+        "sentiment": f"{round(sentiment[0], 3)} ({round(sentiment[1] * 100, 1)}% 👍, {round(sentiment[2] * 100, 1)}% 👎)" if sentiment else "Neutral",
+        "top_issue": top_issue,
     }
 
-def render_prompt(ctx):
-    return f"""
-Write a motivating call-to-action campaign message for voters in {ctx['constituency']}.
-It should inspire them to vote and support {ctx['candidate_name']} from {ctx['party_name']}.
+def add_voices(ctx):
+    # Real posts/quotes on the top issue to ground the message; only needed
+    # when a prompt is about to be rendered
+    ctx["voices"] = [doc["text"] for doc in retrieve(ctx["code"], ctx["top_issue"], GROUNDING_K)]
+    return ctx
+
+# Fixed instruction block first so its evaluated KV state is reused across constituencies
+PROMPT_PREFIX = """
+Write a motivating call-to-action campaign message for the voters of the constituency below.
+It should inspire them to vote and support the candidate and party named below.
 Use the following format:
 - Campaign Slogan
 - 3–4 line paragraph
 - 3 bullet points (why voting matters)
 - Powerful closing vote appeal
-Candidate SWOT: {ctx['swot']}
-Sentiment: {ctx['sentiment']}
 """
 
+def render_prompt(ctx, use_identity=False):
+    voices = "".join(f"- {text}\n" for text in ctx["voices"])
+    identity = ", ".join(str(v) for v in (ctx["caste"], ctx["religion"]) if v)
+    return PROMPT_PREFIX + f"""Constituency: {ctx['constituency']}
+Candidate: {ctx['candidate_name']} ({ctx['party_name']})
+Candidate SWOT: {ctx['swot']}
+""" + (f"Candidate community (caste, religion): {identity}\n" if use_identity and identity else "") + f"""Sentiment: {ctx['sentiment']}
+Top issue: {ctx['top_issue']}
+""" + (f"What voters are saying:\n{voices}" if voices else "")
+
+def build_rationale(ctx):
+    return (
+        f"Call to action for voters in {ctx['constituency']} — urging participation and civic duty. "
+        f"Sentiment: {ctx['sentiment']}. SWOT: {ctx['swot']}. "
+        f"Grounded in {len(ctx['voices'])} voter post(s)/quote(s) on {ctx['top_issue']}."
+    )
+
+def store_variants(ctx, texts, rationale, now):
+    save_variants(
+        PROMPT_ID, ctx["constituency"], texts, candidate_id=ctx["candidate_id"], theme=THEME,
+        rationale=rationale, source_script="prompt_4.py", created_at=now
+    )
+
 def clean(text):
     return "\n".join([line.strip() for line in text.strip().splitlines() if line.strip()])
 
-# === MAIN ===
-if __name__ == "__main__":
-    constituency = os.environ.get("CONSTITUENCY_NAME", "Mandya").strip()
-    choice = os.environ.get("VARIANT_CHOICE", "r").strip().lower()
+# === RUN ===
+def run(params):
+    """
+    Entry point for prompt_registry. params mirror the CLI environment
+    (constituency_name, variant_choice, use_identity_tags); returns a result dict.
+    """
+    constituency = params.get("constituency_name", "Mandya").strip()
+    choice = str(params.get("variant_choice", "r")).strip().lower()
 
     if choice not in ["1", "2", "3", "r"]:
-        print("❌ Invalid VARIANT_CHOICE")
-        exit(1)
+        return {"ok": False, "message": "❌ Invalid VARIANT_CHOICE"}
 
     code = get_constituency_code(constituency)
     if not code:
-        print(f"❌ Invalid constituency: {constituency}")
-        exit(1)
+        return {"ok": False, "message": f"❌ Invalid constituency: {constituency}"}
 
     ctx = load_context(code)
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    rationale = (
-        f"Call to action for voters in {ctx['constituency']} — urging participation and civic duty. "
-        f"Sentiment: {ctx['sentiment']}. SWOT: {ctx['swot']}."
-    )
 
     if choice == "r":
         print("🔁 Generating 3 voter appeal variants...")
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM prompt_outputs WHERE prompt_id = ? AND LOWER(constituency) = LOWER(?)", (PROMPT_ID, constituency.lower()))
-
-        for i in range(3):
-            prompt = render_prompt(ctx)
-            raw = call_llama(prompt)
-            cleaned = clean(raw)
+        add_voices(ctx)
+        rationale = build_rationale(ctx)
+
+        # One prompt evaluation, three variants decoded in parallel
+        raws = call_llama_n(
+            render_prompt(ctx, params.get("use_identity_tags", "n") == "y"), n=3, prefix=PROMPT_PREFIX, prompt_id=PROMPT_ID,
+            priority=params.get("kalpana_llm_priority"),
+            use_cache=params.get("kalpana_llm_cache_bypass", "n") != "y"
+        )
+        failed = [raw for raw in raws if is_llm_error(raw)]
+        if failed:
+            # Keep the stored variants rather than overwrite them with errors
+            return {"ok": False, "message": f"❌ {len(failed)} of {len(raws)} variant(s) failed, nothing stored: {failed[0]}"}
+        variants = [clean(raw) for raw in raws]
+        for i in range(len(variants)):
             print(f"\n📝 Variant {i+1} generated.\n")
-            cursor.execute("""
-                INSERT INTO prompt_outputs (prompt_id, candidate_id, constituency, theme, variant_number,
-                    generated_text, created_at, source_script, rationale)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                PROMPT_ID,
-                ctx["candidate_id"],
-                ctx["constituency"],
-                THEME,
-                i + 1,
-                cleaned,
-                now,
-                "prompt_4.py",
-                rationale
-            ))
-        conn.commit()
-        conn.close()
-        print("✅ Variants stored in DB.")
-        exit(0)
-
-    # Finalize: fetch selected variant from DB
-    index = int(choice)
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT generated_text FROM prompt_outputs
-        WHERE prompt_id = ? AND LOWER(constituency) = LOWER(?) AND variant_number = ?
-        LIMIT 1
-    """, (PROMPT_ID, constituency.lower(), index))
-    row = cursor.fetchone()
-
-    if not row:
-        print("❌ Variant not found. Run with VARIANT_CHOICE='r' first.")
-        exit(1)
-
-    final_text = row[0]
-
-    # Optional reconfirmation insert
-    cursor.execute("DELETE FROM prompt_outputs WHERE prompt_id = ? AND LOWER(constituency) = LOWER(?) AND variant_number = ?", (PROMPT_ID, constituency.lower(), index))
-    cursor.execute("""
-        INSERT INTO prompt_outputs (prompt_id, candidate_id, constituency, theme, variant_number,
-            generated_text, created_at, source_script, rationale)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        PROMPT_ID,
-        ctx["candidate_id"],
-        ctx["constituency"],
-        THEME,
-        index,
-        final_text,
-        now,
-        "prompt_4.py",
-        rationale
-    ))
-    conn.commit()
-    conn.close()
-
-    print("✅ Finalized successfully.")
+
+        store_variants(ctx, variants, rationale, now)
+        return {"ok": True, "message": "✅ Variants stored in DB.", "variants": variants, "rationale": rationale}
+
+    # Finalize: mark the selected variant final in place
+    final_text = finalize_variant(PROMPT_ID, ctx["constituency"], int(choice), now)
+    if final_text is None:
+        return {"ok": False, "message": "❌ Variant not found. Run with VARIANT_CHOICE='r' first."}
+
+    return {"ok": True, "message": "✅ Finalized successfully.", "text": final_text}
+
+# === MAIN ===
+if __name__ == "__main__":
+    result = run(params_from_env())
+    print(result["message"])
+    exit(0 if result["ok"] else 1)
 
@@ -0,0 +1,166 @@
+# prompt_registry.py — Discovers prompt_N modules once and runs them in-process
+#
+# Each prompt_N.py exposes run(params) -> result dict; its __main__ block builds
+# params from the environment for CLI/batch use. The GUI calls run_prompt()
+# instead of spawning "python3 prompt_N.py", so imports stay warm between clicks.
+
+import glob
+import importlib
+import io
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+
+from common import release_writer
+
+PROMPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Environment variables the scripts read in CLI mode, exposed as lower-case params
+PARAM_ENV = [
+    "CONSTITUENCY_NAME", "VARIANT_CHOICE", "USE_IDENTITY_TAGS", "VOTER_ID", "BATCH_FILE", "BATCH_OUTPUT", "BATCH_WORKERS", "SELECTED_SLIDES", "CANDIDATE_NAME",
+    "TOP_BOOTHS", "TOP_INFLUENCERS", "SLOGAN_SEED", "KALPANA_LLM_PRIORITY", "KALPANA_LLM_CACHE_BYPASS",
+]
+
+SUBPROCESS_POLL = 0.5     # seconds between cancel checks of a subprocess run
+SUBPROCESS_GRACE = 5      # seconds a cancelled script gets to exit before it is killed
+
+_registry = None
+_registry_lock = threading.Lock()
+
+class PromptCancelled(Exception):
+    # Raised from a params["progress"] callback to stop a run; run_prompt re-raises it
+    pass
+
+def params_from_env():
+    return {name.lower(): os.environ[name] for name in PARAM_ENV if name in os.environ}
+
+def discover():
+    """
+    Maps prompt id -> module name for every prompt_N.py next to this file.
+    Scanned once per process.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            found = {}
+            for path in glob.glob(os.path.join(PROMPT_DIR, "prompt_*.py")):
+                m = re.fullmatch(r"prompt_(\d+)\.py", os.path.basename(path))
+                if m:
+                    found[int(m.group(1))] = f"prompt_{m.group(1)}"
+            _registry = found
+    return _registry
+
+def get_runner(prompt_id):
+    name = discover().get(int(prompt_id))
+    if not name:
+        return None
+    if PROMPT_DIR not in sys.path:
+        sys.path.insert(0, PROMPT_DIR)
+    module = importlib.import_module(name)
+    return getattr(module, "run", None)
+
+class _ThreadStdout:
+    # Routes print() from a prompt run to that run's buffer, so concurrent
+    # Streamlit sessions don't capture each other's output
+    def __init__(self, original):
+        self.original = original
+        self.local = threading.local()
+
+    def write(self, text):
+        buf = getattr(self.local, "buffer", None)
+        return (buf or self.original).write(text)
+
+    def flush(self):
+        buf = getattr(self.local, "buffer", None)
+        (buf or self.original).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.original, name)
+
+def _capturing_stdout():
+    with _registry_lock:
+        if not isinstance(sys.stdout, _ThreadStdout):
+            sys.stdout = _ThreadStdout(sys.stdout)
+    return sys.stdout
+
+def run_prompt(prompt_id, params):
+    """
+    Runs prompt_N in-process and returns its result dict, with everything it
+    printed under "log". Modules without run() (or not present in this tree)
+    are executed as a subprocess with params passed through the environment.
+    PromptCancelled raised by the run propagates to the caller; a subprocess
+    run polls params["cancelled"]() (if given) and, once it returns True,
+    terminates the script and raises PromptCancelled.
+    """
+    try:
+        runner = get_runner(prompt_id)
+    except Exception as e:
+        return {"ok": False, "message": f"❌ Could not load prompt_{prompt_id}: {e}", "log": ""}
+
+    if runner is None:
+        return _run_subprocess(prompt_id, params)
+
+    stdout = _capturing_stdout()
+    stdout.local.buffer = io.StringIO()
+    try:
+        result = runner(params) or {}
+    except PromptCancelled:
+        raise
+    except Exception as e:
+        result = {"ok": False, "message": f"❌ prompt_{prompt_id} failed: {e}"}
+    finally:
+        log = stdout.local.buffer.getvalue()
+        stdout.local.buffer = None
+        # A run that raised mid-transaction must not keep this thread's writer locked
+        release_writer()
+
+    result.setdefault("ok", True)
+    result.setdefault("message", "")
+    result["log"] = log
+    return result
+
+def _run_subprocess(prompt_id, params):
+    env = os.environ.copy()
+    env.update({k.upper(): str(v) for k, v in params.items() if v is not None and not callable(v)})
+    cancelled = params.get("cancelled")
+    # Output goes to a file so polling for cancellation never blocks on a full pipe
+    with tempfile.TemporaryFile() as out:
+        # Own process group: cancelling also stops what the script spawned (e.g. ffmpeg)
+        proc = subprocess.Popen(
+            [sys.executable, f"prompt_{prompt_id}.py"],
+            cwd=os.getcwd(), env=env, stdout=out, stderr=subprocess.STDOUT, start_new_session=True
+        )
+        try:
+            while True:
+                try:
+                    proc.wait(timeout=SUBPROCESS_POLL)
+                    break
+                except subprocess.TimeoutExpired:
+                    if cancelled and cancelled():
+                        raise PromptCancelled(f"prompt_{prompt_id}.py was cancelled")
+        except BaseException:
+            _terminate(proc)
+            raise
+        out.seek(0)
+        log = out.read().decode("utf-8", errors="replace")
+    return {
+        "ok": proc.returncode == 0,
+        "message": "" if proc.returncode == 0 else f"❌ prompt_{prompt_id}.py exited with code {proc.returncode}",
+        "log": log,
+    }
+
+def _terminate(proc):
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except OSError:
+            return   # already gone
+        try:
+            proc.wait(timeout=SUBPROCESS_GRACE)
+            return
+        except subprocess.TimeoutExpired:
+            continue
@@ -0,0 +1,455 @@
+# retriever.py — Offline hybrid retrieval over social_posts and campaign_quotes
+#
+# Grounds generation in real voter voices: retrieve(constituency, issue, k)
+# returns the posts and quotes of a constituency most relevant to an issue.
+#
+#   1. Candidates: BM25 over an inverted index stored in voter_data.db
+#      (context_postings, partitioned by constituency, so a query seeks only
+#      the constituency's postings for the query terms). With NumPy, the
+#      nearest documents by vector are added as candidates as well.
+#   2. Re-rank: cosine similarity of document and query embeddings, blended
+#      with the normalized BM25 score (HYBRID_ALPHA).
+#
+# Embeddings come from a local sentence-transformers model when
+# KALPANA_EMBED_MODEL points at one, else from a deterministic hashed
+# embedding (signed feature hashing of words and character trigrams), so
+# everything runs offline on CPU. NumPy and FAISS are optional: without
+# NumPy the re-rank runs in pure Python over the BM25 candidates; FAISS is
+# used for the vector leg when installed.
+#
+# Each document stores the indexed text (post text with its issue and
+# hashtags) and, separately, the body retrieve() returns: the post or quote
+# as written. Posts without text are not indexed. Documents are keyed by
+# constituency code, resolved from the row's constituency name through
+# constituencies (the lowercased name when it isn't listed there), so
+# retrieve() takes either the code or the name.
+#
+# Triggers on the source tables queue changed rows in context_index_pending;
+# sync() indexes them. ingest.py syncs after loading either table; otherwise
+# run "sync" (e.g. from cron) after writing them directly. retrieve() only
+# reads the index. Installed by migration 008 (migrate.py).
+#
+#   python3 retriever.py sync | rebuild | status
+#   python3 retriever.py <constituency> <issue> [k]
+
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import threading
+from array import array
+
+from common import execute_script, query, write_conn
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+EMBED_MODEL = os.environ.get("KALPANA_EMBED_MODEL", "")   # local model path; empty = hashed embedding
+HASH_DIM = 256
+SYNC_BATCH = 1000
+CANDIDATES = 100
+HYBRID_ALPHA = 0.5        # weight of BM25 vs. cosine in the final score
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Text column of social_posts (first match wins); the hashtags and issue
+# columns are indexed alongside it. Without one, posts aren't indexed
+POST_TEXT_COLUMNS = ("text", "content", "post_text", "body", "message", "caption")
+
+# Stored in context_index_meta; an index keyed another way is rebuilt on sync
+KEY_SCHEME = "code"
+
+TOKEN_RE = re.compile(r"\w+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on",
+    "or", "our", "the", "to", "we", "with", "your", "you", "this", "that", "was", "will",
+}
+
+DDL = """
+CREATE TABLE IF NOT EXISTS context_docs (
+    doc_id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    source_rowid INTEGER NOT NULL,
+    constituency_key TEXT,
+    text TEXT NOT NULL,
+    body TEXT NOT NULL DEFAULT '',
+    length INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    UNIQUE (source, source_rowid)
+);
+CREATE INDEX IF NOT EXISTS idx_context_docs_constituency ON context_docs (constituency_key, doc_id);
+
+CREATE TABLE IF NOT EXISTS context_postings (
+    term TEXT NOT NULL,
+    constituency_key TEXT,
+    doc_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, constituency_key, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_context_postings_doc ON context_postings (doc_id);
+
+CREATE TABLE IF NOT EXISTS context_stats (
+    constituency_key TEXT PRIMARY KEY,
+    docs INTEGER NOT NULL,
+    total_length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS context_index_meta (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS context_index_pending (
+    source TEXT NOT NULL,
+    source_rowid INTEGER NOT NULL,
+    PRIMARY KEY (source, source_rowid)
+);
+"""
+
+TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS trg_context_{table}_ins AFTER INSERT ON {table} BEGIN
+    INSERT OR IGNORE INTO context_index_pending (source, source_rowid) VALUES ('{table}', NEW.rowid);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_context_{table}_upd AFTER UPDATE ON {table} BEGIN
+    INSERT OR IGNORE INTO context_index_pending (source, source_rowid) VALUES ('{table}', OLD.rowid);
+    INSERT OR IGNORE INTO context_index_pending (source, source_rowid) VALUES ('{table}', NEW.rowid);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_context_{table}_del AFTER DELETE ON {table} BEGIN
+    INSERT OR IGNORE INTO context_index_pending (source, source_rowid) VALUES ('{table}', OLD.rowid);
+END;
+"""
+
+def tokens(text):
+    return [t for t in TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+# === Embeddings ===
+_model = None
+_model_lock = threading.Lock()
+
+def _hash_slot(feature):
+    h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+    return h % HASH_DIM, (1.0 if h >> 63 else -1.0)
+
+def hashed_embedding(text):
+    vec = [0.0] * HASH_DIM
+    for word in tokens(text):
+        slot, sign = _hash_slot(word)
+        vec[slot] += sign
+        padded = f"<{word}>"
+        for i in range(len(padded) - 2):
+            slot, sign = _hash_slot(padded[i:i + 3])
+            vec[slot] += 0.5 * sign
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+def embedder_name():
+    return f"st:{EMBED_MODEL}" if EMBED_MODEL else f"hashed:{HASH_DIM}"
+
+def embed(texts):
+    """Unit-length embeddings of texts as lists of floats."""
+    global _model
+    if not EMBED_MODEL:
+        return [hashed_embedding(t) for t in texts]
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import SentenceTransformer
+            _model = SentenceTransformer(EMBED_MODEL, device="cpu")
+    return [list(map(float, v)) for v in _model.encode(list(texts), normalize_embeddings=True)]
+
+def _pack(vec):
+    return array("f", vec).tobytes()
+
+def _unpack(blob):
+    vec = array("f")
+    vec.frombytes(blob)
+    return vec
+
+# === Maintenance ===
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def installed(conn=None):
+    sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'context_docs'"
+    return (conn.execute(sql).fetchone() if conn else query(sql, one=True)) is not None
+
+def _key_of(value, conn=None):
+    # SQL for the constituency key of a name (or code) expression
+    sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'constituencies'"
+    if (conn.execute(sql).fetchone() if conn else query(sql, one=True)) is None:
+        return f"LOWER({value})"
+    return (f"COALESCE((SELECT c.code FROM constituencies c WHERE LOWER(c.name) = LOWER({value}) OR c.code = {value}), "
+            f"LOWER({value}))")
+
+def _sources(conn):
+    """{table: SQL returning (rowid, constituency_key, text, body) for a json list of rowids}"""
+    sources = {}
+    cols = _columns(conn, "social_posts")
+    if cols and "voter_id" in cols:
+        text_col = next((c for c in POST_TEXT_COLUMNS if c in cols), None)
+        fallback = "p.constituency" if "constituency" in cols else "NULL"
+        if text_col:
+            parts = [f"p.{c}" for c in (text_col, "issue", "hashtags") if c in cols]
+            text = " || ' ' || ".join(f"COALESCE({part}, '')" for part in parts)
+            sources["social_posts"] = f"""
+                SELECT p.rowid,
+                       {_key_of(f"COALESCE({fallback}, (SELECT v.constituency FROM voter_enriched_demo v WHERE v.voter_id = p.voter_id LIMIT 1))", conn)},
+                       TRIM({text}),
+                       TRIM(COALESCE(p.{text_col}, ''))
+                FROM social_posts p
+                WHERE p.rowid IN (SELECT value FROM json_each(?))
+            """
+    cols = _columns(conn, "campaign_quotes")
+    if {"quote", "constituency"} <= cols:
+        sources["campaign_quotes"] = f"""
+            SELECT rowid, {_key_of("constituency", conn)}, TRIM(COALESCE(quote, '')), TRIM(COALESCE(quote, ''))
+            FROM campaign_quotes
+            WHERE rowid IN (SELECT value FROM json_each(?))
+        """
+    return sources
+
+def install(conn):
+    """
+    Creates the index tables and source triggers and queues every existing
+    row. Runs inside the caller's transaction.
+    """
+    execute_script(conn, DDL)
+    _write_meta(conn)
+    for table in _sources(conn):
+        execute_script(conn, TRIGGERS.format(table=table))
+        conn.execute(f"INSERT OR IGNORE INTO context_index_pending (source, source_rowid) SELECT '{table}', rowid FROM {table}")
+        print(f"  ✅ context index: {table} queued")
+
+def queue_loaded(conn, table, first_rowid):
+    """
+    Queues rows of table inserted from first_rowid on while its triggers were
+    suspended (ingest.py --bulk). Runs inside the caller's transaction.
+    """
+    conn.execute(f"INSERT OR IGNORE INTO context_index_pending (source, source_rowid) SELECT '{table}', rowid FROM {table} WHERE rowid >= ?",
+                 (first_rowid,))
+
+def _write_meta(conn):
+    conn.executemany("INSERT OR REPLACE INTO context_index_meta (name, value) VALUES (?, ?)",
+                     [("embedder", embedder_name()), ("key_scheme", KEY_SCHEME)])
+
+def _bump_stats(conn, key, docs, length):
+    conn.execute("""
+        INSERT INTO context_stats (constituency_key, docs, total_length) VALUES (?, ?, ?)
+        ON CONFLICT (constituency_key) DO UPDATE SET
+            docs = docs + excluded.docs, total_length = total_length + excluded.total_length
+    """, (key, docs, length))
+
+def _remove_docs(conn, source, rowids):
+    for doc_id, key, length in conn.execute(
+        "SELECT doc_id, constituency_key, length FROM context_docs WHERE source = ? AND source_rowid IN (SELECT value FROM json_each(?))",
+        (source, json.dumps(rowids))
+    ).fetchall():
+        conn.execute("DELETE FROM context_postings WHERE doc_id = ?", (doc_id,))
+        conn.execute("DELETE FROM context_docs WHERE doc_id = ?", (doc_id,))
+        _bump_stats(conn, key, -1, -length)
+
+def sync(conn=None, batch=SYNC_BATCH):
+    """
+    Indexes rows queued by the source triggers. Returns the number of rows
+    processed.
+    """
+    conn = conn or write_conn()
+    if not installed(conn):
+        return 0
+    stored = dict(conn.execute("SELECT name, value FROM context_index_meta WHERE name IN ('embedder', 'key_scheme')"))
+    if stored.get("embedder", embedder_name()) != embedder_name() or stored.get("key_scheme") != KEY_SCHEME:
+        # Vectors from another embedder aren't comparable, and keys from
+        # another scheme don't match retrieve(): re-index everything
+        return rebuild(conn)
+    sources = _sources(conn)
+    processed = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            queued = conn.execute(
+                "SELECT source, source_rowid FROM context_index_pending ORDER BY source, source_rowid LIMIT ?", (batch,)
+            ).fetchall()
+            if not queued:
+                conn.commit()
+                return processed
+            by_source = {}
+            for source, rowid in queued:
+                by_source.setdefault(source, []).append(rowid)
+            for source, rowids in by_source.items():
+                _remove_docs(conn, source, rowids)
+                if source not in sources:
+                    continue
+                # Skip rows with no post/quote text of their own
+                rows = [r for r in conn.execute(sources[source], (json.dumps(rowids),)).fetchall() if r[3]]
+                vectors = embed([text for _, _, text, _ in rows])
+                for (rowid, key, text, body), vec in zip(rows, vectors):
+                    terms = tokens(text)
+                    if not terms:
+                        continue
+                    doc_id = conn.execute(
+                        "INSERT INTO context_docs (source, source_rowid, constituency_key, text, body, length, vector) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (source, rowid, key, text, body, len(terms), _pack(vec))
+                    ).lastrowid
+                    tf = {}
+                    for term in terms:
+                        tf[term] = tf.get(term, 0) + 1
+                    conn.executemany(
+                        "INSERT INTO context_postings (term, constituency_key, doc_id, tf) VALUES (?, ?, ?, ?)",
+                        [(term, key, doc_id, n) for term, n in tf.items()]
+                    )
+                    _bump_stats(conn, key, 1, len(terms))
+            conn.executemany("DELETE FROM context_index_pending WHERE source = ? AND source_rowid = ?", queued)
+            conn.execute("""
+                INSERT INTO context_index_meta (name, value) VALUES ('generation', 1)
+                ON CONFLICT (name) DO UPDATE SET value = value + 1
+            """)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        processed += len(queued)
+
+def rebuild(conn=None):
+    conn = conn or write_conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table in ("context_postings", "context_docs", "context_stats"):
+            conn.execute(f"DELETE FROM {table}")
+        for table in _sources(conn):
+            conn.execute(f"INSERT OR IGNORE INTO context_index_pending (source, source_rowid) SELECT '{table}', rowid FROM {table}")
+        _write_meta(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return sync(conn)
+
+def pending():
+    return query("SELECT COUNT(*) FROM context_index_pending", one=True)[0] if installed() else 0
+
+# === Retrieval ===
+_vectors = {}
+_vectors_lock = threading.Lock()
+
+def _generation():
+    row = query("SELECT value FROM context_index_meta WHERE name = 'generation'", one=True)
+    return row[0] if row else 0
+
+def _vector_leg(key, qvec, limit):
+    """
+    Nearest documents of a constituency by cosine similarity, from an
+    in-memory matrix cached per index generation (NumPy, FAISS if present).
+    """
+    if np is None:
+        return []
+    generation = _generation()
+    with _vectors_lock:
+        cached = _vectors.get(key)
+        if not cached or cached[0] != generation:
+            rows = query("SELECT doc_id, vector FROM context_docs WHERE constituency_key IS ?", (key,))
+            ids = np.array([r[0] for r in rows], dtype=np.int64)
+            matrix = np.frombuffer(b"".join(r[1] for r in rows), dtype=np.float32).reshape(len(rows), -1) if rows \
+                else np.zeros((0, len(qvec)), dtype=np.float32)
+            index = None
+            if faiss is not None and len(rows):
+                index = faiss.IndexFlatIP(matrix.shape[1])
+                index.add(matrix)
+            cached = _vectors[key] = (generation, ids, matrix, index)
+    _, ids, matrix, index = cached
+    if not len(ids):
+        return []
+    q = np.asarray(qvec, dtype=np.float32).reshape(1, -1)
+    if index is not None:
+        _, found = index.search(q, min(limit, len(ids)))
+        return [int(ids[i]) for i in found[0] if i >= 0]
+    sims = matrix @ q[0]
+    top = np.argsort(-sims)[:limit]
+    return [int(ids[i]) for i in top]
+
+def _bm25(key, terms, limit):
+    stats = query("SELECT docs, total_length FROM context_stats WHERE constituency_key IS ?", (key,), one=True)
+    if not stats or not stats[0]:
+        return {}
+    docs, total_length = stats
+    avg_length = total_length / docs
+    term_list = json.dumps(sorted(set(terms)))
+    df = dict(query("""
+        SELECT term, COUNT(*) FROM context_postings
+        WHERE term IN (SELECT value FROM json_each(?)) AND constituency_key IS ?
+        GROUP BY term
+    """, (term_list, key)))
+    scores = {}
+    for term, doc_id, tf, length in query("""
+        SELECT p.term, p.doc_id, p.tf, d.length
+        FROM context_postings p
+        JOIN context_docs d ON d.doc_id = p.doc_id
+        WHERE p.term IN (SELECT value FROM json_each(?)) AND p.constituency_key IS ?
+    """, (term_list, key)):
+        idf = math.log(1 + (docs - df[term] + 0.5) / (df[term] + 0.5))
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+        scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+    return dict(sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit])
+
+def retrieve(constituency, issue, k=5):
+    """
+    Top-k posts/quotes of a constituency for an issue:
+        [{"source", "text", "score", "bm25", "cosine"}, ...]
+    text is the post/quote as written. With no usable issue terms, the k
+    most recently indexed documents. Returns [] when the index isn't
+    installed. Rows written since the last sync() aren't searched yet.
+    constituency is its code or name.
+    """
+    if not installed():
+        return []
+    key = query(f"SELECT {_key_of('?1')}", (constituency or "",), one=True)[0]
+    terms = tokens(issue)
+    if not terms:
+        rows = query("""
+            SELECT source, body FROM context_docs WHERE constituency_key IS ? ORDER BY doc_id DESC LIMIT ?
+        """, (key, int(k)))
+        return [{"source": source, "text": text, "score": 0.0, "bm25": 0.0, "cosine": 0.0} for source, text in rows]
+
+    qvec = embed([issue])[0]
+    bm25 = _bm25(key, terms, CANDIDATES)
+    candidates = set(bm25) | set(_vector_leg(key, qvec, CANDIDATES))
+    if not candidates:
+        return []
+    top_bm25 = max(bm25.values(), default=0.0) or 1.0
+    results = []
+    for doc_id, source, text, blob in query(
+        "SELECT doc_id, source, body, vector FROM context_docs WHERE doc_id IN (SELECT value FROM json_each(?))",
+        (json.dumps(sorted(candidates)),)
+    ):
+        cosine = sum(a * b for a, b in zip(_unpack(blob), qvec))
+        lexical = bm25.get(doc_id, 0.0) / top_bm25
+        results.append({
+            "source": source,
+            "text": text,
+            "score": round(HYBRID_ALPHA * lexical + (1 - HYBRID_ALPHA) * cosine, 4),
+            "bm25": round(bm25.get(doc_id, 0.0), 4),
+            "cosine": round(cosine, 4),
+            "_id": doc_id,
+        })
+    results.sort(key=lambda r: (-r["score"], r["_id"]))
+    for r in results:
+        del r["_id"]
+    return results[:int(k)]
+
+# === MAIN ===
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "sync"
+    if command in ("sync", "rebuild", "status"):
+        if not installed():
+            print("⚠️ Context index not installed — run: python3 migrate.py")
+            exit(1)
+        if command == "status":
+            print(f"ℹ️ {pending()} row(s) waiting for the next sync.")
+        else:
+            print(f"✅ Indexed {sync() if command == 'sync' else rebuild()} row(s).")
+    elif len(sys.argv) > 2:
+        k = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+        print(json.dumps(retrieve(sys.argv[1], sys.argv[2], k), indent=2, ensure_ascii=False))
+    else:
+        print("❌ Usage: python3 retriever.py [sync|rebuild|status|<constituency> <issue> [k]]")
+        exit(1)
@@ -0,0 +1,309 @@
+# rollups.py — Incrementally maintained constituency rollup tables
+#
+# Triggers on voter_enriched_demo and social_posts keep these tables current on
+# every insert/update/delete, so readers get per-booth / per-constituency
+# numbers with an index seek instead of a GROUP BY over voters or posts:
+#
+#   booth_influencer_rollup   group-admin count and follower sum per booth
+#   constituency_post_rollup  post count, sentiment sum, +/- counts per constituency
+#   issue_post_rollup         post count and sentiment sum per constituency and issue
+#
+# The booth rollup is keyed by LOWER(constituency) name, like the voter rows it
+# counts. The post rollups are keyed by constituency code, like the aggregate
+# tables (constituency_sentiment, constituency_issue_sentiment): readers take
+# their FROM source from sentiment_source() / issue_source(). A constituency
+# present in the post rollups reads live numbers from its posts (positive_pct =
+# share of posts scoring above 0); one with no posts keeps its precomputed rows
+# from the aggregate tables, which are used alone when the rollups aren't
+# installed. The post
+# rollups need social_posts columns constituency/issue/sentiment_score and the
+# constituencies table. Installed by migration 004 (migrate.py).
+#
+#   python3 rollups.py rebuild     # recompute every rollup from scratch
+#   python3 rollups.py check       # compare rollups with a fresh GROUP BY; exit 1 on drift
+
+import sys
+
+from common import execute_script, query, write_conn
+
+POST_COLUMNS = {"constituency", "issue", "sentiment_score"}
+
+BOOTH_DDL = """
+CREATE TABLE IF NOT EXISTS booth_influencer_rollup (
+    constituency_key TEXT NOT NULL,
+    booth_key TEXT NOT NULL,
+    booth_location TEXT,
+    influencer_count INTEGER NOT NULL DEFAULT 0,
+    total_followers INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (constituency_key, booth_key)
+);
+CREATE INDEX IF NOT EXISTS idx_booth_rollup_rank ON booth_influencer_rollup (constituency_key, total_followers DESC);
+
+CREATE TRIGGER IF NOT EXISTS trg_booth_rollup_ins AFTER INSERT ON voter_enriched_demo
+WHEN NEW.is_group_admin = 1 BEGIN
+    INSERT INTO booth_influencer_rollup (constituency_key, booth_key, booth_location, influencer_count, total_followers)
+    VALUES (LOWER(NEW.constituency), COALESCE(NEW.booth_location, ''), NEW.booth_location, 1, COALESCE(NEW.followers_estimated, 0))
+    ON CONFLICT (constituency_key, booth_key) DO UPDATE SET
+        influencer_count = influencer_count + 1,
+        total_followers = total_followers + excluded.total_followers;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_booth_rollup_del AFTER DELETE ON voter_enriched_demo
+WHEN OLD.is_group_admin = 1 BEGIN
+    UPDATE booth_influencer_rollup SET
+        influencer_count = influencer_count - 1,
+        total_followers = total_followers - COALESCE(OLD.followers_estimated, 0)
+    WHERE constituency_key = LOWER(OLD.constituency) AND booth_key = COALESCE(OLD.booth_location, '');
+    DELETE FROM booth_influencer_rollup
+    WHERE constituency_key = LOWER(OLD.constituency) AND booth_key = COALESCE(OLD.booth_location, '')
+      AND influencer_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_booth_rollup_upd
+AFTER UPDATE OF constituency, booth_location, is_group_admin, followers_estimated ON voter_enriched_demo
+WHEN OLD.is_group_admin = 1 OR NEW.is_group_admin = 1 BEGIN
+    UPDATE booth_influencer_rollup SET
+        influencer_count = influencer_count - 1,
+        total_followers = total_followers - COALESCE(OLD.followers_estimated, 0)
+    WHERE OLD.is_group_admin = 1
+      AND constituency_key = LOWER(OLD.constituency) AND booth_key = COALESCE(OLD.booth_location, '');
+    DELETE FROM booth_influencer_rollup
+    WHERE constituency_key = LOWER(OLD.constituency) AND booth_key = COALESCE(OLD.booth_location, '')
+      AND influencer_count <= 0;
+    INSERT INTO booth_influencer_rollup (constituency_key, booth_key, booth_location, influencer_count, total_followers)
+    SELECT LOWER(NEW.constituency), COALESCE(NEW.booth_location, ''), NEW.booth_location, 1, COALESCE(NEW.followers_estimated, 0)
+    WHERE NEW.is_group_admin = 1
+    ON CONFLICT (constituency_key, booth_key) DO UPDATE SET
+        influencer_count = influencer_count + 1,
+        total_followers = total_followers + excluded.total_followers;
+END;
+"""
+
+def _code_of(row):
+    # Posts carry the constituency name (or already its code); rollups store the code
+    return (f"COALESCE((SELECT c.code FROM constituencies c WHERE LOWER(c.name) = LOWER({row}.constituency)), "
+            f"{row}.constituency)")
+
+# Applied to NEW rows with sign +1 and OLD rows with sign -1
+def _post_delta(row, sign):
+    key = _code_of(row)
+    return f"""
+    INSERT INTO constituency_post_rollup (constituency_key, post_count, sentiment_sum, positive_count, negative_count)
+    SELECT {key}, {sign}, {sign} * COALESCE({row}.sentiment_score, 0),
+           {sign} * COALESCE({row}.sentiment_score > 0, 0), {sign} * COALESCE({row}.sentiment_score < 0, 0)
+    WHERE {row}.constituency IS NOT NULL
+    ON CONFLICT (constituency_key) DO UPDATE SET
+        post_count = post_count + excluded.post_count,
+        sentiment_sum = sentiment_sum + excluded.sentiment_sum,
+        positive_count = positive_count + excluded.positive_count,
+        negative_count = negative_count + excluded.negative_count;
+    INSERT INTO issue_post_rollup (constituency_key, issue, post_count, sentiment_sum)
+    SELECT {key}, {row}.issue, {sign}, {sign} * COALESCE({row}.sentiment_score, 0)
+    WHERE {row}.constituency IS NOT NULL AND {row}.issue IS NOT NULL
+    ON CONFLICT (constituency_key, issue) DO UPDATE SET
+        post_count = post_count + excluded.post_count,
+        sentiment_sum = sentiment_sum + excluded.sentiment_sum;
+    DELETE FROM constituency_post_rollup WHERE constituency_key = {key} AND post_count <= 0;
+    DELETE FROM issue_post_rollup WHERE constituency_key = {key} AND issue IS {row}.issue AND post_count <= 0;
+"""
+
+POST_DDL = f"""
+CREATE TABLE IF NOT EXISTS constituency_post_rollup (
+    constituency_key TEXT PRIMARY KEY,
+    post_count INTEGER NOT NULL DEFAULT 0,
+    sentiment_sum REAL NOT NULL DEFAULT 0,
+    positive_count INTEGER NOT NULL DEFAULT 0,
+    negative_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS issue_post_rollup (
+    constituency_key TEXT NOT NULL,
+    issue TEXT NOT NULL,
+    post_count INTEGER NOT NULL DEFAULT 0,
+    sentiment_sum REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (constituency_key, issue)
+);
+CREATE INDEX IF NOT EXISTS idx_issue_rollup_rank ON issue_post_rollup (constituency_key, post_count DESC);
+
+CREATE TRIGGER IF NOT EXISTS trg_post_rollup_ins AFTER INSERT ON social_posts BEGIN
+    {_post_delta("NEW", 1)}
+END;
+CREATE TRIGGER IF NOT EXISTS trg_post_rollup_del AFTER DELETE ON social_posts BEGIN
+    {_post_delta("OLD", -1)}
+END;
+CREATE TRIGGER IF NOT EXISTS trg_post_rollup_upd AFTER UPDATE OF constituency, issue, sentiment_score ON social_posts BEGIN
+    {_post_delta("OLD", -1)}
+    {_post_delta("NEW", 1)}
+END;
+"""
+
+# === Fresh aggregates (rollup table -> query with the same column order) ===
+FRESH = {
+    "booth_influencer_rollup": """
+        SELECT LOWER(constituency) AS constituency_key, COALESCE(booth_location, '') AS booth_key, booth_location,
+               COUNT(*) AS influencer_count, COALESCE(SUM(followers_estimated), 0) AS total_followers
+        FROM voter_enriched_demo WHERE is_group_admin = 1
+        GROUP BY LOWER(constituency), COALESCE(booth_location, '')
+    """,
+    "constituency_post_rollup": f"""
+        SELECT {_code_of("p")} AS constituency_key, COUNT(*) AS post_count,
+               COALESCE(SUM(sentiment_score), 0) AS sentiment_sum,
+               COALESCE(SUM(sentiment_score > 0), 0) AS positive_count,
+               COALESCE(SUM(sentiment_score < 0), 0) AS negative_count
+        FROM social_posts p WHERE constituency IS NOT NULL
+        GROUP BY 1
+    """,
+    "issue_post_rollup": f"""
+        SELECT {_code_of("p")} AS constituency_key, issue, COUNT(*) AS post_count,
+               COALESCE(SUM(sentiment_score), 0) AS sentiment_sum
+        FROM social_posts p WHERE constituency IS NOT NULL AND issue IS NOT NULL
+        GROUP BY 1, issue
+    """,
+}
+# Source table each rollup is maintained from
+SOURCE_TABLE = {
+    "booth_influencer_rollup": "voter_enriched_demo",
+    "constituency_post_rollup": "social_posts",
+    "issue_post_rollup": "social_posts",
+}
+# Columns compared by check(); float sums are rounded so summation order doesn't count as drift
+CHECK_COLUMNS = {
+    "booth_influencer_rollup": "constituency_key, booth_key, influencer_count, total_followers",
+    "constituency_post_rollup": "constituency_key, post_count, ROUND(sentiment_sum, 6), positive_count, negative_count",
+    "issue_post_rollup": "constituency_key, issue, post_count, ROUND(sentiment_sum, 6)",
+}
+
+# === Helpers ===
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def _has_table(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+def installed(conn):
+    # Rollup tables present in this DB
+    return [table for table in FRESH if _has_table(conn, table)]
+
+def install(conn):
+    """
+    Creates the rollup tables and triggers for whichever source tables this
+    DB has. Runs inside the caller's transaction.
+    """
+    if _has_table(conn, "voter_enriched_demo"):
+        execute_script(conn, BOOTH_DDL)
+        print("  ✅ booth_influencer_rollup")
+    else:
+        print("  ⏭️  booth_influencer_rollup: table voter_enriched_demo not found")
+
+    if not _has_table(conn, "constituencies"):
+        print("  ⏭️  post rollups: table constituencies not found")
+    elif _has_table(conn, "social_posts") and POST_COLUMNS <= _columns(conn, "social_posts"):
+        execute_script(conn, POST_DDL)
+        print("  ✅ constituency_post_rollup, issue_post_rollup")
+    else:
+        print(f"  ⏭️  post rollups: social_posts needs columns {', '.join(sorted(POST_COLUMNS))}")
+
+# === Readers ===
+# Same columns as the aggregate tables, so either can back the same query. A
+# constituency with no rows in the post rollup keeps its precomputed rows.
+SENTIMENT_ROLLUP = """(
+    SELECT constituency_key AS constituency, sentiment_sum / post_count AS avg_sentiment_score,
+           CAST(positive_count AS REAL) / post_count AS positive_pct,
+           CAST(negative_count AS REAL) / post_count AS negative_pct
+    FROM constituency_post_rollup
+    UNION ALL
+    SELECT constituency, avg_sentiment_score, positive_pct, negative_pct FROM constituency_sentiment a
+    WHERE NOT EXISTS (SELECT 1 FROM constituency_post_rollup r WHERE r.constituency_key = a.constituency)
+)"""
+ISSUE_ROLLUP = """(
+    SELECT constituency_key AS constituency, issue, post_count FROM issue_post_rollup
+    UNION ALL
+    SELECT constituency, issue, post_count FROM constituency_issue_sentiment a
+    WHERE NOT EXISTS (SELECT 1 FROM issue_post_rollup r WHERE r.constituency_key = a.constituency)
+)"""
+
+def _table_exists(conn, table):
+    sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+    return (conn.execute(sql, (table,)).fetchone() if conn else query(sql, (table,), one=True)) is not None
+
+def _source(conn, rollup, aggregate, combined):
+    if not _table_exists(conn, rollup):
+        return aggregate
+    if not _table_exists(conn, aggregate):
+        # Just the rollup half of the union
+        return combined.split("UNION ALL")[0] + ")"
+    return combined
+
+def sentiment_source(conn=None):
+    """
+    FROM source with (constituency code, avg_sentiment_score, positive_pct,
+    negative_pct): the live post rollup, with constituency_sentiment for
+    constituencies that have no posts (or alone when the rollup isn't installed).
+    """
+    return _source(conn, "constituency_post_rollup", "constituency_sentiment", SENTIMENT_ROLLUP)
+
+def issue_source(conn=None):
+    """
+    FROM source with (constituency code, issue, post_count): the live issue
+    rollup, with constituency_issue_sentiment for constituencies that have no
+    posts with an issue (or alone when the rollup isn't installed).
+    """
+    return _source(conn, "issue_post_rollup", "constituency_issue_sentiment", ISSUE_ROLLUP)
+
+def rebuild(conn, tables=None):
+    """
+    Recomputes rollups from the source tables. Runs inside the caller's
+    transaction; returns {table: row count}.
+    """
+    counts = {}
+    for table in tables or installed(conn):
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"INSERT INTO {table} {FRESH[table]}")
+        counts[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    return counts
+
+def check(conn):
+    """
+    Returns {table: number of rows that differ from a fresh GROUP BY}.
+    """
+    drift = {}
+    for table in installed(conn):
+        cols = CHECK_COLUMNS[table]
+        stored = f"SELECT {cols} FROM {table}"
+        fresh = f"SELECT {cols} FROM ({FRESH[table]})"
+        drift[table] = conn.execute(f"""
+            SELECT COUNT(*) FROM (
+                SELECT * FROM ({stored} EXCEPT {fresh})
+                UNION ALL
+                SELECT * FROM ({fresh} EXCEPT {stored})
+            )
+        """).fetchone()[0]
+    return drift
+
+# === MAIN ===
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    conn = write_conn()
+    if command == "rebuild":
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            counts = rebuild(conn)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if not counts:
+            print("⚠️ No rollup tables installed — run: python3 migrate.py")
+        for table, n in counts.items():
+            print(f"✅ {table}: {n} rows")
+    elif command == "check":
+        drift = check(conn)
+        if not drift:
+            print("⚠️ No rollup tables installed — run: python3 migrate.py")
+        for table, n in drift.items():
+            print(f"{'❌' if n else '✅'} {table}: {n} row(s) out of sync")
+        if any(drift.values()):
+            print("❌ Rollups drifted — run: python3 rollups.py rebuild")
+            exit(1)
+    else:
+        print("❌ Usage: python3 rollups.py [rebuild|check]")
+        exit(1)
@@ -0,0 +1,342 @@
+# slogan_index.py — Compiled search and near-duplicate index over the slogan pool
+#
+# Every slogan is tokenized for BM25 ranking (issue / tag / theme fields of a
+# pool entry count FIELD_BOOST times) and shingled (character 3-grams of its
+# normalized text) into a MinHash signature. LSH banding buckets signatures so
+# a slogan is only compared with cluster leaders sharing a bucket; a slogan
+# whose estimated Jaccard similarity to a leader clears DUP_THRESHOLD joins
+# that leader's near-duplicate cluster, otherwise it leads a new one.
+#
+# select() runs a ranked BM25 query (e.g. the constituency's top issues plus
+# candidate context) and picks N slogans with a seeded max-marginal-relevance
+# pass: relevance minus similarity to the slogans already picked. At most one
+# slogan per cluster is picked, so N picks are guaranteed whenever the pool has
+# N clusters; slogans matching no query term are only used to fill up.
+#
+# The index is compiled to <pool>.index next to the pool and reloaded from
+# there (a few ms) until the pool file's mtime or size changes.
+#
+#   python3 slogan_index.py compile                   # (re)build the compiled index
+#   python3 slogan_index.py report                    # pool-wide dedup report
+#   python3 slogan_index.py search <query> [N]        # BM25-ranked slogans
+#   python3 slogan_index.py pick [N] [seed] [query]   # N diverse slogans
+
+import hashlib
+import json
+import math
+import os
+import pickle
+import random
+import re
+import sys
+import threading
+from array import array
+
+SLOGAN_FILE = "voter_data/slogan_pool.json"
+INDEX_FORMAT = 1          # bump when the compiled layout changes
+SHINGLE = 3
+NUM_PERM = 64
+BANDS = 16                # 16 bands x 4 rows: pairs above ~0.5 Jaccard are very likely to collide
+DUP_THRESHOLD = 0.6       # estimated Jaccard at or above which two slogans are near-duplicates
+MMR_LAMBDA = 0.7
+MMR_WINDOW = 64           # candidates scored per pick
+BM25_K1 = 1.2
+BM25_B = 0.75
+FIELD_BOOST = 2           # weight of issue/tag/theme terms relative to slogan text
+FIELDS = ("issue", "issues", "tags", "theme", "category")
+_MASK = (1 << 64) - 1
+
+TOKEN_RE = re.compile(r"\w+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on",
+    "or", "our", "the", "to", "we", "with", "your", "you",
+}
+
+def normalize(text):
+    return " ".join(TOKEN_RE.findall(text.lower()))
+
+def tokens(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+def shingles(text, k=SHINGLE):
+    norm = normalize(text)
+    if len(norm) <= k:
+        return {norm} if norm else set()
+    return {norm[i:i + k] for i in range(len(norm) - k + 1)}
+
+# Fixed hash family, so signatures are comparable across runs
+_rng = random.Random(0x5106A)
+_SEEDS = [_rng.getrandbits(64) for _ in range(NUM_PERM)]
+
+def minhash(shingle_set):
+    if not shingle_set:
+        return (_MASK,) * NUM_PERM
+    hashed = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingle_set]
+    return tuple(min(h ^ seed for h in hashed) for seed in _SEEDS)
+
+def similarity(sig1, sig2):
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return sum(1 for x, y in zip(sig1, sig2) if x == y) / NUM_PERM
+
+def _bands(sig):
+    rows = NUM_PERM // BANDS
+    return [(b, tuple(sig[b * rows:(b + 1) * rows])) for b in range(BANDS)]
+
+def _field_text(item):
+    parts = []
+    for field in FIELDS:
+        value = item.get(field)
+        if isinstance(value, (list, tuple)):
+            parts.extend(str(v) for v in value)
+        elif value:
+            parts.append(str(value))
+    return " ".join(parts)
+
+def as_query(query):
+    """
+    Normalizes a query to {term: weight}: a string weighs each of its terms
+    1.0, a dict maps free text to a weight (terms keep the highest weight).
+    """
+    if not query:
+        return {}
+    if isinstance(query, str):
+        query = {query: 1.0}
+    weights = {}
+    for text, weight in query.items():
+        for term in tokens(str(text)):
+            weights[term] = max(weights.get(term, 0.0), float(weight))
+    return weights
+
+class SloganIndex:
+    def __init__(self, pool):
+        """
+        pool: list of {"text": ..., optional "issue"/"tags"/"theme"} dicts (or
+        plain strings) as stored in slogan_pool.json. Empty texts and exact
+        repeats are dropped.
+        """
+        self.texts = []
+        self.exact_duplicates = 0
+        seen = set()
+        fields = []
+        for item in pool:
+            if not isinstance(item, dict):
+                item = {"text": str(item)}
+            text = str(item.get("text", "")).strip()
+            if not text:
+                continue
+            if normalize(text) in seen:
+                self.exact_duplicates += 1
+                continue
+            seen.add(normalize(text))
+            self.texts.append(text)
+            fields.append(_field_text(item))
+
+        # BM25 term statistics
+        self.postings = {}
+        self.lengths = []
+        for i, (text, field) in enumerate(zip(self.texts, fields)):
+            tf = {}
+            for term in tokens(text):
+                tf[term] = tf.get(term, 0) + 1
+            for term in tokens(field):
+                tf[term] = tf.get(term, 0) + FIELD_BOOST
+            for term, n in tf.items():
+                self.postings.setdefault(term, []).append((i, n))
+            self.lengths.append(sum(tf.values()))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        # Flat array of NUM_PERM-wide signatures: compact on disk, fast to load
+        self.signatures = array("Q")
+        for text in self.texts:
+            self.signatures.extend(minhash(shingles(text)))
+        self._buckets = None
+
+        # Leader clustering over LSH candidates: a slogan joins the earliest
+        # leader it nearly duplicates, else starts a cluster (no transitive chaining)
+        self.candidate_pairs = 0
+        self.leader_of = []
+        buckets = self.buckets()
+        for i in range(len(self.texts)):
+            sig = self.signature(i)
+            candidates = set()
+            for band in _bands(sig):
+                candidates.update(j for j in buckets[band] if j < i and self.leader_of[j] == j)
+            self.candidate_pairs += len(candidates)
+            leader = next((j for j in sorted(candidates) if similarity(sig, self.signature(j)) >= DUP_THRESHOLD), i)
+            self.leader_of.append(leader)
+        self.representatives = [i for i, leader in enumerate(self.leader_of) if i == leader]
+
+    def signature(self, i):
+        return self.signatures[i * NUM_PERM:(i + 1) * NUM_PERM]
+
+    def buckets(self):
+        # LSH band -> slogan ids; derived, so rebuilt on first use after loading
+        if self._buckets is None:
+            self._buckets = {}
+            for i in range(len(self.texts)):
+                for band in _bands(self.signature(i)):
+                    self._buckets.setdefault(band, []).append(i)
+        return self._buckets
+
+    def clusters(self):
+        members = {}
+        for i, leader in enumerate(self.leader_of):
+            members.setdefault(leader, []).append(i)
+        return list(members.values())
+
+    # === Retrieval ===
+    def idf(self, term):
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.texts) - df + 0.5) / (df + 0.5))
+
+    def scores(self, query):
+        """BM25 score of every slogan matching at least one query term: {i: score}."""
+        result = {}
+        for term, weight in as_query(query).items():
+            idf = self.idf(term)
+            for i, tf in self.postings.get(term, ()):
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / (self.avg_length or 1))
+                result[i] = result.get(i, 0.0) + weight * idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return result
+
+    def search(self, query, limit=10):
+        """Top slogans for query as [(text, score)], best first."""
+        ranked = sorted(self.scores(query).items(), key=lambda item: (-item[1], item[0]))
+        return [(self.texts[i], score) for i, score in ranked[:limit]]
+
+    def near_duplicates(self, text):
+        """Pool slogans whose estimated similarity to text clears DUP_THRESHOLD."""
+        sig = minhash(shingles(text))
+        found = set()
+        buckets = self.buckets()
+        for band in _bands(sig):
+            found.update(buckets.get(band, ()))
+        return [self.texts[i] for i in sorted(found) if similarity(sig, self.signature(i)) >= DUP_THRESHOLD]
+
+    def select(self, count=3, query=None, seed=None, lam=MMR_LAMBDA, window=MMR_WINDOW):
+        """
+        Returns up to count slogans, at most one per near-duplicate cluster,
+        chosen by max-marginal relevance to query (see as_query). The same
+        seed gives the same picks.
+        """
+        rng = random.Random(seed)
+        # Best-scoring member of each matching cluster
+        best = {}
+        for i, score in self.scores(query).items():
+            leader = self.leader_of[i]
+            if leader not in best or score > best[leader][1]:
+                best[leader] = (i, score)
+        top = max((score for _, score in best.values()), default=0.0) or 1.0
+        relevance = {i: score / top for i, score in best.values()}
+        order = sorted(relevance, key=lambda i: (-relevance[i], rng.random()))
+        if len(order) < count:
+            rest = [i for i in self.representatives if i not in best]
+            rng.shuffle(rest)
+            order += rest
+
+        selected = []
+        pos = 0
+        while len(selected) < count and pos < len(order):
+            pick, pick_score = None, None
+            for i in order[pos:pos + window]:
+                if i in selected:
+                    continue
+                redundancy = max((similarity(self.signature(i), self.signature(j)) for j in selected), default=0.0)
+                score = lam * relevance.get(i, 0.0) - (1 - lam) * redundancy
+                if pick_score is None or score > pick_score:
+                    pick, pick_score = i, score
+            selected.append(pick)
+            # Slide the window past the leading candidates already taken
+            while pos < len(order) and order[pos] in selected:
+                pos += 1
+        return [self.texts[i] for i in selected]
+
+    def report(self):
+        dupes = [c for c in self.clusters() if len(c) > 1]
+        return {
+            "slogans": len(self.texts),
+            "exact_duplicates": self.exact_duplicates,
+            "clusters": len(self.representatives),
+            "near_duplicate_clusters": len(dupes),
+            "near_duplicate_slogans": sum(len(c) - 1 for c in dupes),
+            "candidate_pairs": self.candidate_pairs,
+            "terms": len(self.postings),
+            "examples": [[self.texts[i] for i in c] for c in sorted(dupes, key=len, reverse=True)[:10]],
+        }
+
+# === Compiled index ===
+_cache = {}
+_cache_lock = threading.Lock()
+
+def compiled_path(path=SLOGAN_FILE):
+    return os.path.splitext(path)[0] + ".index"
+
+def _stamp(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+def _load_compiled(path, stamp):
+    try:
+        with open(compiled_path(path), "rb") as f:
+            data = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+        return None
+    if data.get("format") != INDEX_FORMAT or data.get("source") != stamp:
+        return None
+    index = SloganIndex.__new__(SloganIndex)
+    index.__dict__.update(data["state"], _buckets=None)
+    return index
+
+def compile_index(path=SLOGAN_FILE):
+    """Builds the index from the pool file and writes <pool>.index atomically."""
+    stamp = _stamp(path)
+    with open(path, "r", encoding="utf-8") as f:
+        index = SloganIndex(json.load(f))
+    target = compiled_path(path)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            state = {k: v for k, v in index.__dict__.items() if k != "_buckets"}
+            pickle.dump({"format": INDEX_FORMAT, "source": stamp, "state": state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, target)
+    except OSError as e:
+        # Read-only data dir: still usable, just rebuilt per process
+        print(f"⚠️ Could not write {target}: {e}", file=sys.stderr)
+    return index
+
+def get_index(path=SLOGAN_FILE):
+    """
+    Returns the SloganIndex for path: from memory, else from the compiled
+    file, else compiled afresh. Invalidated when the pool's mtime or size
+    changes.
+    """
+    stamp = _stamp(path)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        index = _load_compiled(path, stamp) or compile_index(path)
+        _cache[path] = (stamp, index)
+        return index
+
+# === MAIN ===
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "report"
+    if command == "compile":
+        index = compile_index()
+        print(f"✅ {len(index.texts)} slogans, {len(index.representatives)} clusters → {compiled_path()}")
+    elif command == "report":
+        print(json.dumps(get_index().report(), indent=2, ensure_ascii=False))
+    elif command == "search" and len(sys.argv) > 2:
+        limit = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+        for text, score in get_index().search(sys.argv[2], limit):
+            print(f"{score:6.2f}  {text}")
+    elif command == "pick":
+        n = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+        seed = sys.argv[3] if len(sys.argv) > 3 else None
+        query = sys.argv[4] if len(sys.argv) > 4 else None
+        for slogan in get_index().select(n, query=query, seed=seed):
+            print(slogan)
+    else:
+        print("❌ Usage: python3 slogan_index.py [compile|report|search <query> [N]|pick [N] [seed] [query]]")
+        exit(1)
@@ -0,0 +1,404 @@
+# snapshot_export.py — Versioned columnar snapshots of analytics tables
+#
+# Writes voter_enriched_demo, social_posts and eci_election_history as Arrow
+# IPC (default) or Parquet files, one per constituency, with categorical
+# columns dictionary-encoded. Analysts memory-map the Arrow files and read
+# only the columns they need instead of pulling whole tables through SQLite.
+#
+# Layout (per table, under SNAPSHOT_DIR):
+#   parts/<partition dir>/<digest>.arrow      immutable partition files; the
+#                                             dir is the percent-quoted key
+#   manifest_v<N>.json                        partitions making up version N
+#   latest.json                               pointer to the newest manifest
+#
+# Triggers (installed by migration 007) record changed constituencies in
+# snapshot_dirty; "refresh" re-exports only those partitions and reuses the
+# rest from the previous version.
+#
+#   python3 snapshot_export.py export [table ...] [--format arrow|parquet]
+#   python3 snapshot_export.py refresh [table ...]
+#   python3 snapshot_export.py status
+#
+# Needs pyarrow (pip install pyarrow); the rest of the app does not.
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from urllib.parse import quote
+
+from common import execute_script, read_conn, write_conn
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+SNAPSHOT_DIR = os.environ.get("KALPANA_SNAPSHOT_DIR", "voter_data/snapshots")
+TABLES = ("voter_enriched_demo", "social_posts", "eci_election_history")
+# Low-cardinality text columns stored dictionary-encoded
+CATEGORICAL = {
+    "constituency", "booth_location", "caste", "religion", "political_inclination", "gender",
+    "party", "issue", "platform", "source_type",
+}
+FETCH_ROWS = 50000
+KEEP_VERSIONS = 3
+ALL_PARTITION = "_all"   # tables without a constituency column
+
+# === Change tracking ===
+def _columns(conn, table):
+    return [(row[1], (row[2] or "").upper()) for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def _partitioned(conn, table):
+    return any(name == "constituency" for name, _ in _columns(conn, table))
+
+def install(conn):
+    """
+    Creates snapshot_dirty and per-table triggers marking changed partitions.
+    Runs inside the caller's transaction.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS snapshot_dirty (
+            table_name TEXT NOT NULL,
+            partition_key TEXT NOT NULL,
+            PRIMARY KEY (table_name, partition_key)
+        )
+    """)
+    for table in TABLES:
+        if not _columns(conn, table):
+            print(f"  ⏭️  snapshot tracking: table {table} not found")
+            continue
+        new_key = "LOWER(NEW.constituency)" if _partitioned(conn, table) else f"'{ALL_PARTITION}'"
+        old_key = new_key.replace("NEW.", "OLD.")
+        mark = "INSERT OR IGNORE INTO snapshot_dirty (table_name, partition_key) VALUES ('{table}', COALESCE({key}, ''));"
+        execute_script(conn, f"""
+            CREATE TRIGGER IF NOT EXISTS trg_snapshot_{table}_ins AFTER INSERT ON {table} BEGIN
+                {mark.format(table=table, key=new_key)}
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_snapshot_{table}_upd AFTER UPDATE ON {table} BEGIN
+                {mark.format(table=table, key=old_key)}
+                {mark.format(table=table, key=new_key)}
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_snapshot_{table}_del AFTER DELETE ON {table} BEGIN
+                {mark.format(table=table, key=old_key)}
+            END;
+        """)
+        print(f"  ✅ snapshot tracking: {table}")
+
+def mark_loaded(conn, table, first_rowid):
+    """
+    Marks the partitions of rows of table inserted from first_rowid on while
+    its triggers were suspended (ingest.py --bulk). Runs inside the caller's
+    transaction.
+    """
+    key = "COALESCE(LOWER(constituency), '')" if _partitioned(conn, table) else f"'{ALL_PARTITION}'"
+    conn.execute(f"""
+        INSERT OR IGNORE INTO snapshot_dirty (table_name, partition_key)
+        SELECT DISTINCT '{table}', {key} FROM {table} WHERE rowid >= ?
+    """, (first_rowid,))
+
+# === Arrow conversion ===
+STORAGE_CLASSES = ("integer", "real", "text", "blob")
+
+def _storage_classes(conn, table, columns, where, params):
+    """
+    {column: SQLite storage classes present in the partition}. SQLite keeps
+    whatever type a value was written with, whatever the declared type.
+    """
+    flags = ", ".join(f"MAX(typeof({name}) = '{c}')" for name, _ in columns for c in STORAGE_CLASSES)
+    row = conn.execute(f"SELECT {flags} FROM {table}{where}", params).fetchone()
+    return {
+        name: {c for j, c in enumerate(STORAGE_CLASSES) if row[i * len(STORAGE_CLASSES) + j]}
+        for i, (name, _) in enumerate(columns)
+    }
+
+def _arrow_type(table, name, declared, present, conn, where, params):
+    if not present:   # all NULL: go by the declared type
+        if "INT" in declared:
+            return pa.int64()
+        if any(t in declared for t in ("REAL", "FLOA", "DOUB")):
+            return pa.float64()
+        return pa.binary() if "BLOB" in declared else pa.string()
+    if present == {"integer"}:
+        return pa.int64()
+    if present <= {"integer", "real"}:
+        return pa.float64()
+    if present == {"blob"}:
+        return pa.binary()
+    if "blob" in present:
+        value = conn.execute(
+            f"SELECT {name} FROM {table}{where}{' AND' if where else ' WHERE'} typeof({name}) NOT IN ('blob', 'null') LIMIT 1",
+            params
+        ).fetchone()[0]
+        raise ValueError(f"{table}.{name} mixes BLOB and {type(value).__name__} values (e.g. {value!r}); can't export")
+    # Text mixed with numbers: widen to text rather than coerce the text
+    return pa.string()
+
+def _schema(conn, table, columns, where, params):
+    present = _storage_classes(conn, table, columns, where, params)
+    fields = []
+    for name, declared in columns:
+        value_type = _arrow_type(table, name, declared, present[name], conn, where, params)
+        if name in CATEGORICAL and value_type == pa.string():
+            value_type = pa.dictionary(pa.int32(), pa.string())
+        fields.append(pa.field(name, value_type))
+    return pa.schema(fields)
+
+def _dictionaries(conn, table, schema, where, params):
+    """
+    One dictionary per categorical column for the whole partition: Arrow IPC
+    files allow a single dictionary per field across all record batches.
+    Returns {column: (dictionary array, value -> index)}.
+    """
+    dictionaries = {}
+    for field in schema:
+        if pa.types.is_dictionary(field.type):
+            values = sorted({str(v) for (v,) in conn.execute(
+                f"SELECT DISTINCT {field.name} FROM {table}{where}", params
+            ) if v is not None})
+            dictionaries[field.name] = (pa.array(values, pa.string()), {v: i for i, v in enumerate(values)})
+    return dictionaries
+
+def _column_array(values, field, dictionary=None):
+    if dictionary is not None:
+        dictionary, index = dictionary
+        indices = pa.array([None if v is None else index[str(v)] for v in values], pa.int32())
+        return pa.DictionaryArray.from_arrays(indices, dictionary)
+    if field.type == pa.string():
+        # Widened by _schema: numbers in a text column are kept as their text
+        values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+    return pa.array(values, field.type)
+
+def _batch(rows, schema, dictionaries):
+    columns = list(zip(*rows))
+    arrays = [_column_array(list(col), field, dictionaries.get(field.name)) for col, field in zip(columns, schema)]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def _write_partition(conn, table, key, fmt, out_dir):
+    """
+    Streams one partition into a temporary file, then renames it to its
+    content digest. Returns (file name, rows).
+    """
+    columns = _columns(conn, table)
+    names = ", ".join(name for name, _ in columns)
+    if key == ALL_PARTITION:
+        where, params = "", ()
+    elif key:
+        where, params = " WHERE LOWER(constituency) = ?", (key,)
+    else:
+        where, params = " WHERE (constituency IS NULL OR constituency = '')", ()
+    # Types of the whole partition, from the same read snapshot as the rows
+    schema = _schema(conn, table, columns, where, params)
+    cursor = conn.execute(f"SELECT {names} FROM {table}{where} ORDER BY rowid", params)
+    rows = cursor.fetchmany(FETCH_ROWS)
+    # Same read snapshot as the rows, so every value has an entry
+    dictionaries = _dictionaries(conn, table, schema, where, params)
+    os.makedirs(out_dir, exist_ok=True)
+    tmp_path = os.path.join(out_dir, f".tmp-{os.getpid()}.{fmt}")
+    total = 0
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(tmp_path, schema, use_dictionary=[f.name for f in schema if pa.types.is_dictionary(f.type)])
+        write = writer.write_batch
+    else:
+        sink = pa.OSFile(tmp_path, "wb")
+        writer = pa.ipc.new_file(sink, schema)
+        write = writer.write_batch
+    try:
+        while rows:
+            write(_batch(rows, schema, dictionaries))
+            total += len(rows)
+            rows = cursor.fetchmany(FETCH_ROWS)
+    finally:
+        writer.close()
+        if fmt != "parquet":
+            sink.close()
+
+    digest = hashlib.sha256()
+    with open(tmp_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    name = f"{digest.hexdigest()[:16]}.{fmt}"
+    os.replace(tmp_path, os.path.join(out_dir, name))
+    return name, total
+
+# === Manifests ===
+def _table_dir(table):
+    return os.path.join(SNAPSHOT_DIR, table)
+
+def _partition_dir(key):
+    """
+    Directory name of a partition key. Keys are raw constituency values, so
+    everything but letters, digits and "-" is percent-quoted: no "/", ".."
+    or empty names, and no collision with the _all/_null names.
+    """
+    if key == ALL_PARTITION:
+        return key
+    if not key:
+        return "_null"
+    return quote(key, safe="").replace(".", "%2E").replace("_", "%5F").replace("~", "%7E")
+
+def latest_manifest(table):
+    try:
+        with open(os.path.join(_table_dir(table), "latest.json")) as f:
+            pointer = json.load(f)
+        with open(os.path.join(_table_dir(table), pointer["manifest"])) as f:
+            return json.load(f)
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _write_json(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def _partition_keys(conn, table):
+    if not _partitioned(conn, table):
+        return [ALL_PARTITION]
+    return [row[0] for row in conn.execute(f"SELECT DISTINCT COALESCE(LOWER(constituency), '') FROM {table}")]
+
+def export_table(table, fmt="arrow", incremental=True):
+    """
+    Writes a new snapshot version of table. With incremental=True and a
+    previous version in the same format, only partitions marked dirty since
+    then are re-exported. Returns the new manifest.
+    """
+    if pa is None:
+        raise SystemExit("❌ pyarrow is not installed — pip install pyarrow")
+    writer = write_conn()
+    previous = latest_manifest(table)
+    if previous and previous["format"] != fmt:
+        previous = None
+
+    # Claim the dirty set first: changes made during the export stay queued for next time
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        dirty = {row[0] for row in writer.execute(
+            "SELECT partition_key FROM snapshot_dirty WHERE table_name = ?", (table,)
+        )} if _has_dirty_table(writer) else None
+        if dirty is not None:
+            writer.execute("DELETE FROM snapshot_dirty WHERE table_name = ?", (table,))
+        writer.commit()
+    except BaseException:
+        writer.rollback()
+        raise
+
+    started = time.time()
+    conn = read_conn()
+    conn.execute("BEGIN")   # one read snapshot for every partition
+    try:
+        keys = _partition_keys(conn, table)
+        partitions = {}
+        reused = 0
+        for key in keys:
+            old = (previous or {}).get("partitions", {}).get(key)
+            if incremental and old and dirty is not None and key not in dirty:
+                partitions[key] = old
+                reused += 1
+                continue
+            out_dir = os.path.join(_table_dir(table), "parts", _partition_dir(key))
+            name, rows = _write_partition(conn, table, key, fmt, out_dir)
+            partitions[key] = {"file": os.path.join("parts", _partition_dir(key), name), "rows": rows}
+    except BaseException:
+        # Put the claimed partitions back so the next refresh retries them
+        if dirty:
+            writer.executemany("INSERT OR IGNORE INTO snapshot_dirty (table_name, partition_key) VALUES (?, ?)",
+                               [(table, key) for key in dirty])
+            writer.commit()
+        raise
+    finally:
+        conn.rollback()
+
+    version = (previous or latest_manifest(table) or {}).get("version", 0) + 1
+    manifest = {
+        "table": table,
+        "version": version,
+        "format": fmt,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "rows": sum(p["rows"] for p in partitions.values()),
+        "partitions": partitions,
+    }
+    name = f"manifest_v{version}.json"
+    _write_json(os.path.join(_table_dir(table), name), manifest)
+    _write_json(os.path.join(_table_dir(table), "latest.json"), {"manifest": name, "version": version})
+    _prune(table)
+    print(f"✅ {table} v{version}: {manifest['rows']} rows in {len(partitions)} partition(s), "
+          f"{len(partitions) - reused} written, {reused} reused ({time.time() - started:.1f}s)")
+    return manifest
+
+def _has_dirty_table(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'snapshot_dirty'").fetchone() is not None
+
+def _prune(table):
+    # Drop manifests beyond KEEP_VERSIONS and part files none of the kept ones use
+    root = _table_dir(table)
+    manifests = sorted(
+        (f for f in os.listdir(root) if f.startswith("manifest_v") and f.endswith(".json")),
+        key=lambda f: int(f[len("manifest_v"):-len(".json")])
+    )
+    for old in manifests[:-KEEP_VERSIONS]:
+        os.remove(os.path.join(root, old))
+    keep = set()
+    for kept in manifests[-KEEP_VERSIONS:]:
+        with open(os.path.join(root, kept)) as f:
+            keep.update(p["file"] for p in json.load(f)["partitions"].values())
+    parts_root = os.path.join(root, "parts")
+    for dirpath, _, files in os.walk(parts_root):
+        for f in files:
+            rel = os.path.relpath(os.path.join(dirpath, f), root)
+            if rel not in keep and not f.startswith(".tmp-"):
+                os.remove(os.path.join(root, rel))
+    for dirpath, dirnames, files in os.walk(parts_root, topdown=False):
+        if dirpath != parts_root and not os.listdir(dirpath):
+            shutil.rmtree(dirpath)
+
+# === Reading ===
+def open_snapshot(table, columns=None, constituencies=None):
+    """
+    Returns the latest snapshot of table as a pyarrow Table. Arrow IPC
+    partitions are memory-mapped, so only the requested columns are paged in.
+    """
+    if pa is None:
+        raise ImportError("pyarrow is not installed — pip install pyarrow")
+    manifest = latest_manifest(table)
+    if not manifest:
+        raise FileNotFoundError(f"No snapshot for {table} — run: python3 snapshot_export.py export {table}")
+    wanted = {c.lower() for c in constituencies} if constituencies else None
+    tables = []
+    for key, part in manifest["partitions"].items():
+        if wanted is not None and key not in wanted:
+            continue
+        path = os.path.join(_table_dir(table), part["file"])
+        if manifest["format"] == "parquet":
+            tables.append(pq.read_table(path, columns=columns, memory_map=True))
+        else:
+            data = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+            tables.append(data.select(columns) if columns else data)
+    if not tables:
+        return None
+    return pa.concat_tables(tables, promote_options="default") if len(tables) > 1 else tables[0]
+
+# === MAIN ===
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    command = args[0] if args else "status"
+    fmt = args[args.index("--format") + 1] if "--format" in args else "arrow"
+    tables = [a for a in args[1:] if not a.startswith("--") and a != fmt] or list(TABLES)
+    unknown = [t for t in tables if t not in TABLES]
+    if command not in ("export", "refresh", "status") or fmt not in ("arrow", "parquet") or unknown:
+        print("❌ Usage: python3 snapshot_export.py [export|refresh|status] [table ...] [--format arrow|parquet]")
+        exit(1)
+    if command == "status":
+        for table in tables:
+            m = latest_manifest(table)
+            print(f"{table}: " + (f"v{m['version']} ({m['format']}, {m['rows']} rows, {m['created_at']})" if m else "no snapshot"))
+    else:
+        for table in tables:
+            if not _columns(read_conn(), table):
+                print(f"⏭️  {table}: table not found")
+                continue
+            export_table(table, fmt=fmt, incremental=command == "refresh")
@@ -0,0 +1,49 @@
+import os
+import sys
+
+# The scripts are run from scripts/ and import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import pytest
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    """An empty voter_data.db in tmp_path behind common's pooled connections."""
+    import common
+    common.close_all()
+    monkeypatch.setattr(common, "DB_PATH", str(tmp_path / "voter_data.db"))
+    monkeypatch.setattr(common, "_wal_ready", False)
+    yield common.write_conn()
+    common.close_all()
+
+# Source tables as the data loaders create them (only the columns the scripts use)
+BASE_SCHEMA = """
+CREATE TABLE constituencies (code TEXT, name TEXT);
+CREATE TABLE candidates (
+    candidate_id INTEGER, name TEXT, constituency TEXT, actual_party TEXT, caste TEXT, religion TEXT,
+    age INTEGER, gender TEXT, photo TEXT, symbol TEXT, swot TEXT, education TEXT, profession TEXT,
+    is_opponent INTEGER DEFAULT 0
+);
+CREATE TABLE voter_enriched_demo (
+    voter_id TEXT, name TEXT, constituency TEXT, booth_location TEXT, political_inclination TEXT,
+    is_group_admin INTEGER DEFAULT 0, followers_estimated INTEGER DEFAULT 0
+);
+CREATE TABLE social_posts (
+    voter_id TEXT, constituency TEXT, text TEXT, issue TEXT, sentiment_score REAL, hashtags TEXT, posted_at TEXT
+);
+CREATE TABLE constituency_sentiment (constituency TEXT, avg_sentiment_score REAL, positive_pct REAL, negative_pct REAL);
+CREATE TABLE constituency_issue_sentiment (constituency TEXT, issue TEXT, post_count INTEGER);
+CREATE TABLE eci_election_history (constituency TEXT, year INTEGER, party TEXT, vote_share REAL);
+CREATE TABLE campaign_quotes (constituency TEXT, quote TEXT, source_type TEXT, sentiment TEXT);
+CREATE TABLE digital_campaigns (constituency TEXT, platform TEXT, followers INTEGER);
+CREATE TABLE prompt_outputs (
+    prompt_id INTEGER, candidate_id INTEGER, constituency TEXT, theme TEXT, variant_number INTEGER,
+    generated_text TEXT, created_at TEXT, source_script TEXT, rationale TEXT
+);
+"""
+
+@pytest.fixture
+def voter_db(db):
+    """db with the source tables created and nothing migrated yet."""
+    db.executescript(BASE_SCHEMA)
+    return db
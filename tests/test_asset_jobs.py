@@ -0,0 +1,102 @@
+import subprocess
+import sys
+import time
+
+import asset_jobs
+import prompt_registry
+
+import pytest
+
+@pytest.fixture
+def jobs_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(asset_jobs, "JOBS_PATH", str(tmp_path / "asset_jobs.db"))
+    monkeypatch.setattr(asset_jobs, "_schema_ready", False)
+    spawned = []
+    monkeypatch.setattr(asset_jobs, "ensure_worker", lambda: spawned.append(True))
+    return spawned
+
+def _dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+def _exits(pid, timeout=5):
+    # Gone, or a zombie waiting for init to reap it
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                if f.read().rsplit(")", 1)[1].split()[0] == "Z":
+                    return True
+        except FileNotFoundError:
+            return True
+        time.sleep(0.05)
+    return False
+
+def test_cancelled_job_stays_cancelled(jobs_db, monkeypatch):
+    job_id = asset_jobs.submit(31, {"constituency_name": "Hebbal"})
+
+    def runner(params):
+        asset_jobs.cancel(job_id)
+        params["progress"](1, 20)
+        return {"ok": True}
+    monkeypatch.setattr(prompt_registry, "get_runner", lambda prompt_id: runner)
+
+    conn = asset_jobs._connect()
+    try:
+        asset_jobs.run_job(conn, asset_jobs._claim_next(conn))
+    finally:
+        conn.close()
+    assert asset_jobs.get_job(job_id)["status"] == "cancelled"
+
+def test_crashed_job_is_requeued_and_polling_respawns_worker(jobs_db):
+    job_id = asset_jobs.submit(31, {"constituency_name": "Hebbal"})
+    conn = asset_jobs._connect()
+    try:
+        conn.execute("UPDATE asset_jobs SET status = 'running', worker_pid = ?, attempts = 1 WHERE job_id = ?",
+                     (_dead_pid(), job_id))
+        jobs_db.clear()
+        assert [j["job_id"] for j in asset_jobs.watch_jobs(31)] == [job_id]
+        assert jobs_db, "polling an orphaned job must start a worker"
+
+        job = asset_jobs._claim_next(conn)
+    finally:
+        conn.close()
+    assert job["job_id"] == job_id
+    assert asset_jobs.get_job(job_id)["attempts"] == 2
+
+def test_run_prompt_propagates_cancellation(monkeypatch):
+    def runner(params):
+        raise asset_jobs.JobCancelled("stop")
+    monkeypatch.setattr(prompt_registry, "get_runner", lambda prompt_id: runner)
+    with pytest.raises(asset_jobs.JobCancelled):
+        prompt_registry.run_prompt(31, {})
+
+def test_cancel_terminates_subprocess_prompt(jobs_db, monkeypatch, tmp_path):
+    # A prompt without run() (like prompt_32) runs as a script; it and what it spawns must stop
+    (tmp_path / "prompt_99.py").write_text(
+        "import subprocess, sys, time\n"
+        "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+        "open('pids', 'w').write(str(child.pid))\n"
+        "time.sleep(60)\n"
+    )
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(prompt_registry, "SUBPROCESS_POLL", 0.05)
+    job_id = asset_jobs.submit(99, {})
+    real_is_cancelled = asset_jobs._is_cancelled
+    def is_cancelled(conn, job):
+        if (tmp_path / "pids").exists():
+            asset_jobs.cancel(job)
+        return real_is_cancelled(conn, job)
+    monkeypatch.setattr(asset_jobs, "_is_cancelled", is_cancelled)
+
+    started = time.time()
+    conn = asset_jobs._connect()
+    try:
+        asset_jobs.run_job(conn, asset_jobs._claim_next(conn))
+    finally:
+        conn.close()
+    assert time.time() - started < 30
+    assert asset_jobs.get_job(job_id)["status"] == "cancelled"
+    child = int((tmp_path / "pids").read_text())
+    assert _exits(child)
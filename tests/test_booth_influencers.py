@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+import booth_influencers
+import rollups
+
+# The per-booth queries prompt_27 ran before the single-query engine
+OLD_BOOTHS_SQL = """
+    SELECT booth_location, COUNT(*) AS influencer_count, SUM(followers_estimated) AS total_followers
+    FROM voter_enriched_demo
+    WHERE LOWER(constituency) = LOWER(?)
+      AND is_group_admin = 1
+    GROUP BY booth_location
+    ORDER BY total_followers DESC
+    LIMIT ?
+"""
+OLD_INFLUENCERS_SQL = """
+    SELECT voter_id, name, followers_estimated, political_inclination
+    FROM voter_enriched_demo
+    WHERE LOWER(constituency) = LOWER(?)
+      AND is_group_admin = 1
+      AND booth_location = ?
+    ORDER BY followers_estimated DESC
+    LIMIT ?
+"""
+
+def _seed(conn):
+    rng = random.Random(27)
+    followers = rng.sample(range(1, 100_000), 400)
+    rows = []
+    for i, count in enumerate(followers):
+        constituency = rng.choice(["Mandya", "mandya", "Hebbal"])
+        rows.append((f"V{i:03}", f"Voter {i}", constituency, f"Booth {rng.randrange(15)}",
+                     rng.choice(["BJP", "INC", None]), int(rng.random() < 0.6), count))
+    conn.executemany("INSERT INTO voter_enriched_demo VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+
+def _old_results(conn, constituency, k, m):
+    booths = []
+    for booth, count, total in conn.execute(OLD_BOOTHS_SQL, (constituency, k)).fetchall():
+        influencers = conn.execute(OLD_INFLUENCERS_SQL, (constituency, booth, m)).fetchall()
+        booths.append({"booth": booth, "influencer_count": count, "total_followers": total, "influencers": [
+            {"voter_id": v, "name": n, "followers": f, "inclination": i} for v, n, f, i in influencers
+        ]})
+    return booths
+
+@pytest.mark.parametrize("with_rollup", [False, True])
+@pytest.mark.parametrize("k, m", [(10, 10), (3, 2), (50, 1)])
+def test_engine_matches_per_booth_queries(voter_db, with_rollup, k, m):
+    if with_rollup:
+        rollups.install(voter_db)
+        voter_db.commit()
+    _seed(voter_db)
+    assert ("booth_influencer_rollup" in rollups.installed(voter_db)) == with_rollup
+    for constituency in ("Mandya", "HEBBAL", "Nowhere"):
+        assert booth_influencers.top_booth_influencers(constituency, k, m) == _old_results(voter_db, constituency, k, m)
+
+def test_booth_without_location_is_kept(voter_db):
+    voter_db.executemany("INSERT INTO voter_enriched_demo VALUES (?, ?, ?, ?, ?, ?, ?)", [
+        ("V1", "A", "Mandya", None, "INC", 1, 500),
+        ("V2", "B", "Mandya", None, None, 1, 300),
+        ("V3", "C", "Mandya", "Booth 1", "BJP", 1, 100),
+    ])
+    voter_db.commit()
+    booths = booth_influencers.top_booth_influencers("Mandya", 5, 5)
+    # The old follow-up query matched booth_location = NULL and lost these influencers
+    assert booths[0]["booth"] is None and [i["voter_id"] for i in booths[0]["influencers"]] == ["V1", "V2"]
@@ -0,0 +1,83 @@
+import sqlite3
+
+import common
+import migrate
+import pytest
+
+def _writer_is_free():
+    other = sqlite3.connect(common.DB_PATH, timeout=0)
+    try:
+        other.execute("BEGIN IMMEDIATE")
+        other.rollback()
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        other.close()
+
+def test_transaction_rolls_back_and_releases_lock(db):
+    db.execute("CREATE TABLE t (x INTEGER)")
+    with pytest.raises(RuntimeError):
+        with common.transaction() as conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+            raise RuntimeError("boom")
+    assert not db.in_transaction
+    assert db.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    assert _writer_is_free()
+
+def test_nested_transaction_only_undoes_its_own_writes(db):
+    db.execute("CREATE TABLE t (x INTEGER)")
+    with common.transaction() as conn:
+        conn.execute("INSERT INTO t VALUES (1)")
+        with pytest.raises(RuntimeError):
+            with common.transaction() as inner:
+                inner.execute("INSERT INTO t VALUES (2)")
+                raise RuntimeError("boom")
+    assert [r[0] for r in db.execute("SELECT x FROM t")] == [1]
+
+def test_release_writer_drops_abandoned_transaction(db):
+    db.execute("CREATE TABLE t (x INTEGER)")
+    db.execute("BEGIN IMMEDIATE")
+    db.execute("INSERT INTO t VALUES (1)")
+    assert not _writer_is_free()
+    common.release_writer()
+    assert _writer_is_free()
+
+def _variants(conn):
+    return conn.execute("SELECT constituency, variant_number, generated_text, status FROM prompt_outputs "
+                        "WHERE prompt_id = 4 ORDER BY variant_number").fetchall()
+
+def test_save_variants_upserts_in_place(voter_db):
+    migrate.migrate(voter_db)
+    common.save_variants(4, "Hebbal", ["one", "two", "three"], rationale="first")
+    rowids = [r[0] for r in voter_db.execute("SELECT rowid FROM prompt_outputs ORDER BY variant_number")]
+    assert common.finalize_variant(4, "hebbal", 2) == "two"
+
+    # Same key regardless of case: rows are updated, not duplicated, and go back to draft
+    common.save_variants(4, "HEBBAL", ["uno", "dos", "tres"], rationale="second")
+    assert _variants(voter_db) == [("HEBBAL", 1, "uno", "draft"), ("HEBBAL", 2, "dos", "draft"),
+                                   ("HEBBAL", 3, "tres", "draft")]
+    assert [r[0] for r in voter_db.execute("SELECT rowid FROM prompt_outputs ORDER BY variant_number")] == rowids
+
+    # A smaller set drops the variants beyond it; other constituencies are untouched
+    common.save_variants(4, "Mandya", ["m1"])
+    common.save_variants(4, "Hebbal", ["only"])
+    assert [(c, n, t) for c, n, t, _ in _variants(voter_db)] == [("Hebbal", 1, "only"), ("Mandya", 1, "m1")]
+
+def test_finalize_variant_keeps_one_final(voter_db):
+    migrate.migrate(voter_db)
+    common.save_variants(4, "Hebbal", ["one", "two", "three"])
+    common.finalize_variant(4, "Hebbal", 1, finalized_at="2026-01-01 00:00:00")
+    assert common.finalize_variant(4, "Hebbal", 3, finalized_at="2026-01-02 00:00:00") == "three"
+    assert [(n, s) for _, n, _, s in _variants(voter_db)] == [(1, "draft"), (2, "draft"), (3, "final")]
+    assert voter_db.execute("SELECT created_at FROM prompt_outputs WHERE variant_number = 3").fetchone()[0] == "2026-01-02 00:00:00"
+    assert common.finalize_variant(4, "Hebbal", 9) is None
+    assert [(n, s) for _, n, _, s in _variants(voter_db)] == [(1, "draft"), (2, "draft"), (3, "final")]
+
+def test_save_variants_before_migration_replaces_the_set(voter_db):
+    common.save_variants(4, "Hebbal", ["one", "two", "three"])
+    common.save_variants(4, "hebbal", ["uno", "dos"])
+    rows = voter_db.execute("SELECT constituency, variant_number, generated_text FROM prompt_outputs "
+                            "ORDER BY variant_number").fetchall()
+    assert rows == [("hebbal", 1, "uno"), ("hebbal", 2, "dos")]
+    assert common.finalize_variant(4, "Hebbal", 2) == "dos"
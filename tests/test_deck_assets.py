@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+pytest.importorskip("reportlab")
+Image = pytest.importorskip("PIL.Image")
+
+import deck_assets
+
+def _cached(tmp_path, source_size, box_pt, fit):
+    src = tmp_path / f"src_{source_size[0]}x{source_size[1]}.jpg"
+    Image.new("RGB", source_size, "orange").save(src)
+    deck_assets.image(str(src), *box_pt, fit=fit, dpi=72)
+    names = [n for n in (os.listdir(deck_assets.CACHE_DIR) if os.path.isdir(deck_assets.CACHE_DIR) else []) if n.startswith(deck_assets._digest(str(src), os.stat(src)))]
+    if not names:
+        return None
+    with Image.open(os.path.join(deck_assets.CACHE_DIR, names[0])) as img:
+        return img.size
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(deck_assets, "CACHE_DIR", str(tmp_path / "cache"))
+    deck_assets._reader.cache_clear()
+    yield
+    deck_assets._reader.cache_clear()
+
+def test_stretch_never_upscales_a_side(tmp_path):
+    # Wider than the box but shorter: only the width shrinks
+    assert _cached(tmp_path, (400, 50), (100, 100), fit=False) == (100, 50)
+    assert _cached(tmp_path, (300, 300), (100, 100), fit=False) == (100, 100)
+
+def test_fit_keeps_aspect_ratio(tmp_path):
+    assert _cached(tmp_path, (400, 200), (100, 100), fit=True) == (100, 50)
+
+def test_small_source_is_not_cached(tmp_path):
+    assert _cached(tmp_path, (50, 50), (100, 100), fit=False) is None
+
+def test_decoded_images_are_bounded(tmp_path):
+    src = tmp_path / "symbol.png"
+    Image.new("RGB", (400, 400), "green").save(src)
+    first = deck_assets.image(str(src), 100, 100, dpi=72)
+    assert deck_assets.image(str(src), 100, 100, dpi=72) is first
+    for side in range(200, 200 + deck_assets.READER_CACHE_SIZE):
+        deck_assets.image(str(src), side, side, dpi=72)
+    assert deck_assets._reader.cache_info().currsize == deck_assets.READER_CACHE_SIZE
+    # The least recently used reader was dropped and is decoded again
+    assert deck_assets.image(str(src), 100, 100, dpi=72) is not first
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("reportlab")
+
+import generate_pitch_deck_pdf as pitch
+
+def _seed(conn):
+    conn.execute("INSERT INTO constituencies VALUES ('KA-158', 'Hebbal')")
+    conn.execute("INSERT INTO eci_election_history VALUES ('Hebbal', 2018, 'Party X', 41.5)")
+    conn.execute("INSERT INTO campaign_quotes VALUES ('Hebbal', 'Fix the water supply', 'rally', 'positive')")
+    conn.execute("INSERT INTO constituency_sentiment VALUES ('KA-158', 0.2, 0.6, 0.3)")
+    conn.commit()
+
+@pytest.fixture
+def loads(monkeypatch):
+    # Records every data source load while still running the real loader
+    calls = []
+    for name, loader in list(pitch.DATA_SOURCES.items()):
+        def counted(conn, deck, name=name, loader=loader):
+            calls.append(name)
+            return loader(conn, deck)
+        monkeypatch.setitem(pitch.DATA_SOURCES, name, counted)
+    return calls
+
+DECK = SimpleNamespace(constituency_name="Hebbal", constituency_code=None)
+
+def test_prefetch_loads_each_needed_source_once(voter_db, loads, monkeypatch):
+    _seed(voter_db)
+    # A second slide reading the same source doesn't load it again
+    monkeypatch.setitem(pitch.SLIDES, "98", (lambda deck: None, ("quotes",)))
+    data = pitch.prefetch(DECK, ["10", "12", "14", "98"])
+    assert sorted(loads) == ["eci_history", "quotes", "sentiment"]
+    assert data == {
+        "eci_history": [(2018, "Party X", 41.5)],
+        "quotes": [("Fix the water supply", "rally", "positive")],
+        "sentiment": (0.6, 0.3),
+    }
+
+def test_slides_without_data_cost_no_queries(voter_db, loads, monkeypatch):
+    def no_conn():
+        raise AssertionError("opened a read connection")
+    monkeypatch.setattr(pitch, "read_conn", no_conn)
+    assert pitch.prefetch(DECK, ["1", "11", "15"]) == {}
+    # Sources the caller already loaded are used as-is
+    assert pitch.prefetch(DECK, ["12"], prefetched={"quotes": ["cached"], "eci_history": ["unused"]}) == {"quotes": ["cached"]}
+    assert loads == []
+
+def test_every_slide_reads_registered_sources():
+    for number, (renderer, needs) in pitch.SLIDES.items():
+        assert callable(renderer)
+        assert set(needs) <= set(pitch.DATA_SOURCES), number
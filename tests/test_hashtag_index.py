@@ -0,0 +1,42 @@
+import sqlite3
+
+import common
+import hashtag_index
+import migrate
+
+def _seed(conn):
+    conn.execute("INSERT INTO voter_enriched_demo (voter_id, constituency, booth_location) VALUES ('V1', 'Hebbal', 'B1')")
+    conn.executemany("INSERT INTO social_posts (voter_id, hashtags) VALUES (?, ?)",
+                     [("V1", "#water #Water"), ("V1", "#jobs")])
+    conn.commit()
+    migrate.migrate(conn)
+
+def test_parse_hashtags():
+    assert hashtag_index.parse_hashtags("#Water, #jobs #water") == {"water": 2, "jobs": 1}
+    assert hashtag_index.parse_hashtags("water, jobs") == {"water": 1, "jobs": 1}
+
+def test_reads_do_not_take_the_write_lock(voter_db):
+    _seed(voter_db)
+    voter_db.execute("INSERT INTO social_posts (voter_id, hashtags) VALUES ('V1', '#roads')")
+    voter_db.commit()
+
+    blocker = sqlite3.connect(common.DB_PATH, timeout=0)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        tags = [t["tag"] for t in hashtag_index.top_hashtags_for_voter("V1")]
+    finally:
+        blocker.rollback()
+        blocker.close()
+    assert tags == ["water", "jobs"]
+    assert hashtag_index.pending() == 1
+
+def test_voter_move_requeues_posts(voter_db):
+    _seed(voter_db)
+    assert [t["tag"] for t in hashtag_index.top_hashtags_for_booth("Hebbal", "B1")] == ["water", "jobs"]
+
+    voter_db.execute("UPDATE voter_enriched_demo SET booth_location = 'B2' WHERE voter_id = 'V1'")
+    voter_db.commit()
+    assert hashtag_index.pending() == 2
+    assert hashtag_index.sync(voter_db) == 2
+    assert hashtag_index.top_hashtags_for_booth("Hebbal", "B1") == []
+    assert [t["tag"] for t in hashtag_index.top_hashtags_for_booth("Hebbal", "B2")] == ["water", "jobs"]
@@ -0,0 +1,112 @@
+import json
+
+import ingest
+
+def _rejects(path):
+    with open(f"{path}.rejects.jsonl", encoding="utf-8") as f:
+        return [json.loads(line)["record"] for line in f]
+
+def test_resume_does_not_duplicate_rejects(voter_db, tmp_path, monkeypatch):
+    voter_db.execute("INSERT INTO constituencies VALUES ('KA-158', 'Hebbal')")
+    voter_db.commit()
+    path = tmp_path / "quotes.jsonl"
+    path.write_text("\n".join(json.dumps(r) for r in [
+        {"constituency": "Hebbal", "quote": "Water first"},
+        {"constituency": "Nowhere", "quote": "Bad constituency"},
+        {"constituency": "hebbal", "quote": "Jobs at home"},
+        {"constituency": "Hebbal"},
+        {"constituency": "Hebbal", "quote": "Roads now"},
+    ]) + "\n", encoding="utf-8")
+
+    # Checkpoint after record 3, then crash on the final commit: the reject
+    # for record 4 is already in the file but past the checkpoint
+    real_commit = voter_db.commit
+    calls = {"n": 0}
+    def crash_after_checkpoint():
+        calls["n"] += 1
+        if calls["n"] > 3:
+            raise KeyboardInterrupt
+        real_commit()
+
+    class Conn:
+        def __getattr__(self, name):
+            return getattr(voter_db, name)
+        commit = staticmethod(crash_after_checkpoint)
+    with monkeypatch.context() as patch:
+        patch.setattr(ingest, "write_conn", lambda: Conn())
+        try:
+            ingest.ingest("campaign_quotes", str(path), chunk_rows=1, commit_rows=2)
+        except KeyboardInterrupt:
+            pass
+    assert _rejects(path) == [2, 4]
+
+    stats = ingest.ingest("campaign_quotes", str(path))
+    assert stats["inserted"] == 3 and stats["rejected"] == 2
+    assert _rejects(path) == [2, 4]
+    assert voter_db.execute("SELECT COUNT(*) FROM campaign_quotes").fetchone()[0] == 3
+
+def _triggers(conn):
+    return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'social_posts'")}
+
+def _posts_file(tmp_path, rows):
+    path = tmp_path / "posts.jsonl"
+    path.write_text("\n".join(json.dumps(r) for r in rows) + "\n", encoding="utf-8")
+    return str(path)
+
+def test_bulk_load_catches_up_derived_tables(voter_db, tmp_path):
+    import hashtag_index
+    import migrate
+    import retriever
+    import rollups
+    voter_db.execute("INSERT INTO constituencies VALUES ('KA-158', 'Hebbal')")
+    voter_db.commit()
+    migrate.migrate(voter_db)
+    triggers = _triggers(voter_db)
+    pragmas = [voter_db.execute(f"PRAGMA {name}").fetchone()[0] for name in ingest.LOAD_PRAGMAS]
+
+    path = _posts_file(tmp_path, [
+        {"voter_id": "V1", "constituency": "hebbal", "text": "No water", "issue": "water", "sentiment_score": -0.5, "hashtags": "#water"},
+        {"voter_id": "V2", "constituency": "Hebbal", "text": "Fix roads", "issue": "roads", "sentiment_score": 0.2, "hashtags": "#roads"},
+    ])
+    stats = ingest.ingest("social_posts", path, bulk=True)
+    assert stats["inserted"] == 2
+
+    assert _triggers(voter_db) == triggers
+    assert voter_db.execute("SELECT COUNT(*) FROM ingest_suspended_triggers").fetchone()[0] == 0
+    assert all(n == 0 for n in rollups.check(voter_db).values())
+    assert voter_db.execute("SELECT post_count FROM constituency_post_rollup").fetchall() == [(2,)]
+    assert hashtag_index.pending() == 0 and retriever.pending() == 0
+    assert voter_db.execute("SELECT COUNT(*) FROM hashtag_postings").fetchone()[0] == 2
+    assert voter_db.execute("SELECT partition_key FROM snapshot_dirty WHERE table_name = 'social_posts'").fetchall() == [("hebbal",)]
+    assert [voter_db.execute(f"PRAGMA {name}").fetchone()[0] for name in ingest.LOAD_PRAGMAS] == pragmas
+
+def test_crashed_bulk_load_restores_triggers(voter_db, tmp_path, monkeypatch):
+    import migrate
+    import rollups
+    voter_db.execute("INSERT INTO constituencies VALUES ('KA-158', 'Hebbal')")
+    voter_db.commit()
+    migrate.migrate(voter_db)
+    triggers = _triggers(voter_db)
+    path = _posts_file(tmp_path, [{"voter_id": f"V{i}", "constituency": "Hebbal", "issue": "water"} for i in range(4)])
+
+    # Killed while normalizing record 3, after records 1-2 were committed
+    real_normalize = ingest.Normalizer.normalize
+    def normalize(self, record, columns):
+        if record["voter_id"] == "V2":
+            raise KeyboardInterrupt
+        return real_normalize(self, record, columns)
+    with monkeypatch.context() as patch:
+        patch.setattr(ingest.Normalizer, "normalize", normalize)
+        try:
+            ingest.ingest("social_posts", path, bulk=True, commit_rows=2)
+        except KeyboardInterrupt:
+            pass
+    # Rows committed without the triggers: the rollups haven't seen them
+    assert voter_db.execute("SELECT COUNT(*) FROM social_posts").fetchone()[0] == 2
+    assert not _triggers(voter_db) & triggers
+    assert rollups.check(voter_db)["constituency_post_rollup"] == 1
+
+    ingest.ingest("social_posts", path, bulk=True)
+    assert _triggers(voter_db) == triggers
+    assert voter_db.execute("SELECT post_count FROM constituency_post_rollup").fetchall() == [(4,)]
+    assert all(n == 0 for n in rollups.check(voter_db).values())
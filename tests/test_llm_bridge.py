@@ -0,0 +1,168 @@
+import time
+
+import pytest
+
+import kalpana_llm_bridge as bridge
+
+BATCHED_STDOUT = """
+sequence 0:
+
+Write a slogan.
+=== RESPONSE START ===
+Water for every farm.
+
+sequence 1:
+
+Write a slogan.
+=== RESPONSE START ===
+Jobs at home, not away.
+
+main: decoded 40 tokens in 2.10 s, speed: 19.05 t/s
+llama_perf_context_print: prompt eval time =  120.00 ms /    12 tokens
+"""
+
+def test_batched_output_splits_sequences():
+    streams = bridge.parse_batched_output(BATCHED_STDOUT)
+    assert sorted(streams) == [0, 1]
+    assert bridge.extract_after_delimiter(streams[0]) == "Water for every farm."
+
+def test_batched_output_drops_trailing_log_lines():
+    streams = bridge.parse_batched_output(BATCHED_STDOUT)
+    assert bridge.extract_after_delimiter(streams[1]) == "Jobs at home, not away."
+
+def _cached_bridge(monkeypatch, tmp_path, responses):
+    import llm_cache
+    import llm_metrics
+    import llm_queue
+    monkeypatch.setattr(llm_cache, "CACHE_PATH", str(tmp_path / "cache.db"))
+    monkeypatch.setattr(llm_cache, "_schema_ready", False)
+    monkeypatch.setattr(llm_metrics, "METRICS_PATH", str(tmp_path / "metrics.db"))
+    monkeypatch.setattr(llm_metrics, "_schema_ready", False)
+
+    def no_slot(*args, **kwargs):
+        raise AssertionError("cache hit waited for a queue slot")
+    monkeypatch.setattr(llm_queue, "llm_slot", no_slot)
+
+    full_prompt = "Write a slogan." + bridge.DELIMITER
+    for i, response in enumerate(responses):
+        llm_cache.put(bridge._cache_key(full_prompt, -1, i), response)
+
+def test_stream_cache_hit_skips_queue(monkeypatch, tmp_path):
+    _cached_bridge(monkeypatch, tmp_path, ["Water for every farm."])
+    assert list(bridge.stream_llama("Write a slogan.")) == ["Water for every farm."]
+
+def test_stream_n_cache_hits_skip_queue(monkeypatch, tmp_path):
+    _cached_bridge(monkeypatch, tmp_path, ["A", "B"])
+    events = list(bridge.stream_llama_n("Write a slogan.", n=2))
+    assert events == [(0, "A"), (0, None), (1, "B"), (1, None)]
+
+def test_stream_stops_at_job_deadline(monkeypatch, tmp_path):
+    import llm_metrics
+    import llm_queue
+    monkeypatch.setattr(llm_queue, "QUEUE_PATH", str(tmp_path / "queue.db"))
+    monkeypatch.setattr(llm_queue, "_schema_ready", False)
+    monkeypatch.setattr(llm_queue, "JOB_TIMEOUT", 0.05)
+    monkeypatch.setattr(llm_metrics, "METRICS_PATH", str(tmp_path / "metrics.db"))
+    monkeypatch.setattr(llm_metrics, "_schema_ready", False)
+
+    def slow_variant(*args, **kwargs):
+        while True:
+            time.sleep(0.02)
+            yield "word "
+    monkeypatch.setattr(bridge, "_stream_variant", slow_variant)
+
+    pieces = []
+    with pytest.raises(llm_queue.JobTimeout):
+        for piece in bridge.stream_llama("Write a slogan.", use_cache=False):
+            pieces.append(piece)
+    assert 0 < len(pieces) < 10
+
+def _server_bridge(monkeypatch, tmp_path):
+    import llm_cache
+    import llm_metrics
+    import llm_queue
+    monkeypatch.setattr(llm_cache, "CACHE_PATH", str(tmp_path / "cache.db"))
+    monkeypatch.setattr(llm_cache, "_schema_ready", False)
+    monkeypatch.setattr(bridge, "LLM_BACKEND", "server")
+    monkeypatch.setattr(bridge, "ensure_server", lambda: None)
+    monkeypatch.setattr(llm_queue, "QUEUE_PATH", str(tmp_path / "queue.db"))
+    monkeypatch.setattr(llm_queue, "_schema_ready", False)
+    monkeypatch.setattr(llm_metrics, "METRICS_PATH", str(tmp_path / "metrics.db"))
+    monkeypatch.setattr(llm_metrics, "_schema_ready", False)
+    payloads = []
+    def post_json(path, payload, timeout=None):
+        payloads.append((path, payload))
+        return {"content": "Water for every farm.", "timings": {}}
+    monkeypatch.setattr(bridge, "_post_json", post_json)
+    return payloads
+
+def test_call_llama_reuses_cached_prompt(monkeypatch, tmp_path):
+    payloads = _server_bridge(monkeypatch, tmp_path)
+    assert bridge.call_llama("Write a slogan.", use_cache=False) == "Water for every farm."
+    assert payloads[-1][0] == "/completion" and payloads[-1][1]["cache_prompt"] is True
+
+def test_running_jobs_use_their_own_server_slots(monkeypatch, tmp_path):
+    import llm_queue
+    payloads = _server_bridge(monkeypatch, tmp_path)
+    monkeypatch.setattr(bridge, "SERVER_SLOTS", 4)
+    monkeypatch.setattr(llm_queue, "LLM_WORKERS", 2)
+    with llm_queue.llm_slot(label="other job") as other:
+        assert bridge._job_slots(other) == [0, 1]
+        bridge.call_llama_n("Write a slogan.", n=2, use_cache=False)
+    assert {p["id_slot"] for _, p in payloads if "id_slot" in p} == {2, 3}
+    assert any("slots/2?action=save" in path for path, _ in payloads)
+
+def test_finished_streams_forget_cancel_polls(monkeypatch, tmp_path):
+    _server_bridge(monkeypatch, tmp_path)
+    monkeypatch.setattr(bridge, "_stream_variant", lambda *args, **kwargs: iter(["Water ", "for all."]))
+    assert "".join(bridge.stream_llama("Write a slogan.", use_cache=False)) == "Water for all."
+    events = list(bridge.stream_llama_n("Write a slogan.", n=2, use_cache=False))
+    assert len(events) == 6
+    assert bridge._cancel_checked == {}
+
+def _cache_hits():
+    import llm_metrics
+    conn = llm_metrics._connect()
+    try:
+        return [r[0] for r in conn.execute("SELECT cache_hit FROM llm_metrics ORDER BY id")]
+    finally:
+        conn.close()
+
+def test_stream_metrics_report_real_cache_hits(monkeypatch, tmp_path):
+    _server_bridge(monkeypatch, tmp_path)
+    # A generation the server reported no timings for is still not a cache hit
+    monkeypatch.setattr(bridge, "_server_stream", lambda *args, **kwargs: iter(["Water ", "for all."]))
+    list(bridge.stream_llama("Write a slogan."))
+    list(bridge.stream_llama_n("Write a slogan.", n=2))
+    assert _cache_hits() == [0, 0]
+
+    # Cached by another caller while this one waited for its slot
+    lookups = []
+    def cache_get(key, use_cache):
+        lookups.append(key)
+        return None if len(lookups) == 1 else "Jobs at home."
+    monkeypatch.setattr(bridge, "_cache_get", cache_get)
+    assert list(bridge.stream_llama("Write another slogan.")) == ["Jobs at home."]
+    assert _cache_hits() == [0, 0, 1]
+
+def _no_cli(*args, **kwargs):
+    raise AssertionError("server backend ran llama-cli")
+
+def test_server_backend_skips_llama_cli(monkeypatch, tmp_path):
+    payloads = _server_bridge(monkeypatch, tmp_path)
+    for name in ("_cli_completion", "_cli_batched_completions", "_cli_stream"):
+        monkeypatch.setattr(bridge, name, _no_cli)
+    assert bridge.call_llama("Write a slogan.", use_cache=False) == "Water for every farm."
+    assert bridge.call_llama_n("Write a slogan.", n=2, use_cache=False) == ["Water for every farm."] * 2
+    assert sum(path == "/completion" for path, _ in payloads) >= 3
+
+def test_cli_backend_skips_server(monkeypatch, tmp_path):
+    payloads = _server_bridge(monkeypatch, tmp_path)
+    monkeypatch.setattr(bridge, "LLM_BACKEND", "cli")
+    monkeypatch.setattr(bridge, "ensure_server", _no_cli)
+    full = "Write a slogan." + bridge.DELIMITER
+    monkeypatch.setattr(bridge, "_cli_completion", lambda prompt, *args: full + "From the CLI.")
+    monkeypatch.setattr(bridge, "_cli_batched_completions", lambda prompt, n, *args: [full + f"Variant {i}." for i in range(n)])
+    assert bridge.call_llama("Write a slogan.", use_cache=False) == "From the CLI."
+    assert bridge.call_llama_n("Write a slogan.", n=2, use_cache=False) == ["Variant 0.", "Variant 1."]
+    assert payloads == []
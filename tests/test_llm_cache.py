@@ -0,0 +1,59 @@
+import itertools
+
+import pytest
+
+import llm_cache
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(llm_cache, "CACHE_PATH", str(tmp_path / "cache.db"))
+    monkeypatch.setattr(llm_cache, "_schema_ready", False)
+    monkeypatch.setattr(llm_cache, "CACHE_BYPASS", False)
+    # Strictly increasing clock, so recency never ties
+    clock = itertools.count(1_000_000)
+    monkeypatch.setattr(llm_cache.time, "time", lambda: float(next(clock)))
+    return llm_cache
+
+def test_key_covers_sampling(cache):
+    key = cache.make_key("Write a slogan.", "model.gguf", 300, {"seed": 1})
+    assert key == cache.make_key("Write a slogan.", "model.gguf", 300, {"seed": 1})
+    assert key != cache.make_key("Write a slogan.", "model.gguf", 300, {"seed": 2})
+    assert key != cache.make_key("Write a slogan.", "model.gguf", 200, {"seed": 1})
+
+def test_hit_and_miss_are_counted(cache):
+    assert cache.get("k") is None
+    cache.put("k", "Water for every farm.")
+    assert cache.get("k") == "Water for every farm."
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 1, 1)
+
+def test_bypass_skips_lookup_but_stores(cache, monkeypatch):
+    cache.put("k", "old")
+    assert cache.get("k", bypass=True) is None
+    monkeypatch.setattr(cache, "CACHE_BYPASS", True)
+    assert cache.get("k") is None
+    cache.put("k", "new")
+    monkeypatch.setattr(cache, "CACHE_BYPASS", False)
+    assert cache.get("k") == "new"
+    assert cache.stats()["misses"] == 0
+
+def test_least_recently_used_is_evicted(cache, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_MAX_ENTRIES", 2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("A", "C")
+    assert cache.stats()["evictions"] == 1
+
+def test_byte_budget_and_age_limit(cache, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_MAX_BYTES", 10)
+    cache.put("a", "12345")
+    cache.put("b", "123456")
+    assert cache.get("a") is None and cache.get("b") == "123456"
+
+    monkeypatch.setattr(cache, "CACHE_MAX_AGE_DAYS", 1 / 86400)
+    assert cache.get("b") is None
+    cache.evict()
+    assert cache.stats()["entries"] == 0
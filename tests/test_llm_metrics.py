@@ -0,0 +1,15 @@
+import llm_metrics
+
+def test_prompt_ids_normalize_to_number():
+    assert llm_metrics.normalize_prompt_id(4) == "4"
+    assert llm_metrics.normalize_prompt_id("4") == "4"
+    assert llm_metrics.normalize_prompt_id("prompt_4.py") == "4"
+    assert llm_metrics.normalize_prompt_id("gui_app.py") == "gui_app.py"
+
+def test_report_merges_cli_and_in_process_runs(monkeypatch, tmp_path):
+    monkeypatch.setattr(llm_metrics, "METRICS_PATH", str(tmp_path / "metrics.db"))
+    monkeypatch.setattr(llm_metrics, "_schema_ready", False)
+    llm_metrics.record(prompt_id=4, wall_ms=100.0, cache_hit=0)
+    llm_metrics.record(prompt_id="prompt_4.py", wall_ms=200.0, cache_hit=0)
+    rows = llm_metrics.report()
+    assert [(r["prompt_id"], r["calls"]) for r in rows] == [("4", 2)]
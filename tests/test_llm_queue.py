@@ -0,0 +1,41 @@
+import time
+
+import pytest
+
+import llm_queue
+
+@pytest.fixture
+def queue_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(llm_queue, "QUEUE_PATH", str(tmp_path / "llm_queue.db"))
+    monkeypatch.setattr(llm_queue, "_schema_ready", False)
+
+def _status(job_id):
+    conn = llm_queue._connect()
+    try:
+        return conn.execute("SELECT status FROM llm_jobs WHERE job_id = ?", (job_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+def test_running_job_times_out(queue_db):
+    with pytest.raises(llm_queue.JobTimeout):
+        with llm_queue.llm_slot(label="slow", timeout=0.05) as job_id:
+            llm_queue.check_deadline(job_id)
+            time.sleep(0.1)
+            llm_queue.check_deadline(job_id)
+    assert _status(job_id) == "timeout"
+    assert job_id not in llm_queue._run_deadlines
+
+def test_job_within_deadline_is_done(queue_db):
+    with llm_queue.llm_slot(label="quick", timeout=5) as job_id:
+        llm_queue.check_deadline(job_id)
+    assert _status(job_id) == "done"
+
+def test_running_jobs_hold_distinct_workers(queue_db, monkeypatch):
+    monkeypatch.setattr(llm_queue, "LLM_WORKERS", 2)
+    with llm_queue.llm_slot(label="a") as first:
+        with llm_queue.llm_slot(label="b") as second:
+            assert {llm_queue.worker_of(first), llm_queue.worker_of(second)} == {0, 1}
+    # A freed worker is handed out again
+    with llm_queue.llm_slot(label="c") as third:
+        assert llm_queue.worker_of(third) == 0
+    assert llm_queue.worker_of(third) is None
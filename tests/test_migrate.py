@@ -0,0 +1,39 @@
+import migrate
+
+def test_migrate_applies_every_version_once(voter_db):
+    assert migrate.migrate(voter_db) == [version for version, _, _ in migrate.MIGRATIONS]
+    assert migrate.migrate(voter_db) == []
+
+def test_hot_queries_use_indexes(voter_db):
+    migrate.migrate(voter_db)
+    checked = 0
+    for tables, sql, params in migrate.HOT_QUERIES:
+        for table in (tables,) if isinstance(tables, str) else tables:
+            assert migrate._has_table(voter_db, table), table
+        plan = migrate.query_plan(voter_db, sql, params)
+        assert migrate.full_scans(plan, sql) == [], f"{' '.join(sql.split())}\n" + "\n".join(plan)
+        checked += 1
+    assert checked == len(migrate.HOT_QUERIES)
+
+def test_full_scans_ignores_index_scans():
+    assert migrate.full_scans(["SCAN social_posts"]) == ["social_posts"]
+    assert migrate.full_scans(["SCAN p USING COVERING INDEX idx_x"]) == []
+    assert migrate.full_scans(["SEARCH p USING INDEX idx_x (voter_id=?)"]) == []
+    assert migrate.full_scans(["SCAN (subquery-3)"]) == []
+
+def test_full_scans_ignores_cte_results():
+    sql = "WITH booths AS MATERIALIZED (SELECT * FROM t) SELECT * FROM booths b JOIN u ON u.id = b.id"
+    plan = ["MATERIALIZE booths", "SEARCH t USING INDEX idx_t (k=?)", "SCAN b", "SCAN u"]
+    assert migrate.full_scans(plan, sql) == ["u"]
+
+def test_hot_queries_cover_booth_influencers():
+    import booth_influencers
+    sqls = {sql for _, sql, _ in migrate.HOT_QUERIES}
+    assert {booth_influencers.ROLLUP_TOP_BOOTH_INFLUENCERS_SQL, booth_influencers.TOP_BOOTH_INFLUENCERS_SQL} <= sqls
+
+def test_aggregates_rekeyed_by_code(voter_db):
+    voter_db.execute("INSERT INTO constituencies VALUES ('KA-158', 'Hebbal')")
+    voter_db.execute("INSERT INTO constituency_issue_sentiment VALUES ('hebbal', 'water', 12)")
+    voter_db.commit()
+    migrate.migrate(voter_db)
+    assert voter_db.execute("SELECT constituency FROM constituency_issue_sentiment").fetchall() == [("KA-158",)]
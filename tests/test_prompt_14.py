@@ -0,0 +1,32 @@
+import io
+import json
+
+import pytest
+
+import prompt_14
+
+def test_detect_batch_keeps_callers_transaction(voter_db):
+    voter_db.executemany(
+        "INSERT INTO voter_enriched_demo (voter_id, name, constituency, political_inclination) VALUES (?, ?, ?, ?)",
+        [("V1", "Asha", "Hebbal", "0.8"), ("V2", "Ravi", "Mandya", "-0.4")],
+    )
+    voter_db.execute("INSERT INTO social_posts (voter_id, hashtags) VALUES ('V1', '#water #jobs')")
+    voter_db.commit()
+
+    voter_db.execute("INSERT INTO prompt_outputs (prompt_id, constituency, variant_number) VALUES (14, 'Hebbal', 1)")
+    out = io.StringIO()
+    assert prompt_14.detect_batch(["V2", "missing", "V1"], out, chunk_size=2) == (3, 2)
+
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [(r["voter_id"], r["found"]) for r in records] == [("V2", True), ("missing", False), ("V1", True)]
+    # The caller's uncommitted write survived the batch
+    assert voter_db.in_transaction
+    assert voter_db.execute("SELECT COUNT(*) FROM prompt_outputs").fetchone()[0] == 1
+    voter_db.rollback()
+
+def test_cli_arguments():
+    args = prompt_14.parse_args(["--batch", "ids.txt", "--out", "results.jsonl"])
+    assert (args.batch, args.out) == ("ids.txt", "results.jsonl")
+    assert (prompt_14.parse_args(["--batch"]).batch, prompt_14.parse_args([]).batch) == ("-", None)
+    with pytest.raises(SystemExit):
+        prompt_14.parse_args(["--batch", "ids.txt", "--out"])
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+pytest.importorskip("reportlab")
+
+import prompt_31
+
+def _seed(conn):
+    conn.executemany("INSERT INTO constituencies (code, name) VALUES (?, ?)", [("C1", "Hebbal"), ("C2", "Mandya")])
+    conn.executemany("""
+        INSERT INTO candidates (candidate_id, name, constituency, actual_party, photo, symbol) VALUES (?, ?, ?, ?, ?, ?)
+    """, [(1, "A", "Hebbal", "BJP", "a.jpg", "bjp.png"), (2, "B", "Mandya", "INC", "b.jpg", "inc.png"),
+          (3, "C", "Hebbal", "BJP", "c.jpg", "bjp.png")])
+    conn.commit()
+
+def _render(ctx, slogan, selected_slides, progress=None):
+    if ctx["constituency_name"] == "Mandya":
+        raise RuntimeError("broken photo")
+    return f"{ctx['candidate_name']}.pdf"
+
+def test_failed_deck_does_not_stop_the_batch(voter_db, monkeypatch, tmp_path):
+    _seed(voter_db)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(prompt_31, "render_deck", _render)
+
+    result = prompt_31.run_batch(["Hebbal", "Mandya", "Nowhere"], ["2"], workers=2)
+
+    assert result["ok"]
+    manifest_path = result["files"][0]
+    assert sorted(result["files"][1:]) == ["A.pdf", "C.pdf"]
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert (manifest["decks"], manifest["failed"]) == (2, 2)
+    entries = manifest["entries"]
+    # Every own candidate of a constituency gets a deck
+    assert entries["Hebbal/1"]["ok"] and entries["Hebbal/3"]["candidate"] == "C"
+    assert entries["Mandya/2"]["error"] == "RuntimeError: broken photo"
+    assert "Traceback" in entries["Mandya/2"]["traceback"]
+    assert entries["nowhere"]["error"] == "constituency or candidate not found"
+    # Rationale is stored only for the deck that rendered
+    assert voter_db.execute("SELECT DISTINCT constituency FROM prompt_outputs WHERE prompt_id = 31").fetchall() == [("Hebbal",)]
+
+def test_deck_file_names_the_candidate(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(prompt_31, "generate_pitch_deck_pdf", lambda **kwargs: None)
+    ctx = {"candidate_name": "A. Kumar", "candidate_id": 7, "constituency_name": "Hebbal", "party_name": "BJP",
+           "photo": "a.jpg", "symbol": "bjp.png", "constituency_code": "KA-158", "sentiment": None}
+    for field in ("issue", "swot", "caste", "religion", "age", "gender", "education", "profession"):
+        ctx[field] = None
+    assert "pd_a._kumar_7_hebbal_" in prompt_31.render_deck(ctx, "Slogan", ["1"])
@@ -0,0 +1,42 @@
+import prompt_4
+
+def _seed(conn):
+    conn.execute("INSERT INTO constituencies VALUES ('KA-158', 'Hebbal')")
+    conn.execute("INSERT INTO candidates (candidate_id, name, constituency, actual_party, caste, religion, swot) "
+                 "VALUES (1, 'A. Kumar', 'Hebbal', 'Party X', 'Vokkaliga', 'Hindu', 'Strong')")
+    conn.commit()
+
+def _stored(conn):
+    return conn.execute("SELECT variant_number, generated_text FROM prompt_outputs WHERE prompt_id = 4 "
+                        "ORDER BY variant_number").fetchall()
+
+def test_failed_variants_keep_stored_ones(voter_db, monkeypatch):
+    _seed(voter_db)
+    monkeypatch.setattr(prompt_4, "call_llama_n", lambda *a, **k: ["one", "two", "three"])
+    assert prompt_4.run({"constituency_name": "Hebbal"})["ok"]
+    assert _stored(voter_db) == [(1, "one"), (2, "two"), (3, "three")]
+
+    monkeypatch.setattr(prompt_4, "call_llama_n", lambda *a, **k: ["new", "[LLM ERROR] timed out", "newer"])
+    result = prompt_4.run({"constituency_name": "Hebbal"})
+    assert not result["ok"] and "timed out" in result["message"]
+    assert _stored(voter_db) == [(1, "one"), (2, "two"), (3, "three")]
+
+def test_identity_tags_reach_the_prompt(voter_db, monkeypatch):
+    _seed(voter_db)
+    prompts = []
+    monkeypatch.setattr(prompt_4, "call_llama_n", lambda prompt, **k: prompts.append(prompt) or ["a", "b", "c"])
+    prompt_4.run({"constituency_name": "Hebbal", "use_identity_tags": "n"})
+    prompt_4.run({"constituency_name": "Hebbal", "use_identity_tags": "y"})
+    assert "Vokkaliga" not in prompts[0]
+    assert "Vokkaliga, Hindu" in prompts[1]
+
+def test_finalize_does_not_retrieve(voter_db, monkeypatch):
+    _seed(voter_db)
+    monkeypatch.setattr(prompt_4, "call_llama_n", lambda *a, **k: ["one", "two", "three"])
+    searches = []
+    monkeypatch.setattr(prompt_4, "retrieve", lambda *args: searches.append(args) or [])
+    prompt_4.run({"constituency_name": "Hebbal"})
+    assert searches == [("KA-158", "development", prompt_4.GROUNDING_K)]
+
+    assert prompt_4.run({"constituency_name": "Hebbal", "variant_choice": "2"})["text"] == "two"
+    assert len(searches) == 1
@@ -0,0 +1,55 @@
+import sys
+import threading
+
+import pytest
+
+import prompt_registry
+
+@pytest.fixture
+def runners(monkeypatch):
+    # run_prompt wraps sys.stdout once per process; undo it after the test
+    monkeypatch.setattr(sys, "stdout", sys.stdout)
+    table = {}
+    monkeypatch.setattr(prompt_registry, "get_runner", lambda prompt_id: table.get(prompt_id))
+    return table
+
+def test_concurrent_runs_capture_only_their_own_output(runners):
+    both_started = threading.Barrier(2)
+    def runner(params):
+        print(f"start {params['name']}")
+        both_started.wait(timeout=5)
+        print(f"end {params['name']}")
+        return {"text": params["name"]}
+    runners[1] = runner
+
+    results = {}
+    threads = [threading.Thread(target=lambda name=name: results.__setitem__(name, prompt_registry.run_prompt(1, {"name": name})))
+               for name in ("a", "b")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for name in ("a", "b"):
+        assert results[name]["ok"] and results[name]["text"] == name
+        assert results[name]["log"] == f"start {name}\nend {name}\n"
+
+def test_failed_run_keeps_its_log(runners, capsys):
+    def runner(params):
+        print("loading candidates")
+        raise ValueError("no such constituency")
+    runners[2] = runner
+
+    result = prompt_registry.run_prompt(2, {})
+    assert not result["ok"] and "no such constituency" in result["message"]
+    assert result["log"] == "loading candidates\n"
+    # Output outside a run still reaches the real stdout
+    print("after the run")
+    assert "after the run" in capsys.readouterr().out
+
+def test_cancellation_propagates(runners):
+    def runner(params):
+        raise prompt_registry.PromptCancelled("stopped")
+    runners[3] = runner
+    with pytest.raises(prompt_registry.PromptCancelled):
+        prompt_registry.run_prompt(3, {})
@@ -0,0 +1,74 @@
+import sqlite3
+
+import common
+import migrate
+import retriever
+
+def _seed(conn):
+    conn.executemany("INSERT INTO social_posts (voter_id, constituency, text, issue, hashtags) VALUES (?, ?, ?, ?, ?)", [
+        ("V1", "Hebbal", "No water in our taps for a week", "water", "#water"),
+        ("V2", "Hebbal", "Potholes everywhere on the main road", "roads", "#roads"),
+        ("V3", "Hebbal", None, "water", "#water #tanker"),
+        ("V4", "Yelahanka", "Water tankers never come here", "water", "#water"),
+    ])
+    conn.execute("INSERT INTO campaign_quotes (constituency, quote) VALUES ('Hebbal', 'We will fix the water supply')")
+    conn.commit()
+    migrate.migrate(conn)
+
+def test_retrieve_returns_original_text(voter_db):
+    _seed(voter_db)
+    texts = [doc["text"] for doc in retriever.retrieve("Hebbal", "water", 5)]
+    # As written (no issue/hashtags appended); the post without text of its
+    # own isn't a voice; other constituencies aren't searched
+    assert sorted(texts) == ["No water in our taps for a week", "We will fix the water supply"]
+
+def test_retrieve_does_not_sync(voter_db):
+    _seed(voter_db)
+    voter_db.execute("INSERT INTO social_posts (voter_id, constituency, text, issue) VALUES ('V5', 'Hebbal', 'Water again', 'water')")
+    voter_db.commit()
+
+    blocker = sqlite3.connect(common.DB_PATH, timeout=0)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        texts = [doc["text"] for doc in retriever.retrieve("Hebbal", "water", 5)]
+    finally:
+        blocker.rollback()
+        blocker.close()
+    assert "Water again" not in texts
+    assert retriever.pending() == 1
+
+    assert retriever.sync(voter_db) == 1
+    assert "Water again" in [doc["text"] for doc in retriever.retrieve("Hebbal", "water", 5)]
+
+def test_sync_follows_updates_and_deletes(voter_db):
+    _seed(voter_db)
+    voter_db.execute("UPDATE social_posts SET text = 'Roads are fine now' WHERE voter_id = 'V2'")
+    voter_db.execute("DELETE FROM campaign_quotes")
+    voter_db.commit()
+    assert retriever.sync(voter_db) == 2
+
+    texts = [doc["text"] for doc in retriever.retrieve("Hebbal", "roads", 5)]
+    assert "Roads are fine now" in texts
+    assert "Potholes everywhere on the main road" not in texts
+    assert "We will fix the water supply" not in [doc["text"] for doc in retriever.retrieve("Hebbal", "water", 5)]
+    docs, total = voter_db.execute("SELECT docs, total_length FROM context_stats WHERE constituency_key = 'hebbal'").fetchone()
+    assert docs == 2 and total > 0
+
+def test_documents_are_keyed_by_constituency_code(voter_db):
+    voter_db.executemany("INSERT INTO constituencies VALUES (?, ?)", [("KA-158", "Hebbal"), ("KA-152", "Yelahanka")])
+    _seed(voter_db)
+    keys = {r[0] for r in voter_db.execute("SELECT constituency_key FROM context_docs")}
+    assert keys == {"KA-158", "KA-152"}
+    by_code = [doc["text"] for doc in retriever.retrieve("KA-158", "water", 5)]
+    assert sorted(by_code) == ["No water in our taps for a week", "We will fix the water supply"]
+    assert [doc["text"] for doc in retriever.retrieve("hebbal", "water", 5)] == by_code
+
+def test_index_keyed_by_name_is_rebuilt(voter_db):
+    voter_db.execute("INSERT INTO constituencies VALUES ('KA-158', 'Hebbal')")
+    _seed(voter_db)
+    # An index from before the code keys
+    voter_db.execute("UPDATE context_docs SET constituency_key = LOWER(constituency_key)")
+    voter_db.execute("DELETE FROM context_index_meta WHERE name = 'key_scheme'")
+    voter_db.commit()
+    retriever.sync(voter_db)
+    assert "KA-158" in {r[0] for r in voter_db.execute("SELECT constituency_key FROM context_docs")}
@@ -0,0 +1,61 @@
+import migrate
+import prompt_4
+import prompt_6
+import rollups
+
+def _seed(conn):
+    conn.executemany("INSERT INTO constituencies VALUES (?, ?)", [("KA-158", "Hebbal"), ("KA-187", "Mandya")])
+    conn.execute("INSERT INTO candidates (candidate_id, name, constituency, actual_party, is_opponent) "
+                 "VALUES (1, 'A. Kumar', 'Hebbal', 'Party X', 0)")
+    conn.commit()
+    migrate.migrate(conn)
+    conn.executemany(
+        "INSERT INTO social_posts (voter_id, constituency, issue, sentiment_score) VALUES (?, ?, ?, ?)",
+        [("v1", "Hebbal", "water", 0.5), ("v2", "hebbal", "water", -0.2),
+         ("v3", "Hebbal", "jobs", 0.1), ("v4", "Mandya", "roads", 0.3)],
+    )
+    conn.commit()
+
+def test_post_rollups_are_keyed_by_code(voter_db):
+    _seed(voter_db)
+    rows = voter_db.execute(f"SELECT constituency, issue, post_count FROM {rollups.issue_source(voter_db)} "
+                            "ORDER BY constituency, post_count DESC").fetchall()
+    assert rows == [("KA-158", "water", 2), ("KA-158", "jobs", 1), ("KA-187", "roads", 1)]
+    pos, neg = voter_db.execute(f"SELECT positive_pct, negative_pct FROM {rollups.sentiment_source(voter_db)} "
+                                "WHERE constituency = 'KA-158'").fetchone()
+    assert (round(pos, 3), round(neg, 3)) == (0.667, 0.333)
+
+def test_readers_follow_post_changes(voter_db):
+    _seed(voter_db)
+    assert prompt_6.load_context("KA-158")["top_issues"] == ["water", "jobs"]
+    voter_db.execute("UPDATE social_posts SET issue = 'jobs' WHERE voter_id IN ('v1', 'v2')")
+    voter_db.execute("DELETE FROM social_posts WHERE voter_id = 'v4'")
+    voter_db.commit()
+    assert prompt_6.load_context("KA-158")["top_issues"] == ["jobs"]
+    assert all(n == 0 for n in rollups.check(voter_db).values())
+
+def test_readers_fall_back_to_aggregate_tables(voter_db):
+    assert rollups.issue_source(voter_db) == "constituency_issue_sentiment"
+    assert rollups.sentiment_source(voter_db) == "constituency_sentiment"
+
+def test_rollups_keep_reader_output(voter_db):
+    voter_db.executemany("INSERT INTO constituencies VALUES (?, ?)", [("KA-158", "Hebbal"), ("KA-187", "Mandya")])
+    voter_db.executemany("INSERT INTO candidates (candidate_id, name, constituency, actual_party, is_opponent) VALUES (?, ?, ?, ?, 0)",
+                         [(1, "A. Kumar", "Hebbal", "Party X"), (2, "B. Gowda", "Mandya", "Party Y")])
+    # Hebbal: precomputed aggregates that agree with its posts; Mandya: aggregates only, no posts
+    voter_db.executemany("INSERT INTO social_posts (voter_id, constituency, issue, sentiment_score) VALUES (?, ?, ?, ?)",
+                         [("v1", "Hebbal", "water", 0.5), ("v2", "Hebbal", "water", -0.2), ("v3", "Hebbal", "jobs", 0.1)])
+    voter_db.executemany("INSERT INTO constituency_sentiment VALUES (?, ?, ?, ?)",
+                         [("KA-158", 0.4 / 3, 2 / 3, 1 / 3), ("KA-187", -0.25, 0.2, 0.7)])
+    voter_db.executemany("INSERT INTO constituency_issue_sentiment VALUES (?, ?, ?)",
+                         [("KA-158", "water", 2), ("KA-158", "jobs", 1), ("KA-187", "farming", 9), ("KA-187", "roads", 4)])
+    voter_db.commit()
+
+    def outputs():
+        return [(prompt_4.load_context(code), prompt_6.load_context(code)) for code in ("KA-158", "KA-187")]
+
+    before = outputs()
+    migrate.migrate(voter_db)
+    assert rollups.issue_source(voter_db) != "constituency_issue_sentiment"
+    assert outputs() == before
+    assert before[1][1]["top_issues"] == ["farming", "roads"]
@@ -0,0 +1,88 @@
+import json
+import math
+
+import pytest
+
+import slogan_index
+
+POOL = [
+    {"text": "Clean water for every village", "issue": "water"},
+    {"text": "Clean water for every single village", "issue": "water"},
+    {"text": "Clean water for each village", "issue": "water"},
+    {"text": "Jobs at home, not in distant cities", "issue": "jobs"},
+    {"text": "Good roads lead to good futures", "issue": "roads"},
+    {"text": "Every child in a classroom", "issue": "education"},
+    {"text": "Safe streets for our daughters", "issue": "safety"},
+    "Clean water for every village",
+    "",
+]
+
+@pytest.fixture
+def index():
+    return slogan_index.SloganIndex(POOL)
+
+def _cluster_of(index, text):
+    return index.leader_of[index.texts.index(text)]
+
+def test_near_duplicates_share_a_cluster(index):
+    assert index.exact_duplicates == 1
+    water = {_cluster_of(index, t["text"]) for t in POOL[:3]}
+    assert len(water) == 1
+    assert _cluster_of(index, "Jobs at home, not in distant cities") not in water
+    assert len(index.representatives) == 5
+
+def test_select_returns_distinct_clusters(index):
+    for count in range(1, len(index.representatives) + 1):
+        picks = index.select(count, query="water", seed=7)
+        assert len(picks) == count
+        assert len({_cluster_of(index, p) for p in picks}) == count
+
+def test_select_prefers_matching_slogans(index):
+    assert index.select(1, query="jobs", seed=1) == ["Jobs at home, not in distant cities"]
+    assert _cluster_of(index, index.select(1, query="water", seed=1)[0]) == 0
+
+def test_same_seed_same_picks(index):
+    assert index.select(4, query="water roads", seed="Hebbal") == index.select(4, query="water roads", seed="Hebbal")
+    assert index.select(3, seed=42) == slogan_index.SloganIndex(POOL).select(3, seed=42)
+
+def test_compiled_index_round_trips(tmp_path):
+    pool = tmp_path / "slogan_pool.json"
+    pool.write_text(json.dumps(POOL), encoding="utf-8")
+    built = slogan_index.compile_index(str(pool))
+    loaded = slogan_index._load_compiled(str(pool), slogan_index._stamp(str(pool)))
+    assert loaded is not None
+    assert loaded.select(3, query="water", seed=5) == built.select(3, query="water", seed=5)
+    assert loaded.near_duplicates("Clean water for every village") == built.near_duplicates("Clean water for every village")
+
+RANKED_POOL = [
+    {"text": "Water in every tap", "issue": "water"},
+    {"text": "Water today, water tomorrow, water for every home", "issue": "water"},
+    {"text": "Fix the roads before the water pipes", "issue": "roads"},
+    {"text": "A farmer's pride", "issue": "water"},
+    {"text": "Jobs for our youth", "issue": "jobs"},
+]
+
+def test_bm25_score_matches_formula():
+    index = slogan_index.SloganIndex(RANKED_POOL)
+    # "Water in every tap" + issue "water": text tf 1 plus the boosted field
+    tf = 1 + slogan_index.FIELD_BOOST
+    df = len(index.postings["water"])
+    idf = math.log(1 + (len(index.texts) - df + 0.5) / (df + 0.5))
+    k1, b = slogan_index.BM25_K1, slogan_index.BM25_B
+    expected = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * index.lengths[0] / index.avg_length))
+    assert index.scores("water")[0] == pytest.approx(expected)
+
+def test_issue_field_outranks_a_passing_mention():
+    ranked = [text for text, _ in slogan_index.SloganIndex(RANKED_POOL).search("water")]
+    # Tagged with the issue but never saying it beats saying it under another issue
+    assert ranked.index("A farmer's pride") < ranked.index("Fix the roads before the water pipes")
+    assert ranked[-1] == "Fix the roads before the water pipes"
+    assert "Jobs for our youth" not in ranked
+
+def test_rare_terms_and_weights_steer_the_ranking():
+    index = slogan_index.SloganIndex(RANKED_POOL)
+    # "jobs" is rarer than "water", so it wins an unweighted two-issue query
+    assert index.search("water jobs", limit=1)[0][0] == "Jobs for our youth"
+    assert index.search({"water": 5.0, "jobs": 1.0}, limit=1)[0][0] != "Jobs for our youth"
+    assert index.search({"roads": 3.0, "water": 1.0}, limit=1)[0][0] == "Fix the roads before the water pipes"
+    assert index.search("metro") == []
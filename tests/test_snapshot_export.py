@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+import snapshot_export
+
+pa = pytest.importorskip("pyarrow")
+
+@pytest.fixture
+def snapshots(voter_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot_export, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    # Several fetch batches per partition, each with categories the earlier ones lacked
+    monkeypatch.setattr(snapshot_export, "FETCH_ROWS", 2)
+    rows = [(f"V{i}", "Hebbal", f"B{i}", ("yes", "no", "maybe")[i % 3], i) for i in range(7)]
+    rows.append(("V7", "Mandya", None, None, 7))
+    voter_db.executemany("INSERT INTO voter_enriched_demo (voter_id, constituency, booth_location, "
+                         "political_inclination, followers_estimated) VALUES (?, ?, ?, ?, ?)", rows)
+    voter_db.commit()
+    return rows
+
+@pytest.mark.parametrize("fmt", ["arrow", "parquet"])
+def test_partition_larger_than_fetch_batch_round_trips(snapshots, fmt):
+    manifest = snapshot_export.export_table("voter_enriched_demo", fmt=fmt)
+    assert manifest["partitions"]["hebbal"]["rows"] == 7
+
+    data = snapshot_export.open_snapshot("voter_enriched_demo", constituencies=["Hebbal"])
+    assert pa.types.is_dictionary(data.schema.field("booth_location").type)
+    assert data.column("booth_location").to_pylist() == [f"B{i}" for i in range(7)]
+    assert data.column("political_inclination").to_pylist() == [r[3] for r in snapshots[:7]]
+
+def test_only_dirty_partitions_are_rewritten(snapshots, voter_db):
+    import migrate
+    migrate.migrate(voter_db)
+    first = snapshot_export.export_table("voter_enriched_demo")
+    voter_db.execute("UPDATE voter_enriched_demo SET booth_location = 'B9' WHERE voter_id = 'V7'")
+    voter_db.commit()
+    second = snapshot_export.export_table("voter_enriched_demo")
+    assert second["partitions"]["hebbal"] == first["partitions"]["hebbal"]
+    assert second["partitions"]["mandya"] != first["partitions"]["mandya"]
+    data = snapshot_export.open_snapshot("voter_enriched_demo", columns=["booth_location"], constituencies=["mandya"])
+    assert data.column("booth_location").to_pylist() == ["B9"]
+
+def test_mixed_type_column_is_widened_to_text(voter_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot_export, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    # SQLite keeps 'N/A' and 2.5 in an INTEGER column as written
+    voter_db.executemany("INSERT INTO voter_enriched_demo (voter_id, constituency, followers_estimated) VALUES (?, ?, ?)",
+                         [("V1", "Hebbal", 1), ("V2", "Hebbal", "N/A"), ("V3", "Hebbal", None), ("V4", "Mandya", 2.5),
+                          ("V5", "Mandya", 3)])
+    voter_db.commit()
+    snapshot_export.export_table("voter_enriched_demo")
+
+    hebbal = snapshot_export.open_snapshot("voter_enriched_demo", columns=["followers_estimated"], constituencies=["hebbal"])
+    assert hebbal.schema.field("followers_estimated").type == pa.string()
+    assert hebbal.column("followers_estimated").to_pylist() == ["1", "N/A", None]
+    mandya = snapshot_export.open_snapshot("voter_enriched_demo", columns=["followers_estimated"], constituencies=["mandya"])
+    assert mandya.column("followers_estimated").to_pylist() == [2.5, 3.0]
+
+def test_blob_mixed_with_text_names_the_column(voter_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot_export, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    voter_db.executemany("INSERT INTO voter_enriched_demo (voter_id, constituency, name) VALUES (?, ?, ?)",
+                         [("V1", "Hebbal", b"\x00"), ("V2", "Hebbal", "Asha")])
+    voter_db.commit()
+    with pytest.raises(ValueError, match=r"voter_enriched_demo\.name .*'Asha'"):
+        snapshot_export.export_table("voter_enriched_demo")
+
+def test_partition_dirs_stay_inside_the_layout(voter_db, tmp_path, monkeypatch):
+    root = tmp_path / "snapshots"
+    monkeypatch.setattr(snapshot_export, "SNAPSHOT_DIR", str(root))
+    names = ["../../escape", "a/b", "_null", "", None, "Hebbal"]
+    voter_db.executemany("INSERT INTO voter_enriched_demo (voter_id, constituency) VALUES (?, ?)",
+                         [(f"V{i}", name) for i, name in enumerate(names)])
+    voter_db.commit()
+    manifest = snapshot_export.export_table("voter_enriched_demo")
+
+    parts = root / "voter_enriched_demo" / "parts"
+    dirs = {p["file"].split(os.sep)[1] for p in manifest["partitions"].values()}
+    assert len(dirs) == len(manifest["partitions"]) == 5
+    assert sorted(os.listdir(parts)) == sorted(dirs)
+    assert not (tmp_path / "escape").exists()
+    assert manifest["partitions"][""]["rows"] == 2   # NULL and ''
+    data = snapshot_export.open_snapshot("voter_enriched_demo", columns=["voter_id"], constituencies=["a/b"])
+    assert data.column("voter_id").to_pylist() == ["V1"]